@@ -5,14 +5,64 @@ from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from contextlib import asynccontextmanager
+from datetime import datetime
+import asyncio
 import time
 
 from api.routers import chat, documents, system
+from api.services.vector_service import VectorService
+from api.services.cache_service import CacheService
+from api.services.request_coalescer import RequestCoalescer
+from api.services.unified_llm_service import UnifiedLLMService
 from api.utils.logger import setup_logger
+from config import config
 
 # 配置日志
 logger = setup_logger()
 
+async def warmup_retrieval(app: FastAPI) -> bool:
+    """预热嵌入模型与向量库，结果写入 app.state.readiness"""
+    readiness = app.state.readiness
+    try:
+        start = time.time()
+        # 模型加载耗时较长，放到线程中执行
+        vector_service = await asyncio.to_thread(VectorService)
+        hits = await vector_service.warmup()
+        readiness["checks"]["retrieval"] = {
+            "ready": True,
+            "hits": hits,
+            "elapsed": time.time() - start
+        }
+        readiness["warmed_up_at"] = datetime.now().isoformat()
+        logger.info(f"检索服务预热完成，耗时: {time.time() - start:.2f}s")
+        return True
+    except Exception as e:
+        readiness["checks"]["retrieval"] = {"ready": False, "error": str(e)}
+        logger.error(f"检索服务预热失败: {e}")
+        return False
+
+async def retry_warmup(app: FastAPI):
+    """检索预热失败后在后台定期重试，直到成功"""
+    while True:
+        await asyncio.sleep(config.WARMUP_RETRY_INTERVAL)
+        if await warmup_retrieval(app):
+            return
+
+async def warmup_services(app: FastAPI):
+    """预热检索服务并探测LLM后端
+
+    检索预热失败时在后台重试；LLM后端的可用性由后台探测持续更新，
+    就绪检查（/api/v1/system/ready）实时读取，不在此处固化。
+    """
+    if not await warmup_retrieval(app):
+        app.state.warmup_task = asyncio.create_task(retry_warmup(app))
+
+    try:
+        health = await UnifiedLLMService().check_backends()
+        logger.info(f"LLM后端健康状态: {health}")
+    except Exception as e:
+        logger.error(f"LLM后端探测失败: {e}")
+
 # 应用生命周期管理
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -20,12 +70,37 @@ async def lifespan(app: FastAPI):
     # 启动时
     logger.info("应用启动中...")
     
-    # 初始化服务等...
+    # 应用级缓存服务：共享异步Redis连接池，后台探测可用性
+    app.state.cache_service = CacheService()
+    await app.state.cache_service.start()
+    
+    # 相同问题的并发请求合并
+    app.state.coalescer = RequestCoalescer(
+        app.state.cache_service,
+        lock_ttl=config.COALESCE_LOCK_TTL,
+        poll_interval=config.COALESCE_POLL_INTERVAL,
+        wait_timeout=config.COALESCE_WAIT_TIMEOUT
+    )
+    
+    # LLM后端共享连接会话
+    await UnifiedLLMService().start()
+    
+    # 预热服务，避免首个请求承担模型加载
+    app.state.readiness = {"checks": {}, "warmed_up_at": None}
+    app.state.warmup_task = None
+    await warmup_services(app)
     
     yield
     
     # 关闭时
     logger.info("应用关闭中...")
+    if app.state.warmup_task is not None:
+        app.state.warmup_task.cancel()
+        await asyncio.gather(app.state.warmup_task, return_exceptions=True)
+    await app.state.cache_service.close()
+    await UnifiedLLMService().close()
+    if VectorService._instance is not None and VectorService._instance._initialized:
+        VectorService._instance.close()
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -82,7 +157,7 @@ async def log_requests(request: Request, call_next):
     start_time = time.time()
     
     # 跳过健康检查的详细日志
-    if request.url.path == "/api/v1/system/health":
+    if request.url.path in ("/api/v1/system/health", "/api/v1/system/ready"):
         response = await call_next(request)
         return response
     
@@ -11,6 +11,10 @@ class ChatRequest(BaseModel):
     stream: Optional[bool] = Field(False, description="是否流式输出")
     session_id: Optional[str] = Field(None, description="会话ID")
     use_cache: Optional[bool] = Field(True, description="是否使用缓存")
+    rerank: Optional[bool] = Field(None, description="是否重排序，默认跟随服务配置")
+    rerank_candidates: Optional[int] = Field(None, ge=1, le=100, description="重排序前召回的候选数量")
+    rerank_budget_ms: Optional[float] = Field(None, ge=0, description="重排序时间预算（毫秒），0表示不限制")
+    max_context_tokens: Optional[int] = Field(None, ge=0, le=32000, description="参考信息token预算，默认跟随服务配置")
 
 class ChatResponse(BaseModel):
     """聊天响应"""
@@ -27,6 +31,8 @@ class DocumentSearchRequest(BaseModel):
     top_k: int = Field(5, ge=1, le=50, description="返回结果数量")
     filter_by_source: Optional[str] = Field(None, description="按来源过滤")
     filter_by_type: Optional[str] = Field(None, description="按文件类型过滤")
+    nprobe: Optional[int] = Field(None, ge=1, le=4096, description="近似索引探测的倒排列表数（仅IVF-PQ生效）")
+    shortlist: Optional[int] = Field(None, ge=1, le=10000, description="近似索引精确重排的候选数（仅IVF-PQ生效）")
 
 class DocumentSearchResponse(BaseModel):
     """文档搜索响应"""
@@ -35,6 +41,22 @@ class DocumentSearchResponse(BaseModel):
     query: str = Field(..., description="原始查询")
     processing_time: float = Field(..., description="处理时间")
 
+class DocumentBatchSearchRequest(BaseModel):
+    """批量文档搜索请求"""
+    queries: List[DocumentSearchRequest] = Field(..., min_length=1, max_length=64, description="搜索查询列表")
+
+class DocumentBatchSearchItem(BaseModel):
+    """批量搜索中单个查询的结果"""
+    results: List[Dict[str, Any]] = Field(..., description="搜索结果")
+    total: int = Field(..., description="总结果数")
+    query: str = Field(..., description="原始查询")
+
+class DocumentBatchSearchResponse(BaseModel):
+    """批量文档搜索响应"""
+    items: List[DocumentBatchSearchItem] = Field(..., description="各查询结果，与请求顺序一致")
+    total_queries: int = Field(..., description="查询数量")
+    processing_time: float = Field(..., description="处理时间")
+
 class SystemHealthResponse(BaseModel):
     """系统健康状态响应"""
     status: str = Field(..., description="状态: healthy/unhealthy")
@@ -1,14 +1,21 @@
 # api/routers/chat.py
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request
 from fastapi.responses import StreamingResponse
+import asyncio
 import time
 import uuid
-import json
 
 from api.models import ChatRequest, ChatResponse
 from api.services.vector_service import VectorService
-from api.services.unified_llm_service import UnifiedLLMService
+from api.services.unified_llm_service import UnifiedLLMService, LLMBackend
+from api.services.backend_limiter import BackendBusyError
 from api.services.cache_service import CacheService
+from api.services.context_packer import pack_context, PackedContext
+from api.services.request_coalescer import RequestCoalescer, Flight
+from api.services.stream_relay import coalesce_chunks
+from api.utils.executor import ExecutorQueueFullError
+from api.utils.json_codec import get_json_codec
+from config import config
 
 router = APIRouter(prefix="/api/v1/chat", tags=["chat"])
 
@@ -19,15 +26,156 @@ def get_vector_service():
 def get_llm_service():
     return UnifiedLLMService()
 
-def get_cache_service():
-    return CacheService()
+def get_cache_service(request: Request) -> CacheService:
+    return request.app.state.cache_service
 
-def build_context_from_results(search_results, max_sources: int = 3) -> str:
-    """从检索结果构建上下文的辅助函数"""
-    context_parts = []
-    for i, result in enumerate(search_results[:max_sources]):
-        context_parts.append(f"[来源{i+1}] {result['text']}")
-    return "\n\n".join(context_parts)
+def get_coalescer(request: Request) -> RequestCoalescer:
+    return request.app.state.coalescer
+
+NO_CONTEXT_ANSWER = "抱歉,在知识库中没有找到相关信息。"
+
+json_codec = get_json_codec(config.JSON_CODEC)
+
+def sse_event(data) -> str:
+    """格式化为SSE事件"""
+    return f"data: {json_codec.dumps(data)}\n\n"
+
+def busy_exception(error: BackendBusyError) -> HTTPException:
+    """LLM后端排队已满：返回503并通过 Retry-After 告知客户端重试时间"""
+    return HTTPException(
+        status_code=503,
+        detail=f"LLM服务繁忙，请稍后重试: {str(error)}",
+        headers={"Retry-After": str(int(error.retry_after))}
+    )
+
+def backend_info(llm_service: UnifiedLLMService, backend: LLMBackend):
+    """后端名称与模型，写入SSE初始事件与回答缓存"""
+    return {"backend": backend.value, "model": llm_service.configs[backend]["model"]}
+
+def build_context_from_results(request: ChatRequest, search_results) -> PackedContext:
+    """在token预算内打包检索结果：合并相邻文本块、去除重叠，按得分顺序填充"""
+    token_budget = config.CONTEXT_TOKEN_BUDGET if request.max_context_tokens is None else request.max_context_tokens
+    return pack_context(
+        search_results,
+        token_budget=token_budget,
+        max_overlap=config.CHUNK_OVERLAP,
+        min_truncated_tokens=config.CONTEXT_MIN_TRUNCATED_TOKENS
+    )
+
+async def retrieve_sources(request: ChatRequest, vector_service: VectorService):
+    """检索参考来源：启用重排序时先多召回候选，再由交叉编码器保留 top_k 个"""
+    rerank = vector_service.reranker is not None and request.rerank is not False
+    if not rerank:
+        return await vector_service.asearch(query=request.question, top_k=request.top_k)
+
+    candidates = max(request.top_k, request.rerank_candidates or config.RERANK_CANDIDATES)
+    budget_ms = config.RERANK_BUDGET_MS if request.rerank_budget_ms is None else request.rerank_budget_ms
+    search_results = await vector_service.asearch(query=request.question, top_k=candidates)
+    return await vector_service.arerank(request.question, search_results, request.top_k, budget_ms or None)
+
+async def lookup_cached_answer(
+    request: ChatRequest,
+    vector_service: VectorService,
+    cache_service: CacheService
+):
+    """查找缓存的回答，返回 (回答, 缓存信息)；先按问题精确匹配，再查语义缓存"""
+    cached_answer = await cache_service.get_cached_answer(request.question)
+    if cached_answer:
+        return cached_answer, None
+
+    # 语义缓存：问题向量与检索共用查询向量缓存，不增加编码开销
+    if cache_service.semantic_cache is not None:
+        question_embedding = await vector_service.aencode_query(request.question)
+        similar = cache_service.get_similar_answer(question_embedding)
+        if similar is not None:
+            cached_answer, similarity = similar
+            return cached_answer, {
+                "cache": "semantic",
+                "similarity": similarity,
+                "cached_question": cached_answer.get("question")
+            }
+    return None
+
+async def store_answer(
+    request: ChatRequest,
+    answer: str,
+    sources,
+    served,
+    vector_service: VectorService,
+    cache_service: CacheService
+):
+    """写入回答缓存（含实际提供回答的后端与模型）；启用语义缓存时一并写入问题向量（检索时已编码，命中查询向量缓存）"""
+    embedding = None
+    if cache_service.semantic_cache is not None:
+        embedding = await vector_service.aencode_query(request.question)
+    await cache_service.cache_answer(
+        request.question,
+        {
+            "answer": answer,
+            "sources": sources,
+            "question": request.question,
+            **(served or {})
+        },
+        embedding=embedding
+    )
+
+async def generate_answer(
+    request: ChatRequest,
+    vector_service: VectorService,
+    llm_service: UnifiedLLMService
+):
+    """检索、构建上下文并调用LLM（非流式），没有相关内容时 answer 为 None"""
+    # 向量检索（启用时经交叉编码器重排序）
+    search_results = await retrieve_sources(request, vector_service)
+    
+    # 构建上下文
+    packed = build_context_from_results(request, search_results)
+    context = packed.context
+    search_results = packed.sources
+    
+    if not context.strip():
+        return {"answer": None, "sources": [], "usage": None}
+    
+    # 构建消息并调用LLM (统一使用generate方法)
+    messages = llm_service.build_rag_messages(
+        question=request.question,
+        context=context
+    )
+    
+    # 收集完整响应 (非流式)
+    response_content = ""
+    served = {}
+    async for chunk in llm_service.generate(
+        messages=messages,
+        temperature=request.temperature,
+        stream=False,
+        on_backend=lambda backend: served.update(backend_info(llm_service, backend))
+    ):
+        response_content += chunk
+    
+    return {
+        "answer": response_content,
+        "sources": search_results,
+        "served": served,
+        "usage": {
+            "context_tokens": packed.tokens,
+            "context_passages": packed.passages,
+            "context_truncated": packed.truncated
+        }
+    }
+
+COALESCE_OPTIONS = (
+    "top_k",
+    "temperature",
+    "rerank",
+    "rerank_candidates",
+    "rerank_budget_ms",
+    "max_context_tokens"
+)
+
+def coalesce_options(request: ChatRequest):
+    """影响回答内容的请求参数：只有这些参数都相同的并发请求才共享一次生成"""
+    return {name: getattr(request, name) for name in COALESCE_OPTIONS}
 
 @router.post("", response_model=ChatResponse)
 async def chat(
@@ -35,7 +183,8 @@ async def chat(
     background_tasks: BackgroundTasks,
     vector_service: VectorService = Depends(get_vector_service),
     llm_service: UnifiedLLMService = Depends(get_llm_service),
-    cache_service: CacheService = Depends(get_cache_service)
+    cache_service: CacheService = Depends(get_cache_service),
+    coalescer: RequestCoalescer = Depends(get_coalescer)
 ):
     """问答接口"""
     
@@ -45,156 +194,307 @@ async def chat(
     try:
         # 1. 检查缓存
         if request.use_cache:
-            cached_answer = cache_service.get_cached_answer(request.question)
-            if cached_answer:
+            hit = await lookup_cached_answer(request, vector_service, cache_service)
+            if hit is not None:
+                cached_answer, cache_usage = hit
                 return ChatResponse(
                     answer=cached_answer["answer"],
                     sources=cached_answer.get("sources", []),
                     cached=True,
+                    usage=cache_usage,
                     processing_time=time.time() - start_time,
                     request_id=request_id
                 )
         
-        # 2. 向量检索
-        search_results = vector_service.search(
-            query=request.question,
-            top_k=request.top_k
-        )
-        
-        # 3. 构建上下文
-        context = build_context_from_results(search_results, max_sources=request.top_k)
+        # 2. 检索并生成回答
+        if request.use_cache and config.COALESCE_ENABLED:
+            # 相同问题的并发请求共享一次检索与生成，生成后写入缓存再释放跨进程锁
+            async def produce(flight: Flight):
+                result = await generate_answer(request, vector_service, llm_service)
+                await flight.publish(result)
+                if result["answer"] is not None:
+                    await store_answer(
+                        request, result["answer"], result["sources"], result["served"], vector_service, cache_service
+                    )
+
+            async def replay_cached(flight: Flight, cached_answer):
+                await flight.publish({
+                    "answer": cached_answer["answer"],
+                    "sources": cached_answer.get("sources", []),
+                    "usage": None
+                })
+
+            flight, leader = coalescer.join(
+                request.question, "chat", produce, replay_cached, coalesce_options(request)
+            )
+            result = await flight.first()
+            cached = flight.source == "remote"
+            usage = result["usage"]
+            if not leader and usage is not None:
+                usage = dict(usage, coalesced=True)
+        else:
+            result = await generate_answer(request, vector_service, llm_service)
+            cached = False
+            usage = result["usage"]
+
+            # 后台任务缓存
+            if request.use_cache and result["answer"] is not None:
+                background_tasks.add_task(
+                    store_answer,
+                    request,
+                    result["answer"],
+                    result["sources"],
+                    result["served"],
+                    vector_service,
+                    cache_service
+                )
         
-        if not context.strip():
+        if result["answer"] is None:
             return ChatResponse(
-                answer="抱歉,在知识库中没有找到相关信息。",
+                answer=NO_CONTEXT_ANSWER,
                 sources=[],
                 cached=False,
                 processing_time=time.time() - start_time,
                 request_id=request_id
             )
         
-        # 4. 构建消息并调用LLM (统一使用generate方法)
-        messages = llm_service.build_rag_messages(
-            question=request.question,
-            context=context
-        )
-        
-        # 收集完整响应 (非流式)
-        response_content = ""
-        async for chunk in llm_service.generate(
-            messages=messages,
-            temperature=request.temperature,
-            stream=False
-        ):
-            response_content += chunk
-        
-        # 5. 缓存结果
-        if request.use_cache:
-            answer_to_cache = {
-                "answer": response_content,
-                "sources": search_results,
-                "question": request.question
-            }
-            
-            # 后台任务缓存
-            background_tasks.add_task(
-                cache_service.cache_answer,
-                request.question,
-                answer_to_cache
-            )
-        
-        # 6. 返回响应
+        # 3. 返回响应
         processing_time = time.time() - start_time
         
         return ChatResponse(
-            answer=response_content,
-            sources=search_results,
-            cached=False,
+            answer=result["answer"],
+            sources=result["sources"],
+            cached=cached,
+            usage=usage,
             processing_time=processing_time,
             request_id=request_id
         )
         
     except HTTPException:
         raise
+    except BackendBusyError as e:
+        raise busy_exception(e)
+    except ExecutorQueueFullError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"检索服务繁忙，请稍后重试: {str(e)}"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"内部服务器错误: {str(e)}"
         )
 
+def stream_sources(search_results):
+    """流式输出的来源摘要"""
+    return [
+        {
+            "text": r["text"][:100] + "..." if len(r["text"]) > 100 else r["text"],
+            "score": r["score"],
+            "metadata": r["metadata"]
+        }
+        for r in search_results
+    ]
+
+async def produce_stream(
+    request: ChatRequest,
+    flight: Flight,
+    vector_service: VectorService,
+    llm_service: UnifiedLLMService
+):
+    """检索并流式生成，逐条发布SSE事件；返回 (回答, 来源, 实际后端信息)，没有相关内容时返回 None"""
+    # 1. 向量检索（启用时经交叉编码器重排序）
+    search_results = await retrieve_sources(request, vector_service)
+    
+    # 2. 构建上下文
+    packed = build_context_from_results(request, search_results)
+    context = packed.context
+    search_results = packed.sources
+    
+    if not context.strip():
+        await flight.publish(sse_event({'content': NO_CONTEXT_ANSWER, 'done': True}))
+        return None
+    
+    # 3. 构建消息
+    messages = llm_service.build_rag_messages(
+        question=request.question,
+        context=context
+    )
+
+    # 所有后端都已排满时在输出任何事件前失败，接口返回503
+    llm_service.check_capacity()
+
+    # 发送初始信息(包括来源和路由选中的后端信息)
+    await flight.publish(sse_event({
+        "sources": stream_sources(search_results),
+        **backend_info(llm_service, llm_service.preferred_backend())
+    }))
+
+    # 4. 流式生成回答 (统一使用generate方法)，短时间内到达的token合并为一个SSE事件
+    response_content = ""
+    served = {}
+    chunks = coalesce_chunks(
+        llm_service.generate(
+            messages=messages,
+            temperature=request.temperature,
+            stream=True,
+            on_backend=lambda backend: served.update(backend_info(llm_service, backend))
+        ),
+        window=config.STREAM_COALESCE_WINDOW_MS / 1000.0,
+        max_chars=config.STREAM_COALESCE_MAX_CHARS
+    )
+    async for chunk in chunks:
+        response_content += chunk
+        await flight.publish(sse_event({'content': chunk}))
+
+    # 结束标记
+    await flight.publish("data: [DONE]\n\n")
+    return response_content, search_results, served
+
+def cached_stream_events(cached_answer, llm_service: UnifiedLLMService, cache_usage=None):
+    """把缓存的回答转换为与实时生成相同格式的SSE事件
+
+    逐块回放（STREAM_REPLAY_MODE=paced）时按 STREAM_REPLAY_CHUNK_CHARS 切分内容，
+    一次性回放（burst）时内容作为单个事件输出。
+    后端与模型取自缓存中生成该回答的后端，旧缓存条目没有记录时使用当前首选后端。
+    """
+    if cached_answer.get("backend"):
+        served = {"backend": cached_answer["backend"], "model": cached_answer.get("model")}
+    else:
+        served = backend_info(llm_service, llm_service.preferred_backend())
+    initial_data = {
+        "sources": stream_sources(cached_answer.get("sources", [])),
+        **served,
+        "cached": True
+    }
+    if cache_usage:
+        initial_data.update(cache_usage)
+    events = [sse_event(initial_data)]
+
+    answer = cached_answer["answer"]
+    if config.STREAM_REPLAY_MODE == "paced":
+        size = max(1, config.STREAM_REPLAY_CHUNK_CHARS)
+        events.extend(sse_event({'content': answer[i:i + size]}) for i in range(0, len(answer), size))
+    else:
+        events.append(sse_event({'content': answer}))
+    events.append("data: [DONE]\n\n")
+    return events
+
+async def replay_events(events):
+    """输出缓存回放事件，paced 模式下内容事件之间按固定间隔发送"""
+    interval = config.STREAM_REPLAY_INTERVAL_MS / 1000.0 if config.STREAM_REPLAY_MODE == "paced" else 0
+    for index, event in enumerate(events):
+        if interval and 0 < index < len(events) - 1:
+            await asyncio.sleep(interval)
+        yield event
+
+async def replay_cached_stream(flight: Flight, cached_answer, llm_service: UnifiedLLMService):
+    """把其他工作进程生成的回答发布给订阅者（已等待过生成，不再按间隔回放）"""
+    for event in cached_stream_events(cached_answer, llm_service):
+        await flight.publish(event)
+
 @router.post("/stream")
 async def chat_stream(
     request: ChatRequest,
     vector_service: VectorService = Depends(get_vector_service),
-    llm_service: UnifiedLLMService = Depends(get_llm_service)
+    llm_service: UnifiedLLMService = Depends(get_llm_service),
+    cache_service: CacheService = Depends(get_cache_service),
+    coalescer: RequestCoalescer = Depends(get_coalescer)
 ):
     """流式问答接口"""
     
-    try:
-        # 1. 向量检索
-        search_results = vector_service.search(
-            query=request.question,
-            top_k=request.top_k
-        )
-        
-        # 2. 构建上下文
-        context = build_context_from_results(search_results, max_sources=request.top_k)
-        
-        if not context.strip():
-            async def no_context_stream():
-                yield f"data: {json.dumps({'content': '抱歉,在知识库中没有找到相关信息。', 'done': True})}\n\n"
-            return StreamingResponse(no_context_stream(), media_type="text/event-stream")
-        
-        # 3. 流式调用LLM (统一使用generate方法)
-        async def stream_generator():
-            # 构建消息
-            messages = llm_service.build_rag_messages(
-                question=request.question,
-                context=context
+    stream_headers = {
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "X-Accel-Buffering": "no"
+    }
+    
+    # 1. 检查缓存，命中时以SSE回放，不调用LLM
+    if request.use_cache:
+        try:
+            hit = await lookup_cached_answer(request, vector_service, cache_service)
+        except ExecutorQueueFullError as e:
+            raise HTTPException(
+                status_code=503,
+                detail=f"检索服务繁忙，请稍后重试: {str(e)}"
             )
+        except Exception:
+            # 缓存查找失败按未命中处理，检索阶段的错误由下面的流程返回
+            hit = None
+        if hit is not None:
+            cached_answer, cache_usage = hit
+            return StreamingResponse(
+                replay_events(cached_stream_events(cached_answer, llm_service, cache_usage)),
+                media_type="text/event-stream",
+                headers=stream_headers
+            )
+    
+    # 2. 检索并流式生成
+    shared = bool(request.use_cache and config.COALESCE_ENABLED)
+    
+    if shared:
+        # 相同问题的并发请求共享一次生成，事件分发给所有订阅者；完成后写入缓存
+        async def produce(flight: Flight):
+            generated = await produce_stream(request, flight, vector_service, llm_service)
+            if generated is not None:
+                answer, sources, served = generated
+                await store_answer(request, answer, sources, served, vector_service, cache_service)
 
-            # 发送初始信息(包括来源和后端信息)
-            initial_data = {
-                "sources": [
-                    {
-                        "text": r["text"][:100] + "..." if len(r["text"]) > 100 else r["text"],
-                        "score": r["score"],
-                        "metadata": r["metadata"]
-                    }
-                    for r in search_results
-                ],
-                "backend": llm_service.current_backend.value,
-                "model": llm_service.configs[llm_service.current_backend]["model"]
-            }
-            yield f"data: {json.dumps(initial_data)}\n\n"
-
-            # 流式生成回答
-            async for chunk in llm_service.generate(
-                messages=messages,
-                temperature=request.temperature,
-                stream=True
-            ):
-                yield f"data: {json.dumps({'content': chunk})}\n\n"
-
-            # 结束标记
-            yield "data: [DONE]\n\n"
-        
-        return StreamingResponse(
-            stream_generator(),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no"
-            }
+        async def replay_cached(flight: Flight, cached_answer):
+            await replay_cached_stream(flight, cached_answer, llm_service)
+
+        flight, _ = coalescer.join(
+            request.question, "stream", produce, replay_cached, coalesce_options(request)
         )
+    else:
+        async def produce(flight: Flight):
+            generated = await produce_stream(request, flight, vector_service, llm_service)
+            if generated is not None and request.use_cache:
+                answer, sources, served = generated
+                await store_answer(request, answer, sources, served, vector_service, cache_service)
+
+        flight = coalescer.run_alone(produce)
+    
+    events = flight.subscribe()
+    
+    try:
+        # 等待第一个事件：检索阶段的错误仍以HTTP状态码返回
+        first_event = await events.__anext__()
         
+    except BackendBusyError as e:
+        raise busy_exception(e)
+    except ExecutorQueueFullError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"检索服务繁忙，请稍后重试: {str(e)}"
+        )
     except Exception as e:
         async def error_stream():
             error_data = {
                 "error": True,
                 "message": str(e)
             }
-            yield f"data: {json.dumps(error_data)}\n\n"
+            yield sse_event(error_data)
         
-        return StreamingResponse(error_stream(), media_type="text/event-stream")
\ No newline at end of file
+        return StreamingResponse(error_stream(), media_type="text/event-stream")
+    
+    async def stream_generator():
+        try:
+            yield first_event
+            async for event in events:
+                yield event
+        except BackendBusyError as e:
+            yield sse_event({"error": True, "message": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            yield sse_event({"error": True, "message": str(e)})
+        finally:
+            await events.aclose()
+            # 独立生成的请求在客户端断开后停止生成；共享生成继续运行以服务其他订阅者并写入缓存
+            if not shared and not flight.done:
+                flight.task.cancel()
+    
+    return StreamingResponse(
+        stream_generator(),
+        media_type="text/event-stream",
+        headers=stream_headers
+    )
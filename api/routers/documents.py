@@ -1,8 +1,17 @@
 # api/routers/documents.py
 from fastapi import APIRouter, Depends, HTTPException
 
-from api.models import DocumentSearchRequest, DocumentSearchResponse
+from typing import Optional, Dict, Any
+
+from api.models import (
+    DocumentSearchRequest,
+    DocumentSearchResponse,
+    DocumentBatchSearchRequest,
+    DocumentBatchSearchItem,
+    DocumentBatchSearchResponse
+)
 from api.services.vector_service import VectorService
+from api.utils.executor import ExecutorQueueFullError
 
 router = APIRouter(prefix="/api/v1/documents", tags=["documents"])
 
@@ -10,6 +19,27 @@ router = APIRouter(prefix="/api/v1/documents", tags=["documents"])
 def get_vector_service():
     return VectorService()
 
+def build_filter_conditions(request: DocumentSearchRequest) -> Optional[Dict[str, Any]]:
+    """构建过滤条件"""
+    filter_conditions = None
+    if request.filter_by_source or request.filter_by_type:
+        filter_conditions = {}
+        
+        if request.filter_by_source:
+            filter_conditions["source"] = {"$contains": request.filter_by_source}
+        
+        if request.filter_by_type:
+            filter_conditions["file_type"] = {"$eq": request.filter_by_type}
+    return filter_conditions
+
+def build_search_params(request: DocumentSearchRequest) -> Dict[str, Any]:
+    """近似索引参数"""
+    return {
+        key: value
+        for key, value in (("nprobe", request.nprobe), ("shortlist", request.shortlist))
+        if value is not None
+    }
+
 @router.post("/search", response_model=DocumentSearchResponse)
 async def search_documents(
     request: DocumentSearchRequest,
@@ -21,22 +51,12 @@ async def search_documents(
     start_time = time.time()
     
     try:
-        # 构建过滤条件
-        filter_conditions = None
-        if request.filter_by_source or request.filter_by_type:
-            filter_conditions = {}
-            
-            if request.filter_by_source:
-                filter_conditions["source"] = {"$contains": request.filter_by_source}
-            
-            if request.filter_by_type:
-                filter_conditions["file_type"] = {"$eq": request.filter_by_type}
-        
         # 执行搜索
-        results = vector_service.search(
+        results = await vector_service.asearch(
             query=request.query,
             top_k=request.top_k,
-            filter_conditions=filter_conditions
+            filter_conditions=build_filter_conditions(request),
+            search_params=build_search_params(request)
         )
         
         processing_time = time.time() - start_time
@@ -48,12 +68,63 @@ async def search_documents(
             processing_time=processing_time
         )
         
+    except ExecutorQueueFullError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"检索服务繁忙，请稍后重试: {str(e)}"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"搜索失败: {str(e)}"
         )
 
+@router.post("/search/batch", response_model=DocumentBatchSearchResponse)
+async def search_documents_batch(
+    request: DocumentBatchSearchRequest,
+    vector_service: VectorService = Depends(get_vector_service)
+):
+    """批量搜索文档：一次请求完成多个查询，结果与请求顺序一致"""
+    
+    import time
+    start_time = time.time()
+    
+    try:
+        batch_results = await vector_service.asearch_batch([
+            {
+                "query": item.query,
+                "top_k": item.top_k,
+                "filter_conditions": build_filter_conditions(item),
+                "search_params": build_search_params(item)
+            }
+            for item in request.queries
+        ])
+        
+        return DocumentBatchSearchResponse(
+            items=[
+                DocumentBatchSearchItem(results=results, total=len(results), query=item.query)
+                for item, results in zip(request.queries, batch_results)
+            ],
+            total_queries=len(request.queries),
+            processing_time=time.time() - start_time
+        )
+        
+    except ExecutorQueueFullError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"检索服务繁忙，请稍后重试: {str(e)}"
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"搜索参数错误: {str(e)}"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"批量搜索失败: {str(e)}"
+        )
+
 @router.get("/stats")
 async def get_document_stats(
     vector_service: VectorService = Depends(get_vector_service)
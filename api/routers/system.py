@@ -1,5 +1,6 @@
 # api/routers/system.py
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import JSONResponse
 import time
 from datetime import datetime
 from typing import Dict, Any
@@ -18,14 +19,15 @@ START_TIME = time.time()
 def get_vector_service():
     return VectorService()
 
-def get_cache_service():
-    return CacheService()
+def get_cache_service(request: Request) -> CacheService:
+    return request.app.state.cache_service
 
 def get_llm_service():
     return UnifiedLLMService()
 
 @router.get("/health", response_model=SystemHealthResponse)
 async def health_check(
+    request: Request,
     vector_service: VectorService = Depends(get_vector_service),
     cache_service: CacheService = Depends(get_cache_service)
 ):
@@ -49,9 +51,15 @@ async def health_check(
     # 检查缓存服务
     components["cache"] = {
         "status": "healthy" if cache_service.available else "unhealthy",
-        "available": cache_service.available
+        "available": cache_service.available,
+        "details": cache_service.get_stats()
     }
     
+    # 并发请求合并统计
+    coalescer = getattr(request.app.state, "coalescer", None)
+    if coalescer is not None:
+        components["coalescing"] = coalescer.get_stats()
+    
     # 检查系统资源
     try:
         import psutil
@@ -80,6 +88,32 @@ async def health_check(
         uptime=time.time() - START_TIME
     )
 
+@router.get("/ready")
+async def readiness_check(
+    request: Request,
+    llm_service: UnifiedLLMService = Depends(get_llm_service)
+):
+    """就绪检查：检索服务（嵌入模型、向量库）预热完成后返回200
+
+    检索预热结果来自启动时的预热（失败时后台重试）。LLM后端状态由后台探测持续更新，
+    每次实时读取并随结果返回，但只作参考、不影响状态码：外部LLM服务故障或开发环境未配置后端时，
+    检索与文档接口仍可用，容器健康检查不应因此失败。
+    """
+    readiness = getattr(request.app.state, "readiness", None) or {"checks": {}, "warmed_up_at": None}
+    retrieval = readiness["checks"].get("retrieval", {"ready": False})
+    backends = {backend.value: healthy for backend, healthy in llm_service.backend_health.items()}
+    ready = retrieval["ready"]
+
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "not_ready",
+            "checks": {"retrieval": retrieval},
+            "llm": {"available": any(backends.values()), "backends": backends},
+            "warmed_up_at": readiness["warmed_up_at"]
+        }
+    )
+
 @router.get("/version")
 async def get_version(
     llm_service: UnifiedLLMService = Depends(get_llm_service)
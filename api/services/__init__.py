@@ -1,9 +1,10 @@
 # api/services/__init__.py
 """API Services Package"""
 
+from .embedding_engine import EmbeddingEngine
 from .vector_service import VectorService
 from .cache_service import CacheService
 from .unified_llm_service import UnifiedLLMService
 
-__all__ = ["VectorService", "CacheService", "UnifiedLLMService"]
+__all__ = ["EmbeddingEngine", "VectorService", "CacheService", "UnifiedLLMService"]
 
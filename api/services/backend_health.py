@@ -0,0 +1,263 @@
+from typing import Dict, Any, Optional
+from collections import deque
+import time
+import threading
+
+def _percentile(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+class CircuitBreaker:
+    """熔断器
+
+    closed：正常放行；连续失败达到阈值或窗口错误率过高时打开。
+    open：拒绝请求，冷却时间过后进入 half_open；期间的成功结果（如探测）不改变状态。
+    half_open：只放行一次试探（请求或后台探测），持有试探名额者成功则关闭，失败则重新打开。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        error_rate_threshold: float = 0.5,
+        min_samples: int = 10,
+        cooldown: float = 30.0
+    ):
+        self.failure_threshold = max(1, failure_threshold)
+        self.error_rate_threshold = error_rate_threshold
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.consecutive_failures = 0
+        self.opened_count = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def can_attempt(self) -> bool:
+        """是否可以发起请求（不占用半开试探名额）"""
+        state = self.state
+        return state == self.CLOSED or (state == self.HALF_OPEN and not self._trial_in_flight)
+
+    def acquire(self) -> bool:
+        """发起请求前调用；半开状态下占用唯一的试探名额"""
+        if not self.can_attempt():
+            return False
+        if self._state == self.HALF_OPEN:
+            self._trial_in_flight = True
+        return True
+
+    def try_trial(self) -> bool:
+        """仅在 half_open 且试探名额空闲时占用名额（供后台探测使用，closed/open 状态下返回 False）"""
+        if self.state == self.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def release(self):
+        """请求被取消、没有结果时归还半开试探名额"""
+        self._trial_in_flight = False
+
+    def record_success(self):
+        state = self.state
+        if state == self.CLOSED:
+            self.consecutive_failures = 0
+        elif state == self.HALF_OPEN and self._trial_in_flight:
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+            self._state = self.CLOSED
+
+    def record_failure(self, error_rate: float = 0.0, samples: int = 0):
+        self.consecutive_failures += 1
+        self._trial_in_flight = False
+        state = self.state
+        if state == self.HALF_OPEN:
+            self._open()
+        elif state == self.CLOSED and (
+            self.consecutive_failures >= self.failure_threshold
+            or (samples >= self.min_samples and error_rate >= self.error_rate_threshold)
+        ):
+            self._open()
+
+    def _open(self):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self.opened_count += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        state = self.state
+        return {
+            "state": state,
+            "consecutive_failures": self.consecutive_failures,
+            "opened_count": self.opened_count,
+            "retry_in": max(0.0, self.cooldown - (time.monotonic() - self._opened_at)) if state == self.OPEN else 0.0
+        }
+
+class BackendHealth:
+    """单个LLM后端的滚动健康统计
+
+    请求与后台探测分别保存最近 window 次的延迟。请求延迟按是否流式分开统计：
+    流式为首个token延迟，非流式为完整生成耗时，两者不可比较。
+    熔断器与错误率只由实际请求驱动；探测只在熔断器半开、且由探测持有试探名额时决定其关闭或重新打开
+    （/models 等探测接口正常不代表生成接口正常，不能让探测成功掩盖请求失败）。
+    """
+
+    def __init__(self, name: str, window: int = 100, breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.breaker = breaker or CircuitBreaker()
+        self._lock = threading.Lock()
+        # 键为 stream 标志
+        self._request_latencies = {True: deque(maxlen=window), False: deque(maxlen=window)}
+        self._probe_latencies = deque(maxlen=window)
+        self._outcomes = deque(maxlen=window)
+
+        self.requests = 0
+        self.request_errors = 0
+        self.probes = 0
+        self.probe_errors = 0
+        self.last_error: Optional[str] = None
+        self.last_probe_at: Optional[float] = None
+        self.last_probe_ok: Optional[bool] = None
+
+    @property
+    def error_rate(self) -> float:
+        return self._outcomes.count(False) / len(self._outcomes) if self._outcomes else 0.0
+
+    def record_request(
+        self,
+        ok: bool,
+        latency: Optional[float] = None,
+        error: Optional[str] = None,
+        stream: bool = True
+    ):
+        with self._lock:
+            self.requests += 1
+            self._outcomes.append(ok)
+            if ok:
+                if latency is not None:
+                    self._request_latencies[stream].append(latency)
+                self.breaker.record_success()
+            else:
+                self.request_errors += 1
+                self.last_error = error
+                self.breaker.record_failure(self.error_rate, len(self._outcomes))
+
+    def record_probe(
+        self,
+        ok: bool,
+        latency: Optional[float] = None,
+        error: Optional[str] = None,
+        trial: bool = False
+    ):
+        """记录探测结果；trial 表示探测持有半开试探名额（见 CircuitBreaker.try_trial）"""
+        with self._lock:
+            self.probes += 1
+            self.last_probe_at = time.time()
+            self.last_probe_ok = ok
+            if ok:
+                if latency is not None:
+                    self._probe_latencies.append(latency)
+            else:
+                self.probe_errors += 1
+                self.last_error = error
+            if trial:
+                if ok:
+                    self.breaker.record_success()
+                else:
+                    self.breaker.record_failure()
+
+    def record_censored(self, latency: float, stream: bool = True):
+        """记录被取消的请求已等待的时间（首个token延迟的下界），不计入成功/失败
+
+        对冲请求胜出时被取消的主请求只知道延迟不小于已等待时间；丢弃这些样本会使
+        延迟分位数偏低，进而使对冲越来越频繁。
+        """
+        with self._lock:
+            self._request_latencies[stream].append(latency)
+
+    def request_samples(self, stream: bool = True) -> int:
+        return len(self._request_latencies[stream])
+
+    def latency(self, q: float = 50, source: str = "request", stream: bool = True) -> Optional[float]:
+        """延迟分位数（秒），source 为 request 或 probe；stream 选择流式/非流式请求的统计"""
+        values = self._request_latencies[stream] if source == "request" else self._probe_latencies
+        with self._lock:
+            return _percentile(list(values), q)
+
+    def get_stats(self) -> Dict[str, Any]:
+        def ms(value):
+            return round(value * 1000, 1) if value is not None else None
+
+        stats = {
+            "requests": self.requests,
+            "request_errors": self.request_errors,
+            "probes": self.probes,
+            "probe_errors": self.probe_errors,
+            "error_rate": self.error_rate,
+            "ttft_p50_ms": ms(self.latency(50)),
+            "ttft_p95_ms": ms(self.latency(95)),
+            "completion_p50_ms": ms(self.latency(50, stream=False)),
+            "completion_p95_ms": ms(self.latency(95, stream=False)),
+            "probe_p50_ms": ms(self.latency(50, "probe")),
+            "probe_p95_ms": ms(self.latency(95, "probe")),
+            "last_error": self.last_error,
+            "last_probe_at": self.last_probe_at
+        }
+        stats["circuit"] = self.breaker.get_stats()
+        return stats
+
+class HedgeStats:
+    """对冲请求统计
+
+    对冲率 = 发起对冲的请求数 / 开启对冲的请求数；额外请求的成本以重复发送的提示词字符数估算
+    （输掉的请求在产生首个输出前被取消，主要成本是提示词）。
+    """
+
+    def __init__(self, window: int = 100):
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.primary_wins = 0
+        self.cancelled = 0
+        self.skipped = 0
+        self.prompt_chars = 0
+        self.extra_prompt_chars = 0
+        self._delays = deque(maxlen=window)
+
+    def record_request(self, prompt_chars: int, delay: float):
+        self.requests += 1
+        self.prompt_chars += prompt_chars
+        self._delays.append(delay)
+
+    def record_hedge(self, prompt_chars: int):
+        self.hedged += 1
+        self.extra_prompt_chars += prompt_chars
+
+    def get_stats(self) -> Dict[str, Any]:
+        delay = _percentile(list(self._delays), 50)
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_rate": self.hedged / self.requests if self.requests else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "primary_wins": self.primary_wins,
+            "hedge_win_rate": self.hedge_wins / self.hedged if self.hedged else 0.0,
+            "cancelled": self.cancelled,
+            "skipped": self.skipped,
+            "extra_prompt_chars": self.extra_prompt_chars,
+            "cost_overhead": self.extra_prompt_chars / self.prompt_chars if self.prompt_chars else 0.0,
+            "delay_p50_ms": round(delay * 1000, 1) if delay is not None else None
+        }
@@ -0,0 +1,212 @@
+from typing import Any, Deque, Dict, Optional
+from collections import deque
+import asyncio
+import math
+import time
+
+from api.services.backend_health import _percentile
+
+class BackendBusyError(RuntimeError):
+    """LLM后端排队已满或排队超时"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class Permit:
+    """一次准入：占用一个并发名额与预估的token额度"""
+
+    def __init__(self, tokens: float, waited: float):
+        self.tokens = tokens
+        self.waited = waited
+        self.released = False
+
+class _Waiter:
+    def __init__(self, future: asyncio.Future, tokens: float):
+        self.future = future
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+
+class BackendLimiter:
+    """单个LLM后端的并发与token速率限制（事件循环内使用）
+
+    并发名额与token桶（容量为每分钟token数，按秒匀速补充）都满足时放行；
+    否则进入先进先出的有界队列，队首不满足时后面的请求也不插队，避免大请求饿死。
+    队列已满或等待超过 queue_timeout 时抛出 BackendBusyError，附带建议的重试等待秒数。
+    max_concurrency / tokens_per_minute 为 0 表示不限制。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int = 0,
+        tokens_per_minute: int = 0,
+        max_queue: int = 0,
+        queue_timeout: float = 30.0,
+        window: int = 100
+    ):
+        self.name = name
+        self.max_concurrency = max(0, max_concurrency)
+        self.tokens_per_minute = max(0, tokens_per_minute)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+
+        self._in_flight = 0
+        self._tokens = float(self.tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self._waiters: Deque[_Waiter] = deque()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.max_queue_depth = 0
+        self._waits = deque(maxlen=window)
+        self._durations = deque(maxlen=window)
+
+    def _refill(self):
+        if not self.tokens_per_minute:
+            return
+        now = time.monotonic()
+        self._tokens = min(
+            float(self.tokens_per_minute),
+            self._tokens + (now - self._refilled_at) * self.tokens_per_minute / 60.0
+        )
+        self._refilled_at = now
+
+    def _cost(self, tokens: float) -> float:
+        # 超过桶容量的请求按容量计，否则永远无法放行
+        return min(tokens, self.tokens_per_minute) if self.tokens_per_minute else 0.0
+
+    def _can_admit(self, tokens: float) -> bool:
+        if self.max_concurrency and self._in_flight >= self.max_concurrency:
+            return False
+        self._refill()
+        return self._tokens >= self._cost(tokens)
+
+    def _admit(self, tokens: float, waited: float) -> Permit:
+        self._in_flight += 1
+        self._tokens -= self._cost(tokens)
+        self.admitted += 1
+        self._waits.append(waited)
+        return Permit(tokens, waited)
+
+    def retry_after(self) -> float:
+        """按当前排队长度与平均占用时间估算的重试等待秒数"""
+        slots = self.max_concurrency or 1
+        duration = sum(self._durations) / len(self._durations) if self._durations else 1.0
+        estimate = duration * (len(self._waiters) + 1) / slots
+        if self.tokens_per_minute:
+            deficit = sum(self._cost(waiter.tokens) for waiter in self._waiters) - self._tokens
+            estimate = max(estimate, deficit * 60.0 / self.tokens_per_minute)
+        return max(1.0, math.ceil(estimate))
+
+    def saturated(self) -> bool:
+        """并发名额已满（或已有请求在排队）且队列已满，新请求会被立即拒绝"""
+        busy = bool(self._waiters) or bool(self.max_concurrency and self._in_flight >= self.max_concurrency)
+        return busy and len(self._waiters) >= self.max_queue
+
+    def try_acquire(self, tokens: float = 0) -> Optional[Permit]:
+        """不排队，能立即放行时返回准入，否则返回 None"""
+        if not self._waiters and self._can_admit(tokens):
+            return self._admit(tokens, 0.0)
+        return None
+
+    async def acquire(self, tokens: float = 0) -> Permit:
+        """等待准入；队列已满或等待超时时抛出 BackendBusyError"""
+        permit = self.try_acquire(tokens)
+        if permit is not None:
+            return permit
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise BackendBusyError(
+                f"{self.name} 繁忙: {self._in_flight} 个请求处理中，{len(self._waiters)} 个排队",
+                self.retry_after()
+            )
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), tokens)
+        self._waiters.append(waiter)
+        self.queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+        # 只差token额度时安排定时放行
+        self._dispatch()
+        try:
+            return await asyncio.wait_for(waiter.future, timeout=self.queue_timeout or None)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise BackendBusyError(
+                f"{self.name} 排队超过 {self.queue_timeout:g} 秒",
+                self.retry_after()
+            )
+        except asyncio.CancelledError:
+            # 放行的同时请求被取消：归还名额
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release(waiter.future.result())
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._dispatch()
+
+    def release(self, permit: Permit, used_tokens: Optional[float] = None, duration: Optional[float] = None):
+        """归还准入；实际用量低于预估时退还差额"""
+        if permit.released:
+            return
+        permit.released = True
+        self._in_flight -= 1
+        if used_tokens is not None and self.tokens_per_minute:
+            self._refill()
+            refund = self._cost(permit.tokens) - min(used_tokens, self._cost(permit.tokens))
+            self._tokens = min(float(self.tokens_per_minute), self._tokens + refund)
+        if duration is not None:
+            self._durations.append(duration)
+        self._dispatch()
+
+    def _dispatch(self):
+        """按先后顺序放行排队中的请求"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        while self._waiters:
+            waiter = self._waiters[0]
+            if waiter.future.done():
+                self._waiters.popleft()
+                continue
+            if not self._can_admit(waiter.tokens):
+                break
+            self._waiters.popleft()
+            waiter.future.set_result(self._admit(waiter.tokens, now - waiter.enqueued_at))
+
+        # 队首只差token额度时，在额度补足后再次放行
+        if self._waiters and self.tokens_per_minute and not (
+            self.max_concurrency and self._in_flight >= self.max_concurrency
+        ):
+            deficit = self._cost(self._waiters[0].tokens) - self._tokens
+            delay = max(0.01, deficit * 60.0 / self.tokens_per_minute)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def get_stats(self) -> Dict[str, Any]:
+        self._refill()
+
+        def ms(q):
+            value = _percentile(list(self._waits), q)
+            return round(value * 1000, 1) if value is not None else None
+
+        return {
+            "max_concurrency": self.max_concurrency,
+            "tokens_per_minute": self.tokens_per_minute,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "queue_depth": len(self._waiters),
+            "max_queue_depth": self.max_queue_depth,
+            "tokens_available": round(self._tokens) if self.tokens_per_minute else None,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "wait_p50_ms": ms(50),
+            "wait_p95_ms": ms(95)
+        }
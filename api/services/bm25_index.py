@@ -0,0 +1,124 @@
+from typing import List, Dict, Tuple
+from collections import Counter
+import re
+import logging
+
+from api.services.inverted_index import InvertedIndex
+
+logger = logging.getLogger(__name__)
+
+BM25_TOKENIZERS = ("jieba", "bigram")
+
+_CJK_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+_WORD_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[A-Za-z0-9]+(?:[.\-/][A-Za-z0-9]+)*")
+
+def _bigram_tokenize(text: str) -> List[str]:
+    """无词典分词：中文按单字+相邻二元组切分，英文/数字按整词保留"""
+    tokens = []
+    for match in _WORD_RE.finditer(text):
+        word = match.group()
+        if _CJK_RE.fullmatch(word):
+            tokens.extend(word)
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word.lower())
+    return tokens
+
+def _jieba_tokenize(text: str) -> List[str]:
+    """jieba 搜索引擎模式分词，只保留中文词与英文/数字词"""
+    import jieba
+
+    return [
+        token.lower()
+        for token in jieba.lcut_for_search(text)
+        if _WORD_RE.fullmatch(token.strip())
+    ]
+
+def resolve_tokenizer(name: str) -> str:
+    """确定实际可用的分词器，jieba 未安装时退回二元组分词"""
+    if name not in BM25_TOKENIZERS:
+        raise ValueError(f"未知的BM25分词器: {name}，可选值: {', '.join(BM25_TOKENIZERS)}")
+    if name == "jieba":
+        try:
+            import jieba
+            jieba.setLogLevel(logging.WARNING)
+            jieba.initialize()
+        except ImportError:
+            logger.warning("jieba 未安装，BM25 使用二元组分词")
+            return "bigram"
+    return name
+
+def tokenize(text: str, tokenizer: str) -> List[str]:
+    """按指定分词器切分文本"""
+    if tokenizer == "jieba":
+        return _jieba_tokenize(text)
+    return _bigram_tokenize(text)
+
+def build_bm25_index(
+    doc_ids: List[str],
+    texts: List[str],
+    tokenizer: str = "jieba",
+    k1: float = 1.5,
+    b: float = 0.75
+) -> InvertedIndex:
+    """构建BM25索引
+
+    每条倒排记录直接保存 idf × tf 饱和项，查询时只需对命中的倒排记录求和。
+    """
+    import math
+
+    tokenizer = resolve_tokenizer(tokenizer)
+    term_counts = [Counter(tokenize(text, tokenizer)) for text in texts]
+    doc_lengths = [sum(counts.values()) for counts in term_counts]
+    num_docs = len(texts)
+    avg_length = (sum(doc_lengths) / num_docs) if num_docs else 0.0
+
+    doc_freq: Counter = Counter()
+    for counts in term_counts:
+        doc_freq.update(counts.keys())
+
+    idf = {
+        term: math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+        for term, df in doc_freq.items()
+    }
+
+    doc_term_weights: List[Dict[str, float]] = []
+    for counts, length in zip(term_counts, doc_lengths):
+        norm = k1 * (1 - b + b * length / avg_length) if avg_length else k1
+        doc_term_weights.append({
+            term: idf[term] * tf * (k1 + 1) / (tf + norm)
+            for term, tf in counts.items()
+        })
+
+    return InvertedIndex.build(
+        doc_ids,
+        doc_term_weights,
+        meta={
+            "type": "bm25",
+            "tokenizer": tokenizer,
+            "k1": k1,
+            "b": b,
+            "avg_doc_length": avg_length
+        }
+    )
+
+class BM25Retriever:
+    """BM25关键词检索（内存映射倒排索引）"""
+
+    def __init__(self, index: InvertedIndex, max_postings_per_term: int = 0):
+        self.index = index
+        self.max_postings_per_term = max_postings_per_term
+        self.tokenizer = resolve_tokenizer(index.meta.get("tokenizer", "bigram"))
+        if self.tokenizer != index.meta.get("tokenizer"):
+            logger.warning(
+                f"BM25索引使用 {index.meta.get('tokenizer')} 分词构建，当前使用 {self.tokenizer}，召回可能下降"
+            )
+
+    @classmethod
+    def load(cls, directory: str, max_postings_per_term: int = 0) -> "BM25Retriever":
+        return cls(InvertedIndex.load(directory), max_postings_per_term)
+
+    def search(self, query: str, top_k: int) -> List[Tuple[str, float]]:
+        """返回BM25得分最高的 top_k 个 (文档ID, 得分)"""
+        query_terms = Counter(tokenize(query, self.tokenizer))
+        return self.index.search(dict(query_terms), top_k, self.max_postings_per_term)
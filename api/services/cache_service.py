@@ -1,82 +1,469 @@
 # api/services/cache_service.py
-import redis
-import json
+import redis.asyncio as aioredis
+import asyncio
 import hashlib
-from typing import Optional, Any, Dict
+import logging
+import os
+import time
+import uuid
+import zlib
+import numpy as np
+from typing import Optional, Any, Dict, Tuple
 from datetime import timedelta
 from config import config
+from api.services.semantic_cache import get_semantic_cache
+from api.services.kb_fingerprint import read_fingerprint
+from api.utils.json_codec import get_json_codec
+from api.utils.lru_cache import LRUCache
+from api.utils.text import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# Redis中缓存值的编码：1字节格式标记 + 紧凑JSON（UTF-8，不转义中文）
+# 由 JSON_CODEC 指定的编解码器直接读写字节（orjson 可用时）。回答以中文文本为主，
+# msgpack 等二进制格式只比紧凑JSON小约3%（压缩后约2%），解压+解码反而慢于 orjson，故不采用
+_FORMAT_JSON = b"\x01"
+_FORMAT_ZLIB_JSON = b"\x02"
+
+_codec = get_json_codec(config.JSON_CODEC)
+
+def _serialize(value: Any) -> bytes:
+    return _codec.dumpb(value)
+
+def _pack(payload: bytes, compress_min_bytes: int, level: int) -> bytes:
+    if compress_min_bytes >= 0 and len(payload) >= compress_min_bytes:
+        compressed = zlib.compress(payload, level)
+        if len(compressed) < len(payload):
+            return _FORMAT_ZLIB_JSON + compressed
+    return _FORMAT_JSON + payload
+
+def encode_value(value: Any, compress_min_bytes: int = 512, level: int = 6) -> bytes:
+    """编码缓存值，超过 compress_min_bytes 时zlib压缩"""
+    return _pack(_serialize(value), compress_min_bytes, level)
+
+def decode_value(data: bytes) -> Any:
+    """解码缓存值（兼容旧版本写入的纯JSON文本）"""
+    marker, payload = data[:1], data[1:]
+    if marker == _FORMAT_ZLIB_JSON:
+        return _codec.loads(zlib.decompress(payload))
+    if marker == _FORMAT_JSON:
+        return _codec.loads(payload)
+    return _codec.loads(data)
 
 class CacheService:
-    """缓存服务"""
+    """缓存服务（应用级单实例）
+
+    在应用生命周期内创建一次，所有请求共用同一个异步Redis客户端与连接池。
+    Redis可用性由后台探测任务维护，请求路径上不再逐次ping；
+    不可用期间读写直接跳过，不会阻塞事件循环。
+
+    两级缓存：L1为进程内LRU（保存解码后的对象），L2为Redis（保存压缩后的二进制）。
+    写入与清除通过Redis发布/订阅通知其他工作进程使其L1失效；
+    订阅中断期间可能错过通知，L1条目另设较短的过期时间兜底。
+
+    缓存键以知识库构建指纹为命名空间（kb:{指纹}:{前缀}:{哈希}），重新构建知识库后
+    新指纹生效，旧回答不再命中，无需扫描删除。工作进程切换命名空间时把旧命名空间登记为已退役，
+    并定期为正在使用的命名空间续期活跃标记；后台只以 SCAN 分批清理已退役且不再活跃的命名空间，
+    不会误删滚动发布期间或使用其他指纹的工作进程仍在使用的键。
+    """
+
+    NAMESPACE_PREFIX = "kb"
+    SWEEP_LOCK_KEY = "cache:sweep:lock"
+    RETIRED_NAMESPACES_KEY = "cache:namespaces:retired"
+    ACTIVE_NAMESPACE_PREFIX = "cache:namespaces:active:"
+    # 引入命名空间之前写入的键
+    LEGACY_PATTERNS = ("answer:*",)
     
     def __init__(self):
+        self.pool = aioredis.BlockingConnectionPool.from_url(
+            config.REDIS_URL,
+            decode_responses=False,
+            max_connections=config.REDIS_MAX_CONNECTIONS,
+            timeout=config.REDIS_POOL_TIMEOUT,
+            socket_timeout=config.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=config.REDIS_SOCKET_TIMEOUT,
+            socket_keepalive=True,
+            health_check_interval=30
+        )
+        self.client = aioredis.Redis(connection_pool=self.pool)
+        self.available = False
+        self._probe_task: Optional[asyncio.Task] = None
+        self._probe_failures = 0
+
+        # L1进程内缓存与跨进程失效
+        self.l1 = LRUCache(max_size=config.CACHE_L1_SIZE, ttl=config.CACHE_L1_TTL or None) if config.CACHE_L1_SIZE > 0 else None
+        self.instance_id = uuid.uuid4().hex
+        self._invalidation_task: Optional[asyncio.Task] = None
+        self.invalidations_received = 0
+
+        # L2统计
+        self.l2_hits = 0
+        self.l2_misses = 0
+        self.l2_errors = 0
+        self.l2_bytes_raw = 0
+        self.l2_bytes_stored = 0
+
+        # 语义回答缓存（进程内）
+        self.semantic_cache = get_semantic_cache() if config.SEMANTIC_CACHE_ENABLED else None
+
+        # 知识库命名空间与旧键清理
+        self._fingerprint_mtime = None
+        self.namespace = "none"
+        self._retired_namespaces = set()
+        self._refresh_namespace(log=False)
+        # 启动时的初始命名空间不是切换，不登记退役
+        self._retired_namespaces.clear()
+        self._sweep_task: Optional[asyncio.Task] = None
+        self._swept_namespace: Optional[str] = None
+        self._last_sweep = 0.0
+        self.sweeps = 0
+        self.swept_keys = 0
+
+    def _refresh_namespace(self, log: bool = True) -> bool:
+        """指纹文件变化时切换命名空间，返回是否发生切换"""
         try:
-            self.client = redis.Redis.from_url(
-                config.REDIS_URL,
-                decode_responses=True,
-                socket_timeout=5,
-                socket_connect_timeout=5
-            )
-            # 测试连接
-            self.client.ping()
+            mtime = os.path.getmtime(config.KB_FINGERPRINT_FILE)
+        except OSError:
+            mtime = None
+        if mtime == self._fingerprint_mtime:
+            return False
+        self._fingerprint_mtime = mtime
+
+        namespace = read_fingerprint(config.KB_FINGERPRINT_FILE) or "none"
+        if namespace == self.namespace:
+            return False
+
+        if log:
+            logger.info(f"知识库已重新构建，缓存命名空间切换: {self.namespace} -> {namespace}")
+        # 旧命名空间在下次Redis可用时登记为已退役
+        self._retired_namespaces.add(self.namespace)
+        self._retired_namespaces.discard(namespace)
+        self.namespace = namespace
+        # 旧知识库的回答不再有效
+        if self.l1 is not None:
+            self.l1.clear()
+        if self.semantic_cache is not None:
+            self.semantic_cache.clear()
+        return True
+
+    async def start(self):
+        """首次探测Redis并启动后台探测任务"""
+        if await self.probe():
+            await self._sync_namespaces()
+        if self._probe_task is None:
+            self._probe_task = asyncio.create_task(self._probe_loop())
+        if self._invalidation_task is None and self.l1 is not None:
+            self._invalidation_task = asyncio.create_task(self._invalidation_loop())
+
+    async def close(self):
+        """停止后台任务并关闭连接池"""
+        for task in (self._probe_task, self._invalidation_task, self._sweep_task):
+            if task is None:
+                continue
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._probe_task = None
+        self._invalidation_task = None
+        self._sweep_task = None
+        await self.client.aclose()
+        await self.pool.aclose()
+
+    async def probe(self) -> bool:
+        """探测Redis可用性"""
+        try:
+            await asyncio.wait_for(self.client.ping(), timeout=config.REDIS_SOCKET_TIMEOUT)
+            if not self.available:
+                logger.info("Redis缓存已连接")
             self.available = True
-        except:
+            self._probe_failures = 0
+        except Exception as e:
+            if self.available or self._probe_failures == 0:
+                logger.warning(f"Redis缓存不可用: {e}")
             self.available = False
+            self._probe_failures += 1
+        return self.available
+
+    async def _probe_loop(self):
+        while True:
+            await asyncio.sleep(config.REDIS_PROBE_INTERVAL)
+            self._refresh_namespace()
+            if await self.probe():
+                await self._sync_namespaces()
+                self._maybe_sweep()
+
+    async def _sync_namespaces(self):
+        """登记本进程退役的命名空间，并为当前命名空间续期活跃标记"""
+        try:
+            if self._retired_namespaces:
+                await self.client.sadd(self.RETIRED_NAMESPACES_KEY, *self._retired_namespaces)
+                self._retired_namespaces.clear()
+            await self.client.set(
+                self.ACTIVE_NAMESPACE_PREFIX + self.namespace,
+                self.instance_id,
+                ex=max(60, int(config.REDIS_PROBE_INTERVAL * 3))
+            )
+        except Exception as e:
+            logger.warning(f"缓存命名空间登记失败: {e}")
+
+    def _maybe_sweep(self):
+        """命名空间切换后或到达清理间隔时，在后台清理旧命名空间的键"""
+        if self._sweep_task is not None and not self._sweep_task.done():
+            return
+        due = time.monotonic() - self._last_sweep >= config.CACHE_SWEEP_INTERVAL
+        if self._swept_namespace == self.namespace and not due:
+            return
+        self._last_sweep = time.monotonic()
+        self._swept_namespace = self.namespace
+        self._sweep_task = asyncio.create_task(self.sweep_stale_namespaces())
+
+    async def sweep_stale_namespaces(self) -> int:
+        """以 SCAN 分批删除已退役命名空间（及引入命名空间之前）的缓存键，返回删除的键数
+
+        仍有工作进程在使用（活跃标记未过期）的命名空间跳过，下次再清理。
+        多个工作进程通过短期锁保证同一时间只有一个在清理，锁在结束或被取消时释放；
+        删除使用 UNLINK，内存回收在Redis后台线程完成。
+        """
+        deleted = 0
+        try:
+            if not await self.client.set(self.SWEEP_LOCK_KEY, self.instance_id, nx=True, ex=600):
+                return 0
+        except Exception as e:
+            logger.warning(f"旧缓存命名空间清理失败: {e}")
+            return 0
+
+        try:
+            for member in await self.client.smembers(self.RETIRED_NAMESPACES_KEY):
+                namespace = member.decode() if isinstance(member, bytes) else member
+                if namespace == self.namespace or await self.client.exists(self.ACTIVE_NAMESPACE_PREFIX + namespace):
+                    continue
+                deleted += await self._unlink_matching(f"{self.NAMESPACE_PREFIX}:{namespace}:*")
+                await self.client.srem(self.RETIRED_NAMESPACES_KEY, member)
+
+            for pattern in self.LEGACY_PATTERNS:
+                deleted += await self._unlink_matching(pattern)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"旧缓存命名空间清理失败: {e}")
+        finally:
+            try:
+                if await self.client.get(self.SWEEP_LOCK_KEY) == self.instance_id.encode():
+                    await self.client.delete(self.SWEEP_LOCK_KEY)
+            except Exception:
+                pass
+
+        self.sweeps += 1
+        self.swept_keys += deleted
+        if deleted:
+            logger.info(f"已清理旧缓存命名空间中的 {deleted} 个键")
+        return deleted
+
+    async def _unlink_matching(self, pattern: str) -> int:
+        """以 SCAN 分批 UNLINK 匹配的键"""
+        deleted = 0
+        batch = []
+        async for key in self.client.scan_iter(match=pattern, count=config.CACHE_SWEEP_SCAN_COUNT):
+            batch.append(key)
+            if len(batch) >= config.CACHE_SWEEP_SCAN_COUNT:
+                deleted += await self.client.unlink(*batch)
+                batch = []
+        if batch:
+            deleted += await self.client.unlink(*batch)
+        return deleted
+
+    async def _invalidation_loop(self):
+        """订阅失效通知，删除其他工作进程已更新或清除的L1条目"""
+        while True:
+            if not self.available:
+                await asyncio.sleep(config.REDIS_PROBE_INTERVAL)
+                continue
+
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(config.CACHE_INVALIDATION_CHANNEL)
+                # 订阅建立之前可能错过了失效通知
+                self.l1.clear()
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is None or message.get("type") != "message":
+                        continue
+                    self._apply_invalidation(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"缓存失效订阅中断: {e}")
+                await asyncio.sleep(config.REDIS_PROBE_INTERVAL)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    def _apply_invalidation(self, data: bytes):
+        sender, _, key = data.decode("utf-8").partition("|")
+        if sender == self.instance_id:
+            return
+        self.invalidations_received += 1
+        if "*" in key:
+            # 按模式清除：与本进程 clear_cache 的处理保持一致
+            self.l1.clear()
+            if self.semantic_cache is not None and self._matches_answers(key):
+                self.semantic_cache.clear()
+        else:
+            self.l1.delete(key)
+
+    @staticmethod
+    def _matches_answers(pattern: str) -> bool:
+        return pattern == "*" or "answer" in pattern
+
+    async def _publish_invalidation(self, key: str):
+        if self.l1 is None:
+            return
+        await self.client.publish(config.CACHE_INVALIDATION_CHANNEL, f"{self.instance_id}|{key}")
+
+    def _mark_unavailable(self, error: Exception):
+        """读写失败时立即标记不可用，由后台探测恢复"""
+        if self.available:
+            logger.warning(f"Redis操作失败，暂停缓存读写: {error}")
+        self.available = False
     
     def _make_key(self, prefix: str, query: str) -> str:
-        """生成缓存键"""
+        """生成缓存键（按当前知识库命名空间）"""
         query_hash = hashlib.md5(query.encode()).hexdigest()
-        return f"{prefix}:{query_hash}"
+        return f"{self.NAMESPACE_PREFIX}:{self.namespace}:{prefix}:{query_hash}"
     
-    def get(self, key: str) -> Optional[Any]:
-        """获取缓存"""
+    async def get(self, key: str) -> Optional[Any]:
+        """获取缓存：先查L1，未命中再查Redis并回填L1"""
+        if self.l1 is not None:
+            value = self.l1.get(key)
+            if value is not None:
+                return value
+
         if not self.available:
             return None
         
         try:
-            value = self.client.get(key)
-            if value:
-                return json.loads(value)
-        except:
-            pass
+            data = await self.client.get(key)
+            if not data:
+                self.l2_misses += 1
+                return None
+            value = decode_value(data)
+            self.l2_hits += 1
+            if self.l1 is not None:
+                self.l1.set(key, value)
+            return value
+        except (aioredis.ConnectionError, aioredis.TimeoutError) as e:
+            self.l2_errors += 1
+            self._mark_unavailable(e)
+        except Exception:
+            self.l2_errors += 1
         return None
     
-    def set(self, key: str, value: Any, ttl: int = None):
-        """设置缓存"""
+    async def set(self, key: str, value: Any, ttl: int = None):
+        """设置缓存：写入L1与Redis，并通知其他工作进程"""
+        if ttl is None:
+            ttl = config.CACHE_TTL
+
+        if self.l1 is not None:
+            self.l1.set(key, value, min(ttl, self.l1.ttl) if self.l1.ttl else ttl)
+
         if not self.available:
             return
         
         try:
-            if ttl is None:
-                ttl = config.CACHE_TTL
-            
-            self.client.setex(
+            payload = _serialize(value)
+            data = _pack(payload, config.CACHE_COMPRESS_MIN_BYTES, config.CACHE_COMPRESS_LEVEL)
+            await self.client.setex(
                 key,
                 timedelta(seconds=ttl),
-                json.dumps(value)
+                data
             )
-        except:
-            pass
+            self.l2_bytes_raw += len(payload)
+            self.l2_bytes_stored += len(data)
+            await self._publish_invalidation(key)
+        except (aioredis.ConnectionError, aioredis.TimeoutError) as e:
+            self.l2_errors += 1
+            self._mark_unavailable(e)
+        except Exception:
+            self.l2_errors += 1
     
-    def get_cached_answer(self, question: str) -> Optional[Dict]:
+    def answer_key(self, question: str) -> str:
+        """问题对应的回答缓存键（按规范化后的问题文本）"""
+        return self._make_key("answer", normalize_query(question))
+
+    async def get_cached_answer(self, question: str) -> Optional[Dict]:
         """获取缓存的回答"""
-        key = self._make_key("answer", question)
-        return self.get(key)
+        return await self.get(self.answer_key(question))
     
-    def cache_answer(self, question: str, answer: Dict, ttl: int = None):
-        """缓存回答"""
-        key = self._make_key("answer", question)
-        self.set(key, answer, ttl)
+    def get_similar_answer(self, embedding: np.ndarray) -> Optional[Tuple[Dict, float]]:
+        """按问题向量查找语义相近的缓存回答，返回 (回答, 相似度)"""
+        if self.semantic_cache is None:
+            return None
+        return self.semantic_cache.lookup(embedding)
+
+    async def cache_answer(self, question: str, answer: Dict, ttl: int = None, embedding: Optional[np.ndarray] = None):
+        """缓存回答，提供问题向量时同时写入语义缓存"""
+        await self.set(self.answer_key(question), answer, ttl)
+
+        if self.semantic_cache is not None and embedding is not None:
+            self.semantic_cache.add(question, embedding, answer, ttl)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        l2_total = self.l2_hits + self.l2_misses
+        return {
+            "available": self.available,
+            "probe_failures": self._probe_failures,
+            "l1": dict(
+                self.l1.get_stats(),
+                invalidations_received=self.invalidations_received
+            ) if self.l1 is not None else None,
+            "l2": {
+                "hits": self.l2_hits,
+                "misses": self.l2_misses,
+                "hit_rate": self.l2_hits / l2_total if l2_total else 0.0,
+                "errors": self.l2_errors,
+                "compression_ratio": self.l2_bytes_stored / self.l2_bytes_raw if self.l2_bytes_raw else None
+            },
+            "pool": {
+                "max_connections": self.pool.max_connections,
+                "in_use": len(self.pool._in_use_connections),
+                "idle": len(self.pool._available_connections)
+            },
+            "namespace": {
+                "current": self.namespace,
+                "sweeps": self.sweeps,
+                "swept_keys": self.swept_keys
+            },
+            "semantic_cache": self.semantic_cache.get_stats() if self.semantic_cache is not None else None
+        }
     
-    def clear_cache(self, pattern: str = "*") -> int:
-        """清除缓存"""
+    async def clear_cache(self, pattern: str = "*") -> int:
+        """清除缓存（SCAN 分批删除，不阻塞Redis）
+
+        pattern 匹配命名空间之后的部分（如 "answer:*"），只删除本服务的缓存键
+        （所有命名空间的 kb:*:{pattern} 以及匹配的旧版本键），不影响同一Redis库中的其他数据。
+        """
+        if self.semantic_cache is not None and self._matches_answers(pattern):
+            self.semantic_cache.clear()
+        if self.l1 is not None:
+            self.l1.clear()
+
         if not self.available:
             return 0
         
         try:
-            keys = self.client.keys(pattern)
-            if keys:
-                return self.client.delete(*keys)
-        except:
+            deleted = await self._unlink_matching(f"{self.NAMESPACE_PREFIX}:*:{pattern}")
+            for legacy in self.LEGACY_PATTERNS:
+                if pattern == "*" or pattern == legacy:
+                    deleted += await self._unlink_matching(legacy)
+            await self._publish_invalidation(pattern)
+            return deleted
+        except (aioredis.ConnectionError, aioredis.TimeoutError) as e:
+            self._mark_unavailable(e)
+        except Exception:
             pass
-        return 0
\ No newline at end of file
+        return 0
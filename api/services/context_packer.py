@@ -0,0 +1,132 @@
+from typing import List, Dict, Any, Callable, Optional, Tuple
+from dataclasses import dataclass, field
+
+from api.utils.text import estimate_tokens
+
+# 重叠文本少于该字符数时视为偶然相同，不做去除
+_MIN_OVERLAP = 5
+
+@dataclass
+class PackedContext:
+    """打包后的上下文"""
+    context: str
+    sources: List[Dict[str, Any]] = field(default_factory=list)
+    tokens: int = 0
+    passages: int = 0
+    truncated: bool = False
+
+def _strip_overlap(previous: str, current: str, max_overlap: int) -> str:
+    """去掉 current 开头与 previous 结尾重叠的部分"""
+    limit = min(max_overlap, len(previous), len(current))
+    for size in range(limit, _MIN_OVERLAP - 1, -1):
+        if previous.endswith(current[:size]):
+            return current[size:]
+    return current
+
+def _passage_key(metadata: Dict[str, Any]) -> Tuple[Any, Any]:
+    """相邻文本块合并的分组键：同一来源文件（分页文档还需同一页）"""
+    return metadata.get("source"), metadata.get("page")
+
+def _truncate_to_budget(text: str, budget: int, count_tokens: Callable[[str], int]) -> str:
+    """按token预算截断文本（二分查找字符位置）"""
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+def pack_context(
+    search_results: List[Dict[str, Any]],
+    token_budget: int,
+    max_overlap: int = 0,
+    count_tokens: Optional[Callable[[str], int]] = None,
+    min_truncated_tokens: int = 64
+) -> PackedContext:
+    """在token预算内按得分顺序打包检索结果
+
+    同一来源中 chunk_index 连续的命中合并为一段，并去除切分时的重叠文本；
+    段落按其中最靠前的命中排序依次放入，超出预算的段落跳过，
+    剩余预算不少于 min_truncated_tokens 时截断放入。
+    """
+    count_tokens = count_tokens or estimate_tokens
+
+    # 1. 按来源分组，chunk_index 连续的命中归为同一段
+    groups: Dict[Tuple[Any, Any], Dict[int, int]] = {}
+    passages: List[List[int]] = []
+    for position, result in enumerate(search_results):
+        metadata = result.get("metadata") or {}
+        chunk_index = metadata.get("chunk_index")
+        if chunk_index is None:
+            passages.append([position])
+            continue
+        groups.setdefault(_passage_key(metadata), {}).setdefault(int(chunk_index), position)
+
+    for by_index in groups.values():
+        run: List[int] = []
+        previous_index = None
+        for chunk_index in sorted(by_index):
+            if run and chunk_index != previous_index + 1:
+                passages.append(run)
+                run = []
+            run.append(by_index[chunk_index])
+            previous_index = chunk_index
+        passages.append(run)
+
+    # 段落按其中排名最靠前的命中排序
+    passages.sort(key=min)
+
+    # 2. 拼接段落文本，去除重叠与完全重复的内容
+    seen_texts = set()
+    packed_parts: List[str] = []
+    packed_sources: List[Dict[str, Any]] = []
+    used_tokens = 0
+    truncated = False
+
+    for members in passages:
+        text = ""
+        starts: List[int] = []
+        for position in members:
+            chunk_text = search_results[position]["text"]
+            starts.append(len(text))
+            text += _strip_overlap(text, chunk_text, max_overlap) if text else chunk_text
+        leading = len(text) - len(text.lstrip())
+        text = text.strip()
+
+        fingerprint = " ".join(text.split())
+        if not fingerprint or fingerprint in seen_texts:
+            continue
+
+        # 3. 按预算放入
+        label = f"[来源{len(packed_parts) + 1}] "
+        tokens = count_tokens(label + text)
+        remaining = token_budget - used_tokens
+        if token_budget > 0 and tokens > remaining:
+            if remaining < min_truncated_tokens:
+                truncated = True
+                continue
+            text = _truncate_to_budget(text, remaining - count_tokens(label), count_tokens)
+            tokens = count_tokens(label + text)
+            truncated = True
+            if not text:
+                continue
+
+        seen_texts.add(fingerprint)
+        packed_parts.append(label + text)
+        # 截断后只保留文本仍（至少部分）出现在上下文中的来源
+        packed_sources.extend(
+            search_results[position]
+            for position, start in zip(members, starts)
+            if start - leading < len(text)
+        )
+        used_tokens += tokens
+
+    return PackedContext(
+        context="\n\n".join(packed_parts),
+        sources=packed_sources,
+        tokens=used_tokens,
+        passages=len(packed_parts),
+        truncated=truncated
+    )
@@ -0,0 +1,417 @@
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterator
+import json
+import os
+import warnings
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+EMBEDDING_PRECISIONS = ("fp32", "fp16", "bf16")
+SPARSE_LINEAR_FILE = "sparse_linear.pt"
+
+# 导出后用于一致性校验的样例文本
+PARITY_SAMPLE_TEXTS = [
+    "入伍年龄要求是什么？",
+    "大学生士兵退役后可以享受哪些优待政策",
+    "征兵体检的视力标准",
+    "义务兵服役期间家庭优待金如何发放",
+    "The quick brown fox jumps over the lazy dog.",
+]
+
+def l2_normalize(embeddings: np.ndarray) -> np.ndarray:
+    """按行做L2归一化"""
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+class TorchEmbeddingBackend:
+    """PyTorch 前向计算后端"""
+
+    name = "torch"
+
+    def __init__(self, model, device):
+        self.model = model
+        self.device = device
+
+    def forward(self, input_ids: np.ndarray, attention_mask: np.ndarray, return_hidden: bool = False):
+        """执行前向计算，返回CLS池化并归一化后的向量
+
+        return_hidden 为 True 时同时返回 last_hidden_state，供稀疏权重计算使用。
+        """
+        import torch
+
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=torch.from_numpy(input_ids).to(self.device),
+                attention_mask=torch.from_numpy(attention_mask).to(self.device)
+            )
+
+            # Use CLS token embedding (first token)
+            embeddings = outputs.last_hidden_state[:, 0]
+
+            # Normalize embeddings
+            embeddings = torch.nn.functional.normalize(embeddings, p=2, dim=1)
+
+            if return_hidden:
+                return embeddings.float().cpu().numpy(), outputs.last_hidden_state.float().cpu().numpy()
+            return embeddings.float().cpu().numpy()
+
+class OnnxEmbeddingBackend:
+    """ONNX Runtime CPU 前向计算后端"""
+
+    def __init__(self, model_path: str, num_threads: int = 0, name: str = "onnx"):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("使用ONNX嵌入后端需要安装 onnxruntime: pip install onnxruntime")
+
+        self.name = name
+        self.model_path = model_path
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+
+        self.session = ort.InferenceSession(
+            model_path,
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+
+    def forward(self, input_ids: np.ndarray, attention_mask: np.ndarray, return_hidden: bool = False):
+        """执行前向计算，返回CLS池化并归一化后的向量
+
+        return_hidden 为 True 时同时返回 last_hidden_state，供稀疏权重计算使用。
+        """
+        last_hidden_state = self.session.run(
+            ["last_hidden_state"],
+            {
+                "input_ids": input_ids.astype(np.int64),
+                "attention_mask": attention_mask.astype(np.int64)
+            }
+        )[0].astype(np.float32)
+        embeddings = l2_normalize(last_hidden_state[:, 0])
+
+        if return_hidden:
+            return embeddings, last_hidden_state
+        return embeddings
+
+class SparseHead:
+    """BGE-M3 稀疏（词汇）权重头
+
+    与 FlagEmbedding 一致：对每个token的隐藏状态做 relu(linear(h))，
+    同一token多次出现时取最大值，并忽略特殊token。
+    """
+
+    def __init__(self, weight: np.ndarray, bias: np.ndarray, special_token_ids: List[int]):
+        self.weight = weight.reshape(-1).astype(np.float32)
+        self.bias = float(np.asarray(bias).reshape(-1)[0])
+        self.special_token_ids = np.array(sorted(set(special_token_ids)), dtype=np.int64)
+        self.path: Optional[str] = None
+
+    @classmethod
+    def load(cls, model_source: str, tokenizer, local_files_only: bool) -> Optional["SparseHead"]:
+        """加载 sparse_linear.pt，模型目录中不存在时返回 None"""
+        import torch
+
+        if os.path.isdir(model_source):
+            path = os.path.join(model_source, SPARSE_LINEAR_FILE)
+            if not os.path.exists(path):
+                return None
+        else:
+            try:
+                from huggingface_hub import hf_hub_download
+                path = hf_hub_download(model_source, SPARSE_LINEAR_FILE, local_files_only=local_files_only)
+            except Exception as e:
+                logger.warning(f"无法获取稀疏权重文件 {SPARSE_LINEAR_FILE}: {e}")
+                return None
+
+        state = torch.load(path, map_location="cpu")
+        special_ids = [
+            tokenizer.cls_token_id,
+            tokenizer.eos_token_id,
+            tokenizer.pad_token_id,
+            tokenizer.unk_token_id
+        ]
+        head = cls(
+            state["weight"].float().numpy(),
+            state["bias"].float().numpy(),
+            [token_id for token_id in special_ids if token_id is not None]
+        )
+        head.path = path
+        return head
+
+    def compute(
+        self,
+        last_hidden_state: np.ndarray,
+        input_ids: np.ndarray,
+        attention_mask: np.ndarray
+    ) -> List[Dict[str, float]]:
+        """计算每条文本的稀疏权重 {token_id: weight}"""
+        scores = np.maximum(last_hidden_state @ self.weight + self.bias, 0.0)
+        valid = (attention_mask > 0) & ~np.isin(input_ids, self.special_token_ids) & (scores > 0)
+
+        results = []
+        for row in range(input_ids.shape[0]):
+            token_ids = input_ids[row][valid[row]]
+            if token_ids.size == 0:
+                results.append({})
+                continue
+            unique_ids, inverse = np.unique(token_ids, return_inverse=True)
+            weights = np.zeros(unique_ids.shape[0], dtype=np.float32)
+            np.maximum.at(weights, inverse, scores[row][valid[row]])
+            results.append({str(int(t)): float(w) for t, w in zip(unique_ids, weights)})
+        return results
+
+def onnx_model_path(onnx_dir: str, quantized: bool) -> str:
+    """ONNX模型文件路径"""
+    return os.path.join(onnx_dir, "model.int8.onnx" if quantized else "model.onnx")
+
+def encode_with_backend(backend, tokenizer, texts: List[str], max_length: int = 512) -> np.ndarray:
+    """使用指定后端编码一批文本"""
+    encoded = tokenizer(
+        texts,
+        padding=True,
+        truncation=True,
+        max_length=max_length,
+        return_tensors="np"
+    )
+    return backend.forward(encoded["input_ids"], encoded["attention_mask"])
+
+def plan_length_buckets(
+    lengths: List[int],
+    token_budget: int,
+    max_batch_size: int
+) -> Iterator[List[int]]:
+    """按token长度分桶规划批次
+
+    先按长度降序排序，使同批文本长度相近；每批的 (批量 × 最长长度)
+    不超过 token_budget，返回原始下标组成的批次。
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+
+    batch: List[int] = []
+    batch_max_len = 0
+    for index in order:
+        length = max(1, lengths[index])
+        longest = max(batch_max_len, length)
+        if batch and (len(batch) >= max_batch_size or longest * (len(batch) + 1) > token_budget):
+            yield batch
+            batch, longest = [], length
+        batch.append(index)
+        batch_max_len = longest
+
+    if batch:
+        yield batch
+
+def iter_encode_bucketed(
+    backend,
+    tokenizer,
+    texts: List[str],
+    token_budget: int = 8192,
+    max_batch_size: int = 128,
+    max_length: int = 512,
+    sparse_head: Optional[SparseHead] = None
+) -> Iterator[Tuple[List[int], np.ndarray, Optional[List[Dict[str, float]]]]]:
+    """按长度分桶逐批编码，产出 (原始下标列表, 向量矩阵, 稀疏权重列表或None)"""
+    if not texts:
+        return
+
+    encoded = tokenizer(texts, padding=False, truncation=True, max_length=max_length)
+    all_ids = encoded["input_ids"]
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
+
+    for batch in plan_length_buckets([len(ids) for ids in all_ids], token_budget, max_batch_size):
+        seq_len = max(len(all_ids[i]) for i in batch)
+        input_ids = np.full((len(batch), seq_len), pad_id, dtype=np.int64)
+        attention_mask = np.zeros((len(batch), seq_len), dtype=np.int64)
+        for row, index in enumerate(batch):
+            ids = all_ids[index]
+            input_ids[row, :len(ids)] = ids
+            attention_mask[row, :len(ids)] = 1
+
+        if sparse_head is None:
+            yield batch, backend.forward(input_ids, attention_mask), None
+        else:
+            # 稠密与稀疏输出来自同一次前向计算
+            dense, hidden = backend.forward(input_ids, attention_mask, return_hidden=True)
+            yield batch, dense, sparse_head.compute(hidden, input_ids, attention_mask)
+
+def encode_bucketed(
+    backend,
+    tokenizer,
+    texts: List[str],
+    token_budget: int = 8192,
+    max_batch_size: int = 128,
+    max_length: int = 512,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+    sparse_head: Optional[SparseHead] = None
+):
+    """按长度分桶批量编码，减少填充token带来的无效计算，输出保持原始顺序
+
+    传入 sparse_head 时返回 (向量矩阵, 稀疏权重列表)。
+    """
+    result: Optional[np.ndarray] = None
+    sparse: List[Optional[Dict[str, float]]] = [None] * len(texts)
+    done = 0
+    for batch, embeddings, batch_sparse in iter_encode_bucketed(
+        backend, tokenizer, texts, token_budget, max_batch_size, max_length, sparse_head
+    ):
+        if result is None:
+            result = np.empty((len(texts), embeddings.shape[1]), dtype=np.float32)
+        result[batch] = embeddings
+        if batch_sparse is not None:
+            for index, weights in zip(batch, batch_sparse):
+                sparse[index] = weights
+
+        done += len(batch)
+        if progress_callback is not None:
+            progress_callback(done, len(texts))
+
+    if result is None:
+        result = np.zeros((0, 0), dtype=np.float32)
+    if sparse_head is not None:
+        return result, sparse
+    return result
+
+def check_parity(
+    reference,
+    candidate,
+    tokenizer,
+    texts: Optional[List[str]] = None
+) -> Dict[str, float]:
+    """比较两个后端输出向量的余弦相似度"""
+    texts = texts or PARITY_SAMPLE_TEXTS
+    expected = encode_with_backend(reference, tokenizer, texts)
+    actual = encode_with_backend(candidate, tokenizer, texts)
+    cosines = np.sum(expected * actual, axis=1)
+    return {
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "samples": len(texts)
+    }
+
+def export_onnx_model(
+    model,
+    tokenizer,
+    onnx_dir: str,
+    quantized: bool,
+    min_cosine: float = 0.98,
+    num_threads: int = 0
+) -> str:
+    """导出ONNX模型（可选int8动态量化），并与PyTorch输出做一致性校验
+
+    导出产物缓存在 onnx_dir 下，已存在时直接复用。
+    """
+    import torch
+
+    os.makedirs(onnx_dir, exist_ok=True)
+    fp32_path = onnx_model_path(onnx_dir, quantized=False)
+
+    if not os.path.exists(fp32_path):
+        print(f"正在导出ONNX模型: {fp32_path}")
+        model = model.to("cpu").eval()
+        dummy = tokenizer(["导出样例"], return_tensors="pt")
+
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                (dummy["input_ids"], dummy["attention_mask"]),
+                fp32_path,
+                input_names=["input_ids", "attention_mask"],
+                output_names=["last_hidden_state"],
+                dynamic_axes={
+                    "input_ids": {0: "batch", 1: "sequence"},
+                    "attention_mask": {0: "batch", 1: "sequence"},
+                    "last_hidden_state": {0: "batch", 1: "sequence"}
+                },
+                opset_version=17,
+                do_constant_folding=True
+            )
+
+    target_path = fp32_path
+    if quantized:
+        target_path = onnx_model_path(onnx_dir, quantized=True)
+        if not os.path.exists(target_path):
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+
+            print(f"正在进行int8动态量化: {target_path}")
+            quantize_dynamic(fp32_path, target_path, weight_type=QuantType.QInt8)
+
+    # 一致性校验：不达标的产物不保留
+    candidate = OnnxEmbeddingBackend(
+        target_path,
+        num_threads=num_threads,
+        name="onnx-int8" if quantized else "onnx"
+    )
+    parity = check_parity(TorchEmbeddingBackend(model, torch.device("cpu")), candidate, tokenizer)
+    print(f"ONNX一致性校验: 最小余弦 {parity['min_cosine']:.5f}, 平均余弦 {parity['mean_cosine']:.5f}")
+
+    if parity["min_cosine"] < min_cosine:
+        os.remove(target_path)
+        raise ValueError(
+            f"ONNX模型一致性校验失败: 最小余弦 {parity['min_cosine']:.5f} < {min_cosine}"
+        )
+
+    report_path = target_path + ".parity.json"
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(parity, f, ensure_ascii=False, indent=2)
+
+    return target_path
+
+def load_embedding_backend(
+    backend_name: str,
+    model_source: str,
+    local_files_only: bool,
+    device,
+    onnx_dir: str,
+    num_threads: int = 0,
+    min_cosine: float = 0.98,
+    precision: str = "fp32"
+) -> Tuple[Any, Any]:
+    """加载分词器与指定的嵌入后端
+
+    返回 (tokenizer, backend)。ONNX 产物已缓存时不再加载 PyTorch 模型；
+    precision 仅作用于 torch 后端。
+    """
+    from transformers import AutoTokenizer, AutoModel
+
+    if backend_name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"未知的嵌入后端: {backend_name}，可选值: {', '.join(EMBEDDING_BACKENDS)}")
+    if precision not in EMBEDDING_PRECISIONS:
+        raise ValueError(f"未知的计算精度: {precision}，可选值: {', '.join(EMBEDDING_PRECISIONS)}")
+
+    # Suppress the incorrect Mistral regex warning
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', message='.*fix_mistral_regex.*')
+        tokenizer = AutoTokenizer.from_pretrained(model_source, local_files_only=local_files_only)
+
+    if backend_name == "torch":
+        import torch
+
+        model = AutoModel.from_pretrained(model_source, local_files_only=local_files_only).to(device)
+        if precision == "fp16":
+            model = model.half()
+        elif precision == "bf16":
+            model = model.to(torch.bfloat16)
+        model.eval()
+        return tokenizer, TorchEmbeddingBackend(model, device)
+
+    quantized = backend_name == "onnx-int8"
+    path = onnx_model_path(onnx_dir, quantized)
+    if not os.path.exists(path):
+        model = AutoModel.from_pretrained(model_source, local_files_only=local_files_only)
+        path = export_onnx_model(
+            model,
+            tokenizer,
+            onnx_dir,
+            quantized=quantized,
+            min_cosine=min_cosine,
+            num_threads=num_threads
+        )
+        del model
+
+    print(f"使用ONNX嵌入模型: {path}")
+    return tokenizer, OnnxEmbeddingBackend(path, num_threads=num_threads, name=backend_name)
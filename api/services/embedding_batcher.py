@@ -0,0 +1,159 @@
+import threading
+import time
+from concurrent.futures import Future
+from queue import Queue, Empty, Full
+from typing import Callable, List, Dict, Any, Optional, Sequence, Tuple
+import logging
+
+from api.utils.executor import ExecutorQueueFullError
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingBatcher:
+    """查询向量动态微批处理器
+
+    并发到达的查询先进入队列，后台线程在等待窗口内（或凑满最大批量后）
+    将它们合并为一次前向计算，再把各自的向量交还给调用方。
+    排队的查询数超过 max_queue_size 时立即拒绝（抛出 ExecutorQueueFullError），0 表示不限制。
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], Sequence[Any]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        max_queue_size: int = 0
+    ):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+
+        self.max_queue_size = max(0, max_queue_size)
+
+        self._queue: "Queue[Tuple[str, Future]]" = Queue(maxsize=self.max_queue_size)
+        self._stopped = threading.Event()
+        # 保证关闭后不再有请求进入队列
+        self._submit_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._requests = 0
+        self._max_seen_batch = 0
+        self._rejected = 0
+
+        self._thread = threading.Thread(
+            target=self._worker,
+            name="embedding-batcher",
+            daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        """提交一个查询，返回在批处理完成后就绪的 Future
+
+        排队已满时抛出 ExecutorQueueFullError，批处理器已关闭时抛出 RuntimeError
+        """
+        future: Future = Future()
+        try:
+            with self._submit_lock:
+                if self._stopped.is_set():
+                    raise RuntimeError("查询微批处理器已关闭")
+                self._queue.put_nowait((text, future))
+        except Full:
+            with self._stats_lock:
+                self._rejected += 1
+            raise ExecutorQueueFullError(f"查询微批处理繁忙: {self.max_queue_size} 个排队位置均已占满")
+        return future
+
+    def encode(self, text: str, timeout: Optional[float] = None) -> Any:
+        """同步获取单个查询的编码结果"""
+        return self.submit(text).result(timeout=timeout)
+
+    def _collect_batch(self, first: Tuple[str, Future]) -> List[Tuple[str, Future]]:
+        """在等待窗口内收集一批请求"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            # 已在队列中的请求直接取走，不必等待
+            try:
+                item = self._queue.get_nowait()
+            except Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stopped.is_set():
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except Empty:
+                    break
+            batch.append(item)
+
+        return batch
+
+    def _run_batch(self, batch: List[Tuple[str, Future]]):
+        """执行一次批量编码并分发结果"""
+        live = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+        if not live:
+            return
+
+        # 同一批次内的重复查询只编码一次
+        unique_texts: List[str] = []
+        positions: Dict[str, int] = {}
+        for text, _ in live:
+            if text not in positions:
+                positions[text] = len(unique_texts)
+                unique_texts.append(text)
+
+        try:
+            embeddings = self.encode_fn(unique_texts)
+        except Exception as e:
+            logger.error(f"批量编码失败: {e}")
+            for _, future in live:
+                future.set_exception(e)
+            return
+
+        for text, future in live:
+            future.set_result(embeddings[positions[text]])
+
+        with self._stats_lock:
+            self._batches += 1
+            self._requests += len(live)
+            self._max_seen_batch = max(self._max_seen_batch, len(live))
+
+    def _worker(self):
+        """后台批处理线程"""
+        # 关闭时处理完已排队的请求再退出（关闭信号不进入有界队列，避免队列已满时阻塞）
+        while not (self._stopped.is_set() and self._queue.empty()):
+            try:
+                item = self._queue.get(timeout=0.1)
+            except Empty:
+                continue
+            self._run_batch(self._collect_batch(item))
+
+    def close(self, timeout: float = 5.0):
+        """停止后台线程；未能在 timeout 秒内处理的请求以 RuntimeError 结束，避免调用方永久等待"""
+        with self._submit_lock:
+            self._stopped.set()
+        self._thread.join(timeout=timeout)
+
+        while True:
+            try:
+                _, future = self._queue.get_nowait()
+            except Empty:
+                break
+            if future.set_running_or_notify_cancel():
+                future.set_exception(RuntimeError("查询微批处理器已关闭"))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取批处理统计信息"""
+        with self._stats_lock:
+            return {
+                "batches": self._batches,
+                "requests": self._requests,
+                "avg_batch_size": self._requests / self._batches if self._batches else 0.0,
+                "max_batch_size_seen": self._max_seen_batch,
+                "queue_size": self._queue.qsize(),
+                "max_queue_size": self.max_queue_size,
+                "rejected": self._rejected,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0
+            }
@@ -0,0 +1,42 @@
+from typing import Optional, Dict, Any, Tuple
+import numpy as np
+
+from api.utils.lru_cache import LRUCache
+from api.utils.text import normalize_text
+
+class EmbeddingCache:
+    """查询向量缓存
+
+    以规范化后的查询文本（NFKC与空白折叠，保留大小写）为键，向量以紧凑的 float16/float32 数组保存，
+    启用混合检索时同时保存查询的稀疏权重。
+    """
+
+    def __init__(self, max_size: int, ttl: Optional[float] = None, dtype: str = "float16"):
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.float16, np.float32):
+            raise ValueError(f"不支持的向量缓存精度: {dtype}，可选值: float16, float32")
+        self._cache = LRUCache(max_size=max_size, ttl=ttl)
+
+    def get(self, query: str) -> Optional[Tuple[np.ndarray, Optional[Dict[str, float]]]]:
+        """获取缓存的 (查询向量（float32）, 稀疏权重)"""
+        entry = self._cache.get(normalize_text(query))
+        if entry is None:
+            return None
+        vector, sparse = entry
+        return vector.astype(np.float32), sparse
+
+    def set(self, query: str, vector: np.ndarray, sparse: Optional[Dict[str, float]] = None):
+        """缓存查询向量及其稀疏权重"""
+        stored = np.array(vector, dtype=self.dtype)
+        stored.setflags(write=False)
+        self._cache.set(normalize_text(query), (stored, sparse))
+
+    def clear(self):
+        """清空缓存"""
+        self._cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        stats = self._cache.get_stats()
+        stats["dtype"] = self.dtype.name
+        return stats
@@ -0,0 +1,175 @@
+from typing import List, Dict, Any, Optional, Iterator, Tuple, Callable
+import os
+import shutil
+import threading
+import numpy as np
+
+from config import config
+from api.services.embedding_backend import (
+    SparseHead,
+    SPARSE_LINEAR_FILE,
+    load_embedding_backend,
+    iter_encode_bucketed,
+    encode_bucketed
+)
+
+class EmbeddingEngine:
+    """统一的嵌入计算引擎
+
+    API服务、知识库构建与管理脚本共用同一套模型加载与
+    CLS池化+归一化逻辑，保证各处生成的向量一致。
+    """
+
+    def __init__(
+        self,
+        use_local: Optional[bool] = None,
+        backend: Optional[str] = None,
+        device: Optional[str] = None,
+        precision: Optional[str] = None,
+        num_threads: Optional[int] = None,
+        save_after_download: bool = False,
+        sparse: bool = False
+    ):
+        import torch
+
+        if use_local is None:
+            use_local = os.path.exists(config.EMBEDDING_MODEL_PATH)
+        self.use_local = use_local
+        self.backend_name = (backend or config.EMBEDDING_BACKEND).lower()
+        self.precision = (precision or config.EMBEDDING_PRECISION).lower()
+        self.num_threads = config.EMBEDDING_NUM_THREADS if num_threads is None else num_threads
+
+        # 设备选择：ONNX 后端仅支持CPU
+        device = (device or config.EMBEDDING_DEVICE).lower()
+        if self.backend_name != "torch" or device == "cpu":
+            self.device = torch.device('cpu')
+        elif device == "auto":
+            self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        else:
+            self.device = torch.device(device)
+
+        if self.num_threads > 0:
+            torch.set_num_threads(self.num_threads)
+
+        print(f"正在加载嵌入模型 (后端: {self.backend_name}, 精度: {self.precision})...")
+        print(f"使用设备: {self.device}")
+
+        if use_local:
+            print(f"从本地加载模型: {config.EMBEDDING_MODEL_PATH}")
+            if not os.path.exists(config.EMBEDDING_MODEL_PATH):
+                raise FileNotFoundError(
+                    f"本地模型路径不存在: {config.EMBEDDING_MODEL_PATH}\n"
+                    f"请先下载模型或使用在线模式"
+                )
+            model_source = config.EMBEDDING_MODEL_PATH
+        else:
+            print(f"从HuggingFace在线加载模型: {config.EMBEDDING_MODEL}")
+            model_source = config.EMBEDDING_MODEL
+
+        self.tokenizer, self.backend = load_embedding_backend(
+            self.backend_name,
+            model_source,
+            local_files_only=use_local,
+            device=self.device,
+            onnx_dir=config.ONNX_MODEL_DIR,
+            num_threads=self.num_threads,
+            min_cosine=config.ONNX_PARITY_MIN_COSINE,
+            precision=self.precision
+        )
+
+        # BGE-M3 稀疏权重头，与稠密向量共用一次前向计算
+        self.sparse_head = None
+        if sparse:
+            self.sparse_head = SparseHead.load(model_source, self.tokenizer, local_files_only=use_local)
+            if self.sparse_head is None:
+                print(f"⚠️  未找到 {SPARSE_LINEAR_FILE}，稀疏权重不可用")
+            else:
+                print("稀疏权重头加载完成")
+
+        # 在线下载后保存到本地，供后续离线使用
+        if not use_local and save_after_download and self.backend.name == "torch":
+            print(f"保存模型到本地: {config.EMBEDDING_MODEL_PATH}")
+            os.makedirs(config.EMBEDDING_MODEL_PATH, exist_ok=True)
+            self.tokenizer.save_pretrained(config.EMBEDDING_MODEL_PATH)
+            self.backend.model.save_pretrained(config.EMBEDDING_MODEL_PATH)
+            if self.sparse_head is not None:
+                shutil.copy(self.sparse_head.path, os.path.join(config.EMBEDDING_MODEL_PATH, SPARSE_LINEAR_FILE))
+
+        print("嵌入模型加载完成")
+
+    @property
+    def name(self) -> str:
+        return self.backend.name
+
+    @property
+    def supports_sparse(self) -> bool:
+        return self.sparse_head is not None
+
+    def encode(self, text: str) -> np.ndarray:
+        """将单个文本编码为向量"""
+        return self.encode_batch([text])[0]
+
+    def encode_batch(
+        self,
+        texts: List[str],
+        token_budget: Optional[int] = None,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        return_sparse: bool = False
+    ):
+        """批量将文本编码为向量（按token长度分桶，输出保持原始顺序）
+
+        return_sparse 为 True 时返回 (向量矩阵, 稀疏权重列表)。
+        """
+        if return_sparse and self.sparse_head is None:
+            raise ValueError("嵌入引擎未加载稀疏权重头")
+
+        return encode_bucketed(
+            self.backend,
+            self.tokenizer,
+            texts,
+            token_budget=token_budget or config.EMBEDDING_TOKEN_BUDGET,
+            max_batch_size=config.EMBEDDING_ENCODE_MAX_BATCH,
+            progress_callback=progress_callback,
+            sparse_head=self.sparse_head if return_sparse else None
+        )
+
+    def iter_encode(
+        self,
+        texts: List[str],
+        token_budget: Optional[int] = None,
+        return_sparse: bool = False
+    ) -> Iterator[Tuple[List[int], np.ndarray, Optional[List[Dict[str, float]]]]]:
+        """逐批编码，产出 (原始下标列表, 向量矩阵, 稀疏权重列表或None)，适合边编码边写入的大规模构建"""
+        if return_sparse and self.sparse_head is None:
+            raise ValueError("嵌入引擎未加载稀疏权重头")
+
+        return iter_encode_bucketed(
+            self.backend,
+            self.tokenizer,
+            texts,
+            token_budget=token_budget or config.EMBEDDING_TOKEN_BUDGET,
+            max_batch_size=config.EMBEDDING_ENCODE_MAX_BATCH,
+            sparse_head=self.sparse_head if return_sparse else None
+        )
+
+    def get_info(self) -> Dict[str, Any]:
+        """获取引擎配置信息"""
+        return {
+            "backend": self.backend.name,
+            "device": str(self.device),
+            "precision": self.precision,
+            "num_threads": self.num_threads,
+            "sparse": self.supports_sparse
+        }
+
+_engine: Optional[EmbeddingEngine] = None
+_engine_lock = threading.Lock()
+
+def get_embedding_engine() -> EmbeddingEngine:
+    """获取进程内共享的嵌入引擎"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = EmbeddingEngine(sparse=config.HYBRID_SEARCH_ENABLED)
+    return _engine
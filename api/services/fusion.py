@@ -0,0 +1,47 @@
+from typing import List, Tuple, Dict, Optional
+
+FUSION_METHODS = ("rrf", "weighted")
+
+def reciprocal_rank_fusion(
+    rankings: List[List[Tuple[str, float]]],
+    weights: Optional[List[float]] = None,
+    k: int = 60
+) -> List[Tuple[str, float]]:
+    """倒数排名融合（RRF）：score = Σ weight / (k + rank)"""
+    weights = weights or [1.0] * len(rankings)
+    fused: Dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, (doc_id, _) in enumerate(ranking, 1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+def weighted_score_fusion(
+    rankings: List[List[Tuple[str, float]]],
+    weights: Optional[List[float]] = None
+) -> List[Tuple[str, float]]:
+    """加权分数融合：各路得分做 min-max 归一化后加权求和"""
+    weights = weights or [1.0] * len(rankings)
+    fused: Dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        if not ranking:
+            continue
+        scores = [score for _, score in ranking]
+        low, high = min(scores), max(scores)
+        span = high - low
+        for doc_id, score in ranking:
+            normalized = (score - low) / span if span > 0 else 1.0
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight * normalized
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+def fuse_rankings(
+    method: str,
+    rankings: List[List[Tuple[str, float]]],
+    weights: Optional[List[float]] = None,
+    rrf_k: int = 60
+) -> List[Tuple[str, float]]:
+    """按配置的方法融合多路检索结果，返回按融合得分降序的 (文档ID, 得分)"""
+    if method == "rrf":
+        return reciprocal_rank_fusion(rankings, weights, k=rrf_k)
+    if method == "weighted":
+        return weighted_score_fusion(rankings, weights)
+    raise ValueError(f"未知的融合方法: {method}，可选值: {', '.join(FUSION_METHODS)}")
@@ -0,0 +1,173 @@
+from typing import List, Dict, Any, Optional, Tuple
+import json
+import os
+import numpy as np
+
+class InvertedIndex:
+    """持久化倒排索引（CSR 结构）
+
+    每个词项的倒排列表保存 (文档序号, 权重)，权重在构建时预先算好，
+    查询得分为各查询词项权重与文档权重乘积之和。倒排列表按权重降序存放，
+    查询时可只读取每个词项的前若干条（静态剪枝）。数组以 .npy 保存，
+    服务端通过内存映射加载，不需要把全部倒排列表读入内存。
+    """
+
+    META_FILE = "meta.json"
+    VOCAB_FILE = "vocab.json"
+    DOC_IDS_FILE = "doc_ids.json"
+    OFFSETS_FILE = "offsets.npy"
+    DOCS_FILE = "postings_docs.npy"
+    WEIGHTS_FILE = "postings_weights.npy"
+
+    def __init__(
+        self,
+        doc_ids: List[str],
+        vocab: Dict[str, int],
+        offsets: np.ndarray,
+        postings_docs: np.ndarray,
+        postings_weights: np.ndarray,
+        meta: Optional[Dict[str, Any]] = None
+    ):
+        self.doc_ids = doc_ids
+        self.vocab = vocab
+        self.offsets = offsets
+        self.postings_docs = postings_docs
+        self.postings_weights = postings_weights
+        self.meta = meta or {}
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_ids)
+
+    @classmethod
+    def build(
+        cls,
+        doc_ids: List[str],
+        doc_term_weights: List[Dict[str, float]],
+        meta: Optional[Dict[str, Any]] = None
+    ) -> "InvertedIndex":
+        """由每篇文档的 {词项: 权重} 构建索引，重复的文档ID以最后一次为准"""
+        latest: Dict[str, int] = {}
+        for position, doc_id in enumerate(doc_ids):
+            latest[doc_id] = position
+
+        final_ids = list(latest.keys())
+        postings: Dict[str, Tuple[List[int], List[float]]] = {}
+        for doc_index, doc_id in enumerate(final_ids):
+            for term, weight in doc_term_weights[latest[doc_id]].items():
+                if weight <= 0:
+                    continue
+                docs, weights = postings.setdefault(term, ([], []))
+                docs.append(doc_index)
+                weights.append(weight)
+
+        terms = sorted(postings.keys())
+        vocab = {term: row for row, term in enumerate(terms)}
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for row, term in enumerate(terms):
+            offsets[row + 1] = offsets[row] + len(postings[term][0])
+
+        postings_docs = np.empty(int(offsets[-1]), dtype=np.int32)
+        postings_weights = np.empty(int(offsets[-1]), dtype=np.float32)
+        for row, term in enumerate(terms):
+            docs, weights = postings[term]
+            order = np.argsort(-np.asarray(weights, dtype=np.float32), kind="stable")
+            postings_docs[offsets[row]:offsets[row + 1]] = np.asarray(docs, dtype=np.int32)[order]
+            postings_weights[offsets[row]:offsets[row + 1]] = np.asarray(weights, dtype=np.float32)[order]
+
+        meta = dict(meta or {})
+        meta.update({
+            "num_docs": len(final_ids),
+            "num_terms": len(terms),
+            "num_postings": int(offsets[-1])
+        })
+        return cls(final_ids, vocab, offsets, postings_docs, postings_weights, meta)
+
+    def to_documents(self) -> Tuple[List[str], List[Dict[str, float]]]:
+        """还原每篇文档的 {词项: 权重}，用于增量合并"""
+        documents: List[Dict[str, float]] = [{} for _ in self.doc_ids]
+        for term, row in self.vocab.items():
+            start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+            for doc_index, weight in zip(self.postings_docs[start:end], self.postings_weights[start:end]):
+                documents[int(doc_index)][term] = float(weight)
+        return list(self.doc_ids), documents
+
+    def save(self, directory: str):
+        """保存索引到目录"""
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, self.OFFSETS_FILE), self.offsets)
+        np.save(os.path.join(directory, self.DOCS_FILE), self.postings_docs)
+        np.save(os.path.join(directory, self.WEIGHTS_FILE), self.postings_weights)
+
+        with open(os.path.join(directory, self.VOCAB_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.vocab, f, ensure_ascii=False)
+        with open(os.path.join(directory, self.DOC_IDS_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.doc_ids, f, ensure_ascii=False)
+        with open(os.path.join(directory, self.META_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def exists(cls, directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, cls.META_FILE))
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "InvertedIndex":
+        """从目录加载索引，倒排数组默认以只读内存映射方式打开"""
+        mmap_mode = "r" if mmap else None
+        offsets = np.load(os.path.join(directory, cls.OFFSETS_FILE), mmap_mode=mmap_mode)
+        postings_docs = np.load(os.path.join(directory, cls.DOCS_FILE), mmap_mode=mmap_mode)
+        postings_weights = np.load(os.path.join(directory, cls.WEIGHTS_FILE), mmap_mode=mmap_mode)
+
+        with open(os.path.join(directory, cls.VOCAB_FILE), "r", encoding="utf-8") as f:
+            vocab = json.load(f)
+        with open(os.path.join(directory, cls.DOC_IDS_FILE), "r", encoding="utf-8") as f:
+            doc_ids = json.load(f)
+        with open(os.path.join(directory, cls.META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        return cls(doc_ids, vocab, offsets, postings_docs, postings_weights, meta)
+
+    def search(
+        self,
+        query_weights: Dict[str, float],
+        top_k: int,
+        max_postings_per_term: int = 0
+    ) -> List[Tuple[str, float]]:
+        """返回得分最高的 top_k 个 (文档ID, 得分)
+
+        max_postings_per_term > 0 时每个词项只读取权重最高的前若干条倒排记录。
+        """
+        doc_parts = []
+        weight_parts = []
+        for term, query_weight in query_weights.items():
+            row = self.vocab.get(term)
+            if row is None or query_weight <= 0:
+                continue
+            start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+            if max_postings_per_term > 0:
+                end = min(end, start + max_postings_per_term)
+            doc_parts.append(self.postings_docs[start:end])
+            weight_parts.append(self.postings_weights[start:end] * np.float32(query_weight))
+
+        if not doc_parts or top_k <= 0:
+            return []
+
+        docs = np.concatenate(doc_parts)
+        weights = np.concatenate(weight_parts)
+
+        # 按文档累加得分，再在命中的倒排记录上取候选，避免对全部文档排序
+        totals = np.bincount(docs, weights=weights, minlength=self.num_docs)
+        hit_scores = totals[docs]
+
+        # 同一文档最多出现 len(doc_parts) 次，取足够多的候选保证去重后仍有 top_k 个
+        limit = min(hit_scores.shape[0], top_k * len(doc_parts))
+        if limit < hit_scores.shape[0]:
+            positions = np.argpartition(-hit_scores, limit - 1)[:limit]
+        else:
+            positions = np.arange(hit_scores.shape[0])
+
+        candidates = np.unique(docs[positions])
+        candidate_scores = totals[candidates]
+        order = np.argsort(-candidate_scores, kind="stable")[:top_k]
+
+        return [(self.doc_ids[int(candidates[i])], float(candidate_scores[i])) for i in order]
@@ -0,0 +1,262 @@
+from typing import Dict, Any, Optional, Tuple
+from datetime import datetime
+import os
+import json
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def _kmeans(
+    vectors: np.ndarray,
+    k: int,
+    iterations: int = 20,
+    seed: int = 0,
+    block_size: int = 16384
+) -> np.ndarray:
+    """L2 k-means（随机样本初始化，空簇重新随机取点）"""
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    centroids = vectors[rng.choice(n, size=k, replace=n < k)].astype(np.float32, copy=True)
+
+    for _ in range(iterations):
+        assign = _assign(vectors, centroids, block_size)
+        counts = np.bincount(assign, minlength=k)
+
+        order = np.argsort(assign, kind="stable")
+        nonempty = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty]
+        sums = np.add.reduceat(vectors[order], starts, axis=0)
+        centroids[nonempty] = sums / counts[nonempty, None]
+
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(n, size=len(empty))]
+
+    return centroids
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, block_size: int = 16384) -> np.ndarray:
+    """最近质心分配：argmin ||x - c||² = argmax (x·c - ||c||²/2)"""
+    half_norms = 0.5 * np.sum(centroids ** 2, axis=1)
+    assign = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), block_size):
+        block = np.asarray(vectors[start:start + block_size], dtype=np.float32)
+        assign[start:start + len(block)] = np.argmax(block @ centroids.T - half_norms, axis=1)
+    return assign
+
+def default_nlist(num_vectors: int) -> int:
+    """粗聚类中心数的经验值：约 4·√N"""
+    return int(min(65536, max(1, 4 * np.sqrt(max(num_vectors, 1)))))
+
+class IVFPQIndex:
+    """IVF-PQ 近似最近邻索引
+
+    粗聚类把向量分到 nlist 个倒排列表，列表内只保存残差的乘积量化编码
+    （每个向量 m 字节）与其在向量存储中的行号。查询时探测 nprobe 个最近列表，
+    用查表法估算内积，取估算最高的 shortlist 个候选，再从内存映射的完整向量精确重排。
+    """
+
+    CENTROIDS_FILE = "centroids.npy"
+    CODEBOOKS_FILE = "codebooks.npy"
+    CODES_FILE = "codes.npy"
+    ROWS_FILE = "rows.npy"
+    OFFSETS_FILE = "offsets.npy"
+    META_FILE = "meta.json"
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        codebooks: np.ndarray,
+        codes: np.ndarray,
+        rows: np.ndarray,
+        offsets: np.ndarray,
+        meta: Optional[Dict[str, Any]] = None
+    ):
+        self.centroids = centroids
+        self.codebooks = codebooks
+        self.codes = codes
+        self.rows = rows
+        self.offsets = offsets
+        self.meta = meta or {}
+
+        self.nlist, self.dim = centroids.shape
+        self.m, self.ksub, self.dsub = codebooks.shape
+        self._half_norms = 0.5 * np.sum(centroids ** 2, axis=1)
+        self._code_offsets = (np.arange(self.m) * self.ksub).astype(np.int64)
+
+    @property
+    def num_vectors(self) -> int:
+        return int(len(self.rows))
+
+    @classmethod
+    def train(
+        cls,
+        vectors: np.ndarray,
+        nlist: int = 0,
+        m: int = 64,
+        train_sample: int = 100000,
+        iterations: int = 20,
+        seed: int = 0,
+        block_size: int = 16384
+    ) -> "IVFPQIndex":
+        """在（可内存映射的）向量矩阵上训练并编码全部向量"""
+        num_vectors, dim = vectors.shape
+        if num_vectors == 0:
+            raise ValueError("向量为空，无法训练IVF-PQ索引")
+        if dim % m != 0:
+            raise ValueError(f"向量维度 {dim} 不能被子空间数 m={m} 整除")
+
+        nlist = min(nlist or default_nlist(num_vectors), num_vectors)
+        ksub = min(256, num_vectors)
+        dsub = dim // m
+        rng = np.random.default_rng(seed)
+
+        sample_rows = np.sort(rng.choice(num_vectors, size=min(train_sample, num_vectors), replace=False))
+        sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+
+        # 粗聚类
+        centroids = _kmeans(sample, nlist, iterations, seed, block_size)
+
+        # 残差乘积量化：每个子空间独立聚类为 ksub 个码字
+        residuals = sample - centroids[_assign(sample, centroids, block_size)]
+        codebooks = np.stack([
+            _kmeans(np.ascontiguousarray(residuals[:, j * dsub:(j + 1) * dsub]), ksub, iterations, seed + j, block_size)
+            for j in range(m)
+        ])
+
+        # 编码全部向量
+        assign = np.empty(num_vectors, dtype=np.int64)
+        codes = np.empty((num_vectors, m), dtype=np.uint8)
+        for start in range(0, num_vectors, block_size):
+            block = np.asarray(vectors[start:start + block_size], dtype=np.float32)
+            block_assign = _assign(block, centroids, block_size)
+            assign[start:start + len(block)] = block_assign
+            codes[start:start + len(block)] = cls._encode_residuals(block - centroids[block_assign], codebooks)
+
+        # 按倒排列表排序
+        order = np.argsort(assign, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]).astype(np.int64)
+
+        meta = {
+            "type": "ivfpq",
+            "num_vectors": int(num_vectors),
+            "dim": int(dim),
+            "nlist": int(nlist),
+            "m": int(m),
+            "ksub": int(ksub),
+            "train_sample": int(len(sample_rows)),
+            "built_at": datetime.now().isoformat()
+        }
+        index = cls(centroids, codebooks, codes[order], order.astype(np.int32), offsets, meta)
+        index.meta["memory"] = index.memory_report()
+        return index
+
+    @staticmethod
+    def _encode_residuals(residuals: np.ndarray, codebooks: np.ndarray) -> np.ndarray:
+        m, _, dsub = codebooks.shape
+        codes = np.empty((len(residuals), m), dtype=np.uint8)
+        for j in range(m):
+            sub = residuals[:, j * dsub:(j + 1) * dsub]
+            codes[:, j] = _assign(sub, codebooks[j])
+        return codes
+
+    def memory_report(self, num_vectors: int = 1_000_000) -> Dict[str, float]:
+        """常驻内存估算（MB）：索引本身与同等规模的平铺向量对比"""
+        per_vector = self.m + self.rows.itemsize
+        fixed = self.centroids.nbytes + self.codebooks.nbytes + self.offsets.nbytes
+        mb = 1024 * 1024
+        return {
+            "bytes_per_vector": per_vector,
+            "index_mb": (per_vector * self.num_vectors + fixed) / mb,
+            "index_mb_per_million": (per_vector * num_vectors + fixed) / mb,
+            "flat_float32_mb_per_million": num_vectors * self.dim * 4 / mb,
+            "flat_float16_mb_per_million": num_vectors * self.dim * 2 / mb
+        }
+
+    def search(
+        self,
+        query: np.ndarray,
+        vectors: np.ndarray,
+        top_k: int,
+        nprobe: int = 16,
+        shortlist: int = 200,
+        mask: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """返回 (行号, 精确内积)，按内积降序
+
+        vectors 为完整向量矩阵（内存映射），仅读取 shortlist 个候选行用于重排。
+        """
+        query = np.asarray(query, dtype=np.float32)
+        nprobe = max(1, min(nprobe, self.nlist))
+        shortlist = max(top_k, shortlist)
+
+        # 粗筛：最近的 nprobe 个倒排列表
+        coarse = self.centroids @ query
+        probe = np.argpartition(-(coarse - self._half_norms), nprobe - 1)[:nprobe]
+
+        # 查表：每个子空间内查询与各码字的内积
+        table = np.einsum("mkd,md->mk", self.codebooks, query.reshape(self.m, self.dsub)).ravel()
+
+        candidate_rows, candidate_scores = [], []
+        for list_id in probe:
+            start, end = self.offsets[list_id], self.offsets[list_id + 1]
+            if start == end:
+                continue
+            rows = self.rows[start:end]
+            codes = self.codes[start:end]
+            if mask is not None:
+                keep = mask[rows]
+                rows, codes = rows[keep], codes[keep]
+                if len(rows) == 0:
+                    continue
+            approx = coarse[list_id] + table[codes.astype(np.int64) + self._code_offsets].sum(axis=1)
+            candidate_rows.append(rows)
+            candidate_scores.append(approx)
+
+        if not candidate_rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        rows = np.concatenate(candidate_rows)
+        approx = np.concatenate(candidate_scores)
+        if len(rows) > shortlist:
+            keep = np.argpartition(-approx, shortlist - 1)[:shortlist]
+            rows = rows[keep]
+
+        # 精确重排（按行号顺序读取，减少随机IO）
+        rows = np.sort(rows).astype(np.int64)
+        exact = np.asarray(vectors[rows], dtype=np.float32) @ query
+
+        k = min(top_k, len(rows))
+        top = np.argpartition(-exact, k - 1)[:k]
+        top = top[np.argsort(-exact[top], kind="stable")]
+        return rows[top], exact[top]
+
+    def save(self, directory: str):
+        """保存索引到目录"""
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, self.CENTROIDS_FILE), self.centroids)
+        np.save(os.path.join(directory, self.CODEBOOKS_FILE), self.codebooks)
+        np.save(os.path.join(directory, self.CODES_FILE), self.codes)
+        np.save(os.path.join(directory, self.ROWS_FILE), self.rows)
+        np.save(os.path.join(directory, self.OFFSETS_FILE), self.offsets)
+        with open(os.path.join(directory, self.META_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def exists(cls, directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, cls.META_FILE))
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = False) -> "IVFPQIndex":
+        """从目录加载索引；编码默认读入内存（每个向量仅 m 字节）"""
+        mmap_mode = "r" if mmap else None
+        with open(os.path.join(directory, cls.META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(
+            centroids=np.load(os.path.join(directory, cls.CENTROIDS_FILE)),
+            codebooks=np.load(os.path.join(directory, cls.CODEBOOKS_FILE)),
+            codes=np.load(os.path.join(directory, cls.CODES_FILE), mmap_mode=mmap_mode),
+            rows=np.load(os.path.join(directory, cls.ROWS_FILE), mmap_mode=mmap_mode),
+            offsets=np.load(os.path.join(directory, cls.OFFSETS_FILE)),
+            meta=meta
+        )
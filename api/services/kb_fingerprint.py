@@ -0,0 +1,34 @@
+from typing import Dict, Any, List, Optional
+from datetime import datetime
+import os
+import json
+import hashlib
+
+def compute_fingerprint(chunks: List[Dict[str, Any]], settings: Optional[Dict[str, Any]] = None) -> str:
+    """根据文本块内容与构建参数计算知识库指纹
+
+    文本块按ID排序后逐个哈希，内容与参数不变时重新构建得到相同指纹，已缓存的回答继续有效。
+    """
+    digest = hashlib.sha1()
+    digest.update(json.dumps(settings or {}, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    for chunk in sorted(chunks, key=lambda c: c["id"]):
+        digest.update(chunk["id"].encode("utf-8"))
+        digest.update(hashlib.md5(chunk["text"].encode("utf-8")).digest())
+    return digest.hexdigest()[:16]
+
+def write_fingerprint(path: str, fingerprint: str, meta: Optional[Dict[str, Any]] = None):
+    """原子写入指纹文件（先写临时文件再替换）"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    data = dict(meta or {}, fingerprint=fingerprint, built_at=datetime.now().isoformat())
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def read_fingerprint(path: str) -> Optional[str]:
+    """读取指纹，文件不存在或损坏时返回 None"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("fingerprint")
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,247 @@
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+import time
+import json
+import hashlib
+import asyncio
+import logging
+
+from api.services.cache_service import CacheService
+
+logger = logging.getLogger(__name__)
+
+class FlightCancelledError(RuntimeError):
+    """生产者任务在完成前被取消"""
+    pass
+
+class Flight:
+    """一次共享的检索+生成
+
+    生产者按顺序发布事件，事件全部缓冲；订阅者先回放已有事件，再等待新事件，
+    因此中途加入的请求也能拿到完整输出。
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.events: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.source = "generated"
+        self.task: Optional[asyncio.Task] = None
+        self._condition = asyncio.Condition()
+
+    async def publish(self, event: Any):
+        async with self._condition:
+            self.events.append(event)
+            self._condition.notify_all()
+
+    async def finish(self, error: Optional[BaseException] = None):
+        async with self._condition:
+            self.done = True
+            self.error = error
+            self._condition.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[Any]:
+        """依次产出事件；生产者失败（或被取消）时在已发布事件之后抛出其异常"""
+        self.subscribers += 1
+        try:
+            index = 0
+            while True:
+                async with self._condition:
+                    while index >= len(self.events) and not self.done:
+                        await self._condition.wait()
+                    batch = self.events[index:]
+                    index = len(self.events)
+                    finished = self.done
+
+                for event in batch:
+                    yield event
+
+                if finished and index >= len(self.events):
+                    if self.error is not None:
+                        raise self.error
+                    return
+        finally:
+            self.subscribers -= 1
+
+    async def first(self) -> Any:
+        """等待第一个事件"""
+        async for event in self.subscribe():
+            return event
+        raise RuntimeError("生成任务未产生任何输出")
+
+Producer = Callable[[Flight], Awaitable[None]]
+CachedReplay = Callable[[Flight, Dict[str, Any]], Awaitable[None]]
+
+class RequestCoalescer:
+    """相同问题的并发请求合并（single-flight，应用级单实例）
+
+    进程内：同一键同一时间只运行一个生产者任务，其余请求订阅其事件。
+    生产者在独立任务中运行，发起请求的客户端断开不会中断其他订阅者。
+
+    跨进程：生产者开始前先获取Redis锁；锁已被其他工作进程持有时，
+    轮询回答缓存直到对方写入，锁提前释放（对方失败）时重新争抢，
+    等待超时后自行生成。Redis不可用时仅在进程内合并。
+    """
+
+    def __init__(
+        self,
+        cache_service: CacheService,
+        lock_ttl: float = 180,
+        poll_interval: float = 0.2,
+        wait_timeout: float = 60
+    ):
+        self.cache_service = cache_service
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self.wait_timeout = wait_timeout
+        self._flights: Dict[str, Flight] = {}
+
+        self.leaders = 0
+        self.followers = 0
+        self.remote_waits = 0
+        self.remote_hits = 0
+        self.remote_timeouts = 0
+        self.errors = 0
+
+    def join(
+        self,
+        question: str,
+        mode: str,
+        produce: Producer,
+        replay_cached: CachedReplay,
+        options: Optional[Dict[str, Any]] = None
+    ) -> Tuple[Flight, bool]:
+        """加入（或发起）问题对应的共享生成，返回 (flight, 是否为发起者)
+
+        mode 区分输出格式不同的调用方（如 chat / stream），两者的事件不能互相订阅；
+        options 为影响回答的请求参数（如 top_k、temperature），参数不同的请求不会合并。
+        """
+        answer_key = self.cache_service.answer_key(question)
+        key = f"{mode}:{answer_key}"
+        lock_name = f"{answer_key}:lock"
+        if options:
+            digest = hashlib.md5(json.dumps(options, sort_keys=True).encode()).hexdigest()
+            key = f"{key}:{digest}"
+            lock_name = f"{lock_name}:{digest}"
+
+        flight = self._flights.get(key)
+        if flight is not None and not flight.done:
+            self.followers += 1
+            return flight, False
+
+        flight = Flight(key)
+        self._flights[key] = flight
+        self.leaders += 1
+        flight.task = asyncio.create_task(self._run(flight, question, lock_name, produce, replay_cached))
+        return flight, True
+
+    def run_alone(self, produce: Producer) -> Flight:
+        """不参与合并，在独立的 flight 中运行生产者（供不使用缓存的请求复用同一套输出逻辑）"""
+        flight = Flight("private")
+        flight.task = asyncio.create_task(self._run_private(flight, produce))
+        return flight
+
+    async def _run_private(self, flight: Flight, produce: Producer):
+        try:
+            await produce(flight)
+            await flight.finish()
+        except Exception as e:
+            await flight.finish(e)
+        except BaseException:
+            await flight.finish(FlightCancelledError("生成任务已取消"))
+            raise
+
+    async def _run(
+        self,
+        flight: Flight,
+        question: str,
+        lock_name: str,
+        produce: Producer,
+        replay_cached: CachedReplay
+    ):
+        try:
+            if not self.cache_service.available:
+                await produce(flight)
+            else:
+                await self._run_with_lock(flight, question, lock_name, produce, replay_cached)
+            await flight.finish()
+        except Exception as e:
+            self.errors += 1
+            await flight.finish(e)
+        except BaseException:
+            # 生产者任务被取消（如应用关闭）：订阅者收到错误而不是一直等待
+            self.errors += 1
+            await flight.finish(FlightCancelledError("共享生成任务已取消"))
+            raise
+        finally:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    async def _run_with_lock(
+        self,
+        flight: Flight,
+        question: str,
+        lock_name: str,
+        produce: Producer,
+        replay_cached: CachedReplay
+    ):
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+
+        while True:
+            lock = None
+            try:
+                lock = self.cache_service.client.lock(lock_name, timeout=self.lock_ttl)
+                acquired = await lock.acquire(blocking=False)
+            except Exception as e:
+                logger.warning(f"获取合并锁失败，仅在进程内合并: {e}")
+                lock, acquired = None, True
+
+            if acquired:
+                try:
+                    await produce(flight)
+                finally:
+                    if lock is not None:
+                        try:
+                            await lock.release()
+                        except Exception:
+                            pass
+                return
+
+            # 其他工作进程正在生成：轮询回答缓存
+            if not waited:
+                waited = True
+                self.remote_waits += 1
+            while time.monotonic() < deadline:
+                await asyncio.sleep(self.poll_interval)
+                cached = await self.cache_service.get_cached_answer(question)
+                if cached:
+                    self.remote_hits += 1
+                    flight.source = "remote"
+                    await replay_cached(flight, cached)
+                    return
+                try:
+                    if not await self.cache_service.client.exists(lock_name):
+                        break  # 对方已结束但未写入缓存，重新争抢
+                except Exception:
+                    break
+            else:
+                self.remote_timeouts += 1
+                logger.warning("等待其他工作进程生成回答超时，自行生成")
+                await produce(flight)
+                return
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取合并统计信息"""
+        total = self.leaders + self.followers
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "coalesced_rate": self.followers / total if total else 0.0,
+            "remote_waits": self.remote_waits,
+            "remote_hits": self.remote_hits,
+            "remote_timeouts": self.remote_timeouts,
+            "errors": self.errors
+        }
@@ -0,0 +1,200 @@
+from typing import List, Dict, Any, Optional
+import os
+import hashlib
+import time
+import threading
+import warnings
+import logging
+
+from config import config
+from api.services.embedding_backend import plan_length_buckets
+from api.utils.lru_cache import LRUCache
+from api.utils.text import normalize_text
+
+logger = logging.getLogger(__name__)
+
+class CrossEncoderReranker:
+    """交叉编码器重排序
+
+    对 (查询, 文本块) 成对打分：候选按token长度分桶批量前向计算，
+    打分结果按 (规范化查询（NFKC与空白折叠，保留大小写）, 文本块ID) 缓存，重复查询只计算新出现的文本块；
+    打分时同样使用规范化查询，缓存命中与重新计算的得分一致。
+    """
+
+    def __init__(
+        self,
+        model_source: Optional[str] = None,
+        local_files_only: Optional[bool] = None,
+        batch_size: int = 16,
+        max_length: int = 512,
+        token_budget: int = 8192,
+        num_threads: int = 0,
+        cache_size: int = 10000,
+        cache_ttl: Optional[float] = None
+    ):
+        import torch
+        from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+        if model_source is None:
+            local = os.path.exists(config.RERANK_MODEL_PATH)
+            model_source = config.RERANK_MODEL_PATH if local else config.RERANK_MODEL
+            if local_files_only is None:
+                local_files_only = local
+
+        self.model_source = model_source
+        self.batch_size = max(1, batch_size)
+        self.max_length = max_length
+        self.token_budget = token_budget
+        self.device = torch.device("cpu")
+
+        if num_threads > 0:
+            torch.set_num_threads(num_threads)
+
+        print(f"正在加载重排序模型: {model_source}")
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', message='.*fix_mistral_regex.*')
+            self.tokenizer = AutoTokenizer.from_pretrained(model_source, local_files_only=bool(local_files_only))
+        self.model = AutoModelForSequenceClassification.from_pretrained(
+            model_source, local_files_only=bool(local_files_only)
+        ).to(self.device)
+        self.model.eval()
+        print("重排序模型加载完成")
+
+        self._cache = LRUCache(max_size=cache_size, ttl=cache_ttl) if cache_size > 0 else None
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._scored = 0
+        self._budget_exhausted = 0
+        self._total_time = 0.0
+
+    def score(self, query: str, texts: List[str], deadline: Optional[float] = None) -> List[Optional[float]]:
+        """批量计算相关性得分
+
+        deadline 为 time.perf_counter() 时刻，超过后不再计算后续批次，
+        未计算的位置返回 None（至少计算一批）。
+        """
+        if not texts:
+            return []
+
+        encoded = self.tokenizer(
+            [query] * len(texts),
+            texts,
+            padding=False,
+            truncation="only_second",
+            max_length=self.max_length
+        )
+        lengths = [len(ids) for ids in encoded["input_ids"]]
+        # 分桶按长度降序，较长的文本块通常信息量更大，预算不足时优先保证其得分
+        batches = list(plan_length_buckets(lengths, self.token_budget, self.batch_size))
+
+        scores: List[Optional[float]] = [None] * len(texts)
+        for batch_index, batch in enumerate(batches):
+            if batch_index > 0 and deadline is not None and time.perf_counter() >= deadline:
+                with self._stats_lock:
+                    self._budget_exhausted += 1
+                break
+
+            batch_scores = self._score_batch({key: [encoded[key][i] for i in batch] for key in encoded.keys()})
+            for i, value in zip(batch, batch_scores):
+                scores[i] = float(value)
+
+        return scores
+
+    def _score_batch(self, features: Dict[str, List[List[int]]]) -> List[float]:
+        """对一批已分词的 (查询, 文本块) 对做一次前向计算"""
+        import torch
+
+        padded = self.tokenizer.pad(features, return_tensors="pt")
+        with torch.no_grad():
+            logits = self.model(**{key: value.to(self.device) for key, value in padded.items()}).logits
+        return logits.view(-1).float().cpu().numpy().tolist()
+
+    def rerank(
+        self,
+        query: str,
+        results: List[Dict[str, Any]],
+        top_k: int,
+        budget_ms: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """对检索结果重排序并保留前 top_k 个
+
+        每个结果增加 rerank_score；预算内未能打分的结果排在已打分结果之后，保持原有顺序。
+        """
+        start = time.perf_counter()
+        # 预算从进入重排序时开始计算（包含分词耗时），0 表示预算已用尽，只计算一批
+        deadline = start + budget_ms / 1000.0 if budget_ms is not None else None
+        key_query = normalize_text(query)
+        # 缓存键包含文本摘要：知识库重建后同一ID的文本变化时不会命中旧得分
+        keys = [
+            (key_query, result["id"], hashlib.md5(result["text"].encode("utf-8")).hexdigest())
+            for result in results
+        ]
+
+        scores: List[Optional[float]] = [None] * len(results)
+        pending = []
+        for i, result in enumerate(results):
+            cached = self._cache.get(keys[i]) if self._cache is not None else None
+            if cached is not None:
+                scores[i] = cached
+            else:
+                pending.append(i)
+
+        if pending:
+            new_scores = self.score(key_query, [results[i]["text"] for i in pending], deadline)
+            for i, value in zip(pending, new_scores):
+                if value is None:
+                    continue
+                scores[i] = value
+                if self._cache is not None:
+                    self._cache.set(keys[i], value)
+
+        order = sorted(
+            range(len(results)),
+            key=lambda i: (scores[i] is None, -(scores[i] or 0.0), i)
+        )
+
+        reranked = []
+        for i in order[:top_k]:
+            result = results[i]
+            result["rerank_score"] = scores[i]
+            result["rank"] = len(reranked) + 1
+            reranked.append(result)
+
+        with self._stats_lock:
+            self._requests += 1
+            self._scored += sum(1 for i in pending if scores[i] is not None)
+            self._total_time += time.perf_counter() - start
+
+        return reranked
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取重排序统计信息"""
+        with self._stats_lock:
+            stats = {
+                "model": self.model_source,
+                "requests": self._requests,
+                "scored_pairs": self._scored,
+                "budget_exhausted": self._budget_exhausted,
+                "avg_latency_ms": self._total_time / self._requests * 1000 if self._requests else 0.0
+            }
+        stats["score_cache"] = self._cache.get_stats() if self._cache is not None else None
+        return stats
+
+_reranker: Optional[CrossEncoderReranker] = None
+_reranker_lock = threading.Lock()
+
+def get_reranker() -> CrossEncoderReranker:
+    """获取进程内共享的重排序模型"""
+    global _reranker
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = CrossEncoderReranker(
+                    batch_size=config.RERANK_BATCH_SIZE,
+                    max_length=config.RERANK_MAX_LENGTH,
+                    token_budget=config.RERANK_TOKEN_BUDGET,
+                    num_threads=config.EMBEDDING_NUM_THREADS,
+                    cache_size=config.RERANK_CACHE_SIZE,
+                    cache_ttl=config.RERANK_CACHE_TTL or None
+                )
+    return _reranker
@@ -0,0 +1,167 @@
+from typing import Dict, Any, Optional, Tuple
+import time
+import threading
+import numpy as np
+
+from config import config
+from api.utils.text import normalize_query
+
+class SemanticCache:
+    """语义回答缓存
+
+    问题向量保存在预分配的进程内矩阵中，查询时与全部有效条目做一次矩阵乘法，
+    取余弦相似度最高且不低于阈值的条目作为命中。容量满时淘汰最久未命中的条目，
+    相同（规范化后）问题重复写入时覆盖原条目。
+    """
+
+    def __init__(
+        self,
+        max_size: int = 2000,
+        threshold: float = 0.92,
+        ttl: Optional[float] = None,
+        dtype: str = "float32"
+    ):
+        self.max_size = max(1, max_size)
+        self.threshold = threshold
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.float16, np.float32):
+            raise ValueError(f"不支持的语义缓存精度: {dtype}，可选值: float16, float32")
+
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._valid = np.zeros(self.max_size, dtype=bool)
+        self._expires_at = np.full(self.max_size, np.inf)
+        self._last_used = np.zeros(self.max_size)
+        self._answers: Dict[int, Dict[str, Any]] = {}
+        self._slots: Dict[str, int] = {}
+        self._questions: Dict[int, str] = {}
+
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._hit_similarity = 0.0
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _release(self, slot: int):
+        self._valid[slot] = False
+        self._answers.pop(slot, None)
+        question = self._questions.pop(slot, None)
+        if question is not None:
+            self._slots.pop(question, None)
+
+    def _expire(self, now: float):
+        expired = np.flatnonzero(self._valid & (self._expires_at <= now))
+        for slot in expired:
+            self._release(int(slot))
+        self.expirations += len(expired)
+
+    def lookup(self, vector: np.ndarray) -> Optional[Tuple[Dict[str, Any], float]]:
+        """查找语义相近的已缓存回答，返回 (回答, 相似度)"""
+        query = self._normalize(vector)
+        now = time.monotonic()
+
+        with self._lock:
+            self.lookups += 1
+            if self._vectors is None or self._vectors.shape[1] != len(query) or not self._valid.any():
+                return None
+
+            self._expire(now)
+            similarities = self._vectors @ query.astype(self.dtype)
+            similarities = np.where(self._valid, similarities.astype(np.float32), -np.inf)
+            slot = int(np.argmax(similarities))
+            similarity = float(similarities[slot])
+            if similarity < self.threshold:
+                return None
+
+            self._last_used[slot] = now
+            self.hits += 1
+            self._hit_similarity += similarity
+            return self._answers[slot], similarity
+
+    def add(self, question: str, vector: np.ndarray, answer: Dict[str, Any], ttl: Optional[float] = None):
+        """缓存问题向量与回答"""
+        vector = self._normalize(vector)
+        key = normalize_query(question)
+        ttl = self.ttl if ttl is None else ttl
+        now = time.monotonic()
+
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != len(vector):
+                # 首次写入或嵌入模型维度变化时重新分配
+                self._vectors = np.zeros((self.max_size, len(vector)), dtype=self.dtype)
+                self._valid[:] = False
+                self._answers.clear()
+                self._slots.clear()
+                self._questions.clear()
+
+            slot = self._slots.get(key)
+            if slot is None:
+                self._expire(now)
+                free = np.flatnonzero(~self._valid)
+                if len(free):
+                    slot = int(free[0])
+                else:
+                    # 淘汰最久未命中的条目
+                    slot = int(np.argmin(self._last_used))
+                    self._release(slot)
+                    self.evictions += 1
+
+            self._vectors[slot] = vector
+            self._valid[slot] = True
+            self._expires_at[slot] = now + ttl if ttl else np.inf
+            self._last_used[slot] = now
+            self._answers[slot] = answer
+            self._slots[key] = slot
+            self._questions[slot] = key
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._valid[:] = False
+            self._answers.clear()
+            self._slots.clear()
+            self._questions.clear()
+
+    def __len__(self) -> int:
+        return int(self._valid.sum())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            return {
+                "size": int(self._valid.sum()),
+                "max_size": self.max_size,
+                "threshold": self.threshold,
+                "ttl": self.ttl,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "misses": self.lookups - self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "avg_hit_similarity": self._hit_similarity / self.hits if self.hits else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+_semantic_cache: Optional[SemanticCache] = None
+_semantic_cache_lock = threading.Lock()
+
+def get_semantic_cache() -> SemanticCache:
+    """获取进程内共享的语义回答缓存"""
+    global _semantic_cache
+    if _semantic_cache is None:
+        with _semantic_cache_lock:
+            if _semantic_cache is None:
+                _semantic_cache = SemanticCache(
+                    max_size=config.SEMANTIC_CACHE_SIZE,
+                    threshold=config.SEMANTIC_CACHE_THRESHOLD,
+                    ttl=config.SEMANTIC_CACHE_TTL or None,
+                    dtype=config.SEMANTIC_CACHE_DTYPE
+                )
+    return _semantic_cache
@@ -0,0 +1,181 @@
+from typing import Any, AsyncIterator, Callable, List, Optional
+import asyncio
+
+_DONE = b"[DONE]"
+
+class LineDecoder:
+    """从原始字节块中增量切分行
+
+    网络读取的边界与行边界无关，不完整的行留在缓冲区等待后续数据；
+    按字节切分后再解码，多字节UTF-8字符被截断在两次读取之间也不会出错。
+    """
+
+    def __init__(self):
+        self._buffer = b""
+
+    def feed(self, data: bytes) -> List[bytes]:
+        """追加数据，返回其中所有完整的行（去掉行尾的 \\r\\n / \\n）"""
+        if self._buffer:
+            data = self._buffer + data
+        lines = data.split(b"\n")
+        self._buffer = lines.pop()
+        return lines
+
+    def flush(self) -> List[bytes]:
+        """流结束时返回最后一行（没有换行结尾时）"""
+        rest, self._buffer = self._buffer, b""
+        return [rest] if rest.strip() else []
+
+class SSEDataDecoder:
+    """增量解析 SSE 流中的 data 字段，返回每个事件的原始负载字节
+
+    只处理单行 data（OpenAI 兼容接口的格式），忽略注释、event/id 等字段与空行；
+    遇到 data: [DONE] 后 done 为 True。
+    """
+
+    def __init__(self):
+        self._lines = LineDecoder()
+        self.done = False
+
+    def _payloads(self, lines: List[bytes]) -> List[bytes]:
+        payloads = []
+        for line in lines:
+            if not line.startswith(b"data:"):
+                continue
+            payload = line[5:].strip()
+            if payload == _DONE:
+                self.done = True
+                break
+            if payload:
+                payloads.append(payload)
+        return payloads
+
+    def feed(self, data: bytes) -> List[bytes]:
+        if self.done:
+            return []
+        return self._payloads(self._lines.feed(data))
+
+    def flush(self) -> List[bytes]:
+        if self.done:
+            return []
+        return self._payloads(self._lines.flush())
+
+class NDJSONDecoder:
+    """增量解析按行分隔的JSON流（Ollama），返回每行的原始字节"""
+
+    def __init__(self):
+        self._lines = LineDecoder()
+
+    def feed(self, data: bytes) -> List[bytes]:
+        return [line for line in self._lines.feed(data) if line.strip()]
+
+    def flush(self) -> List[bytes]:
+        return self._lines.flush()
+
+async def iter_stream_content(
+    chunks: AsyncIterator[bytes],
+    decoder,
+    loads: Callable[[bytes], Any],
+    extract: Callable[[Any], Optional[str]]
+) -> AsyncIterator[str]:
+    """从原始字节块中解析文本增量
+
+    同一次网络读取中解析出的所有增量合并为一个输出块，减少下游的逐token开销；
+    无法解析的负载被跳过。extract 从解析后的对象中取出文本，返回 None 表示没有内容；
+    抛出 StopIteration 表示流已结束（如 Ollama 的 done 标记）。
+    """
+    finished = False
+    async for data in chunks:
+        parts = []
+        for payload in decoder.feed(data):
+            try:
+                content = extract(loads(payload))
+            except StopIteration:
+                finished = True
+                break
+            except ValueError:
+                continue
+            if content:
+                parts.append(content)
+        if parts:
+            yield "".join(parts)
+        if finished or getattr(decoder, "done", False):
+            return
+
+    parts = []
+    for payload in decoder.flush():
+        try:
+            content = extract(loads(payload))
+        except (StopIteration, ValueError):
+            continue
+        if content:
+            parts.append(content)
+    if parts:
+        yield "".join(parts)
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+_END = object()
+
+async def coalesce_chunks(
+    source: AsyncIterator[str],
+    window: float = 0.02,
+    max_chars: int = 0
+) -> AsyncIterator[str]:
+    """把文本增量合并为较少的输出帧
+
+    第一个增量立即输出（不增加首字延迟）；之后每帧在收到第一个增量后等待 window 秒，
+    合并期间到达的所有增量，累计达到 max_chars 个字符时提前输出。
+    window 为 0 时不合并。上游在独立任务中读取，合并输出被关闭时上游一并取消。
+    """
+    if window <= 0:
+        async for chunk in source:
+            yield chunk
+        return
+
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for chunk in source:
+                queue.put_nowait(chunk)
+            queue.put_nowait(_END)
+        except Exception as e:
+            queue.put_nowait(_Failure(e))
+
+    task = asyncio.create_task(pump())
+    first = True
+    try:
+        while True:
+            item = await queue.get()
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+
+            parts = [item]
+            size = len(item)
+            if not first and (not max_chars or size < max_chars):
+                # 等待窗口内的后续增量（每帧只休眠一次，没有逐token的计时开销）
+                await asyncio.sleep(window)
+            first = False
+
+            end = None
+            while not queue.empty() and (not max_chars or size < max_chars):
+                item = queue.get_nowait()
+                if item is _END or isinstance(item, _Failure):
+                    end = item
+                    break
+                parts.append(item)
+                size += len(item)
+
+            yield "".join(parts)
+            if end is _END:
+                return
+            if end is not None:
+                raise end.error
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
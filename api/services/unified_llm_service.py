@@ -1,9 +1,16 @@
 # api/services/unified_llm_service.py
-from typing import Dict, List, Any, AsyncGenerator, Optional
+from typing import Dict, List, Any, AsyncGenerator, Callable, Optional, Iterable
 from enum import Enum
 import aiohttp
-import json
+import asyncio
+import random
+import time
 from config import config
+from api.services.backend_health import BackendHealth, CircuitBreaker, HedgeStats
+from api.services.backend_limiter import BackendLimiter, BackendBusyError, Permit
+from api.services.stream_relay import SSEDataDecoder, NDJSONDecoder, iter_stream_content
+from api.utils.text import estimate_tokens
+from api.utils.json_codec import get_json_codec
 import logging
 
 logger = logging.getLogger(__name__)
@@ -13,10 +20,83 @@ class LLMBackend(Enum):
     OLLAMA = "ollama"
     QWEN = "qwen"
 
+def _openai_delta(data: Dict[str, Any]) -> Optional[str]:
+    """OpenAI兼容接口流式响应中的文本增量"""
+    choices = data.get("choices")
+    if choices:
+        return (choices[0].get("delta") or {}).get("content")
+    return None
+
+def _ollama_delta(data: Dict[str, Any]) -> Optional[str]:
+    """Ollama流式响应中的文本增量，done 标记表示结束"""
+    if data.get("done", False):
+        raise StopIteration
+    return (data.get("message") or {}).get("content")
+
+class _Attempt:
+    """一次后端调用，在后台任务中等待第一个输出块；持有该后端的准入直到调用结束"""
+
+    def __init__(
+        self,
+        backend: LLMBackend,
+        stream: AsyncGenerator[str, None],
+        limiter: BackendLimiter,
+        permit: Permit,
+        hedge: bool = False
+    ):
+        self.backend = backend
+        self.stream = stream
+        self.limiter = limiter
+        self.permit = permit
+        self.hedge = hedge
+        self.output_tokens = 0
+        self.start = time.perf_counter()
+        self.first = asyncio.create_task(self._next())
+
+    async def _next(self) -> Optional[str]:
+        """返回第一个输出块，后端没有任何输出时返回 None"""
+        try:
+            return await self.stream.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    def release(self, used_tokens: Optional[float] = None):
+        self.limiter.release(self.permit, used_tokens, time.perf_counter() - self.start)
+
+    async def cancel(self):
+        self.first.cancel()
+        await asyncio.gather(self.first, return_exceptions=True)
+        await self.stream.aclose()
+        self.release()
+
 class UnifiedLLMService:
-    """统一LLM服务，支持热切换"""
+    """统一LLM服务，支持热切换（单例模式）
+
+    后台探测任务定期检查各后端，与实际请求一起维护滚动延迟分位数、错误率与熔断器。
+    路由策略 fixed（默认）优先使用 current_backend，其熔断时按 DeepSeek、Qwen、Ollama 的顺序
+    临时切换到可用后端，恢复后自动切回；fastest 选择请求延迟最低的可用后端，并以少量请求探索其他后端。
+
+    每个后端有独立的并发与token速率限制，超出时在有界的先进先出队列中等待，
+    队列已满或等待超时抛出 BackendBusyError。
+
+    开启对冲（LLM_HEDGE_ENABLED）时，主后端在对冲延迟内未产生首个输出则向另一个可用后端
+    发送相同请求，先产生输出的一方胜出，另一方被取消。
+    """
+
+    _instance = None
+    # fixed 路由下 current_backend 之后的备用顺序（与原有的自动切换顺序一致）
+    PREFERENCE_ORDER = (LLMBackend.DEEPSEEK, LLMBackend.QWEN, LLMBackend.OLLAMA)
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
 
     def __init__(self):
+        if self._initialized:
+            return
+
         # 从环境变量或配置文件读取当前模式
         self.current_backend = self._detect_backend()
         logger.info(f"当前LLM后端: {self.current_backend.value}")
@@ -27,6 +107,8 @@ class UnifiedLLMService:
                 "base_url": config.DEEPSEEK_API_BASE,
                 "model": config.DEEPSEEK_MODEL,
                 "api_key": config.DEEPSEEK_API_KEY,
+                "max_concurrency": config.DEEPSEEK_MAX_CONCURRENCY,
+                "tokens_per_minute": config.DEEPSEEK_TOKENS_PER_MINUTE,
                 "headers": lambda: {
                     "Authorization": f"Bearer {config.DEEPSEEK_API_KEY}",
                     "Content-Type": "application/json"
@@ -36,6 +118,8 @@ class UnifiedLLMService:
                 "base_url": config.QWEN_API_BASE,
                 "model": config.QWEN_MODEL,
                 "api_key": config.QWEN_API_KEY,
+                "max_concurrency": config.QWEN_MAX_CONCURRENCY,
+                "tokens_per_minute": config.QWEN_TOKENS_PER_MINUTE,
                 "headers": lambda: {
                     "Authorization": f"Bearer {config.QWEN_API_KEY}",
                     "Content-Type": "application/json"
@@ -45,6 +129,8 @@ class UnifiedLLMService:
                 "base_url": config.OLLAMA_BASE_URL,
                 "model": config.OLLAMA_MODEL,
                 "api_key": None,
+                "max_concurrency": config.OLLAMA_MAX_CONCURRENCY,
+                "tokens_per_minute": config.OLLAMA_TOKENS_PER_MINUTE,
                 "headers": lambda: {"Content-Type": "application/json"}
             }
         }
@@ -56,10 +142,88 @@ class UnifiedLLMService:
             LLMBackend.OLLAMA: False
         }
 
+        # 滚动健康统计与熔断器
+        self.routing = config.LLM_ROUTING
+        self.explorations = 0
+        self.health = {
+            backend: BackendHealth(
+                backend.value,
+                window=config.LLM_HEALTH_WINDOW,
+                breaker=CircuitBreaker(
+                    failure_threshold=config.LLM_BREAKER_FAILURES,
+                    error_rate_threshold=config.LLM_BREAKER_ERROR_RATE,
+                    min_samples=config.LLM_BREAKER_MIN_SAMPLES,
+                    cooldown=config.LLM_BREAKER_COOLDOWN
+                )
+            )
+            for backend in LLMBackend
+        }
+        self._probe_task: Optional[asyncio.Task] = None
+        self.json = get_json_codec(config.JSON_CODEC)
+        self.hedge_stats = HedgeStats(window=config.LLM_HEALTH_WINDOW)
+
+        # 并发与token速率限制
+        self.limiters = {
+            backend: BackendLimiter(
+                backend.value,
+                max_concurrency=self.configs[backend]["max_concurrency"],
+                tokens_per_minute=self.configs[backend]["tokens_per_minute"],
+                max_queue=config.LLM_QUEUE_SIZE,
+                queue_timeout=config.LLM_QUEUE_TIMEOUT,
+                window=config.LLM_HEALTH_WINDOW
+            )
+            for backend in LLMBackend
+        }
+
         # 初始化时不自动检测(避免阻塞启动)
-        # 将在第一次调用时检测
+        # 由应用启动预热或第一次调用时检测
         self._backends_checked = False
 
+        # 每个后端一个长连接会话（复用TCP/TLS连接），在应用生命周期内创建与关闭
+        self.sessions: Dict[LLMBackend, aiohttp.ClientSession] = {}
+        self._initialized = True
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=config.LLM_POOL_LIMIT,
+            limit_per_host=config.LLM_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=config.LLM_KEEPALIVE_TIMEOUT,
+            use_dns_cache=True,
+            ttl_dns_cache=config.LLM_DNS_CACHE_TTL,
+            enable_cleanup_closed=True
+        )
+        return aiohttp.ClientSession(connector=connector)
+
+    async def start(self):
+        """为各后端创建共享会话并启动后台探测"""
+        for backend in LLMBackend:
+            session = self.sessions.get(backend)
+            if session is None or session.closed:
+                self.sessions[backend] = self._create_session()
+        if self._probe_task is None and config.LLM_PROBE_INTERVAL > 0:
+            self._probe_task = asyncio.create_task(self._probe_loop())
+
+    async def close(self):
+        """停止后台探测并关闭所有会话"""
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+            self._probe_task = None
+        for session in self.sessions.values():
+            if not session.closed:
+                await session.close()
+        self.sessions.clear()
+
+    def _get_session(self, backend: LLMBackend) -> aiohttp.ClientSession:
+        """获取后端的共享会话；未在生命周期内创建时（如脚本中直接调用）按需创建"""
+        session = self.sessions.get(backend)
+        if session is None or session.closed:
+            session = self.sessions[backend] = self._create_session()
+        return session
+
     def _detect_backend(self) -> LLMBackend:
         """自动检测最佳后端"""
         backend_name = config.LLM_BACKEND.lower()
@@ -86,56 +250,209 @@ class UnifiedLLMService:
         logger.warning("未检测到任何API密钥,默认使用Ollama(需要本地安装)")
         return LLMBackend.OLLAMA
 
+    async def check_backends(self) -> Dict[str, bool]:
+        """探测各后端并返回健康状态"""
+        await self.probe_backends()
+        self._backends_checked = True
+        return {backend.value: healthy for backend, healthy in self.backend_health.items()}
+
     async def _check_backends(self):
-        """检查各后端健康状态"""
+        """首次调用时探测一次各后端"""
         if self._backends_checked:
             return
+        await self.check_backends()
+        logger.info(f"后端健康状态: {[(k.value, v) for k, v in self.backend_health.items()]}")
 
-        timeout = aiohttp.ClientTimeout(total=5)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            # 检查Ollama
+    def is_configured(self, backend: LLMBackend) -> bool:
+        """API后端需要配置密钥，Ollama需要配置地址"""
+        if backend == LLMBackend.OLLAMA:
+            return bool(self.configs[backend]["base_url"])
+        return bool(self.configs[backend]["api_key"])
+
+    async def _probe(self, backend: LLMBackend):
+        """探测单个后端：Ollama 请求 /api/tags，OpenAI兼容接口请求 /models（同时校验密钥）"""
+        backend_config = self.configs[backend]
+        if backend == LLMBackend.OLLAMA:
+            url = backend_config["base_url"] + "/api/tags"
+        else:
+            url = backend_config["base_url"] + "/models"
+
+        # 熔断器半开时由探测承担试探：成功则关闭，失败则重新打开；其他状态下探测不影响熔断器
+        trial = self.health[backend].breaker.try_trial()
+        start = time.perf_counter()
+        try:
+            async with self._get_session(backend).get(
+                url,
+                headers=backend_config["headers"](),
+                timeout=aiohttp.ClientTimeout(total=config.LLM_PROBE_TIMEOUT)
+            ) as response:
+                await response.read()
+                if response.status != 200:
+                    raise Exception(f"HTTP {response.status}")
+            self.health[backend].record_probe(True, time.perf_counter() - start, trial=trial)
+        except asyncio.CancelledError:
+            if trial:
+                self.health[backend].breaker.release()
+            raise
+        except Exception as e:
+            self.health[backend].record_probe(False, error=str(e) or type(e).__name__, trial=trial)
+            logger.debug(f"{backend.value} 探测失败: {e}")
+        self._update_backend_health(backend)
+
+    async def probe_backends(self):
+        """并发探测所有已配置的后端"""
+        backends = [backend for backend in LLMBackend if self.is_configured(backend)]
+        await asyncio.gather(*(self._probe(backend) for backend in backends))
+
+    async def _probe_loop(self):
+        while True:
+            await asyncio.sleep(config.LLM_PROBE_INTERVAL)
             try:
-                async with session.get(
-                    self.configs[LLMBackend.OLLAMA]["base_url"] + "/api/tags"
-                ) as response:
-                    self.backend_health[LLMBackend.OLLAMA] = response.status == 200
-                    if response.status == 200:
-                        logger.info("Ollama后端可用")
+                await self.probe_backends()
             except Exception as e:
-                self.backend_health[LLMBackend.OLLAMA] = False
-                logger.debug(f"Ollama不可用: {e}")
-
-            # API后端通过密钥判断
-            self.backend_health[LLMBackend.DEEPSEEK] = bool(
-                self.configs[LLMBackend.DEEPSEEK]["api_key"] and
-                self.configs[LLMBackend.DEEPSEEK]["api_key"] != ""
-            )
-            self.backend_health[LLMBackend.QWEN] = bool(
-                self.configs[LLMBackend.QWEN]["api_key"] and
-                self.configs[LLMBackend.QWEN]["api_key"] != ""
+                logger.warning(f"LLM后端探测失败: {e}")
+
+    def _update_backend_health(self, backend: LLMBackend):
+        previous = self.backend_health[backend]
+        health = self.health[backend]
+        healthy = (
+            self.is_configured(backend)
+            and health.breaker.state != CircuitBreaker.OPEN
+            and health.breaker.consecutive_failures == 0
+            and health.last_probe_ok is not False
+        )
+        self.backend_health[backend] = healthy
+        if previous != healthy:
+            if healthy:
+                logger.info(f"LLM后端已恢复: {backend.value}")
+            else:
+                logger.warning(f"LLM后端异常: {backend.value}（{self.health[backend].last_error}）")
+
+    def _latency_key(self, stream: bool):
+        """fastest 路由的排序键：有足够同类请求样本的后端按自身的请求延迟排序
+        （流式为首个token延迟，非流式为完整耗时），排在样本不足的后端之前；探测延迟只用于打破平局
+        （/models、/api/tags 的延迟与生成延迟无关，不能单独决定路由）"""
+        def key(backend: LLMBackend):
+            health = self.health[backend]
+            latency = None
+            if health.request_samples(stream) >= config.LLM_ROUTING_MIN_SAMPLES:
+                latency = health.latency(50, "request", stream)
+            probe = health.latency(50, "probe")
+            # 最近一次探测失败的后端排在最后
+            return (
+                health.last_probe_ok is False,
+                latency is None,
+                latency or 0.0,
+                probe is None,
+                probe or 0.0
             )
+        return key
 
-        self._backends_checked = True
-        logger.info(f"后端健康状态: {[(k.value, v) for k, v in self.backend_health.items()]}")
+    def _preference_key(self, backend: LLMBackend):
+        """fixed 路由的排序键：current_backend 优先，其余按 DeepSeek、Qwen、Ollama 的顺序"""
+        return (
+            backend != self.current_backend,
+            self.health[backend].last_probe_ok is False,
+            self.PREFERENCE_ORDER.index(backend)
+        )
+
+    def rank_backends(
+        self,
+        exclude: Iterable[LLMBackend] = (),
+        stream: bool = True,
+        explore: bool = False
+    ) -> List[LLMBackend]:
+        """按路由策略排序当前可用的后端
+
+        explore 为 True 时（fastest 路由下的新请求），以 LLM_ROUTING_EXPLORE_RATE 的概率把一个
+        非首选后端提到最前，使其持续积累请求延迟样本，否则只有排第一的后端有样本、排序不再变化。
+        """
+        exclude = set(exclude)
+        candidates = [
+            backend for backend in LLMBackend
+            if backend not in exclude
+            and self.is_configured(backend)
+            and self.health[backend].breaker.can_attempt()
+        ]
+        if not candidates:
+            return []
+
+        if self.routing != "fastest":
+            return sorted(candidates, key=self._preference_key)
+
+        ranked = sorted(candidates, key=self._latency_key(stream))
+        explorable = [backend for backend in ranked[1:] if self.health[backend].last_probe_ok is not False]
+        if explore and explorable and random.random() < config.LLM_ROUTING_EXPLORE_RATE:
+            backend = random.choice(explorable)
+            ranked.remove(backend)
+            ranked.insert(0, backend)
+            self.explorations += 1
+        return ranked
+
+    def preferred_backend(self, stream: bool = True) -> LLMBackend:
+        """下一次请求将使用的后端（无可用后端时返回 current_backend）"""
+        ranked = self.rank_backends(stream=stream)
+        return ranked[0] if ranked else self.current_backend
+
+    def _try_admit(self, ranked: Iterable[LLMBackend], tokens: float):
+        """按给定顺序找一个不需排队即可放行的后端，返回 (后端, 准入)"""
+        for backend in ranked:
+            limiter = self.limiters[backend]
+            permit = limiter.try_acquire(tokens)
+            if permit is None:
+                continue
+            if self.health[backend].breaker.acquire():
+                return backend, permit
+            limiter.release(permit)
+        return None, None
+
+    async def _admit(self, exclude: Iterable[LLMBackend], tokens: float, stream: bool, explore: bool = False):
+        """选择后端并获取准入，返回 (后端, 准入)，没有可用后端时返回 (None, None)
+
+        fastest 路由先找能立即放行的后端，都需要排队时在排序最前的后端排队；
+        fixed 路由直接在首选后端排队。队列已满时依次尝试后面的后端，全部已满时抛出 BackendBusyError。
+        """
+        ranked = self.rank_backends(exclude, stream, explore)
+        if self.routing == "fastest":
+            backend, permit = self._try_admit(ranked, tokens)
+            if backend is not None:
+                return backend, permit
+
+        busy = None
+        for backend in ranked:
+            breaker = self.health[backend].breaker
+            if not breaker.acquire():
+                continue
+            try:
+                return backend, await self.limiters[backend].acquire(tokens)
+            except BaseException as e:
+                breaker.release()
+                if not isinstance(e, BackendBusyError):
+                    raise
+                if busy is None or e.retry_after < busy.retry_after:
+                    busy = e
+        if busy is not None:
+            raise busy
+        return None, None
+
+    def check_capacity(self):
+        """所有可用后端都已排满时立即抛出 BackendBusyError，供流式接口在开始输出前快速失败"""
+        limiters = [self.limiters[backend] for backend in self.rank_backends()]
+        if limiters and all(limiter.saturated() for limiter in limiters):
+            raise BackendBusyError(
+                "所有LLM后端繁忙，请稍后重试",
+                min(limiter.retry_after() for limiter in limiters)
+            )
 
     def switch_backend(self, backend: LLMBackend):
-        """手动切换后端"""
+        """手动切换后端：设为首选后端并改为 fixed 路由"""
         if self.backend_health.get(backend, False):
             self.current_backend = backend
+            self.routing = "fixed"
             logger.info(f"已切换到后端: {backend}")
             return True
         return False
 
-    def auto_switch_on_failure(self):
-        """失败时自动切换到备用后端"""
-        if not self.backend_health[self.current_backend]:
-            for backend, healthy in self.backend_health.items():
-                if healthy and backend != self.current_backend:
-                    self.current_backend = backend
-                    logger.warning(f"自动切换到备用后端: {backend}")
-                    return True
-        return False
-
     def build_rag_messages(
         self,
         question: str,
@@ -162,35 +479,210 @@ class UnifiedLLMService:
         messages: List[Dict[str, str]],
         temperature: float = 0.1,
         max_tokens: int = 2000,
-        stream: bool = False
+        stream: bool = False,
+        hedge: Optional[bool] = None,
+        on_backend: Optional[Callable[[LLMBackend], None]] = None
     ) -> AsyncGenerator[str, None]:
-        """统一生成接口,自动路由到当前后端"""
+        """统一生成接口,按路由策略选择后端
+
+        调用失败且尚未输出任何内容时切换到下一个可用后端；已输出部分内容后失败则直接抛出。
+        hedge 为 None 时按 LLM_HEDGE_ENABLED 决定是否对冲。
+        on_backend 在确定实际提供回答的后端（输出第一个块之前）时被调用。
+        """
 
         # 首次调用时检查后端
         await self._check_backends()
 
-        backend_config = self.configs[self.current_backend]
+        if hedge is None:
+            hedge = config.LLM_HEDGE_ENABLED
+        prompt_chars = sum(len(message.get("content") or "") for message in messages)
+        prompt_tokens = sum(estimate_tokens(message.get("content") or "") for message in messages)
+        # 与服务商的限流口径一致，按提示词加 max_tokens 预占额度，结束后按实际输出退还
+        request_tokens = prompt_tokens + max_tokens
+
+        tried = []
+        last_error = None
+        while True:
+            backend, permit = await self._admit(tried, request_tokens, stream, explore=not tried)
+            if backend is None:
+                if last_error is not None:
+                    raise Exception(f"{tried[-1].value}调用失败且无可用备用后端: {last_error}")
+                raise Exception("没有可用的LLM后端（均未配置或处于熔断状态）")
+            if tried:
+                logger.info(f"切换到备用后端: {backend.value}")
+            tried.append(backend)
+
+            attempt = _Attempt(
+                backend,
+                self._call_backend(backend, messages, temperature, max_tokens, stream),
+                self.limiters[backend],
+                permit
+            )
+            try:
+                if hedge:
+                    attempt, first = await self._first_chunk_hedged(
+                        attempt, tried, prompt_chars, request_tokens, messages, temperature, max_tokens, stream
+                    )
+                else:
+                    first = await self._first_chunk(attempt)
+            except Exception as e:
+                last_error = e
+                continue
 
-        if self.current_backend == LLMBackend.DEEPSEEK:
-            async for chunk in self._call_openai_compatible(
-                messages, temperature, max_tokens, stream, backend_config, "DeepSeek"
-            ):
-                yield chunk
+            first_token_latency = time.perf_counter() - attempt.start
+            if on_backend is not None:
+                on_backend(attempt.backend)
+            try:
+                if first is not None:
+                    attempt.output_tokens += estimate_tokens(first)
+                    yield first
+                async for chunk in attempt.stream:
+                    attempt.output_tokens += estimate_tokens(chunk)
+                    yield chunk
+            except Exception as e:
+                self._record_failure(attempt.backend, e)
+                raise
+            except BaseException:
+                # 客户端断开或任务被取消（GeneratorExit/CancelledError）：结果未知，不计成功或失败，
+                # 只记录已知的延迟下界并归还半开试探名额，否则该后端再也无法被试探
+                elapsed = first_token_latency if stream else time.perf_counter() - attempt.start
+                self.health[attempt.backend].record_censored(elapsed, stream)
+                self.health[attempt.backend].breaker.release()
+                raise
+            finally:
+                await attempt.stream.aclose()
+                attempt.release(prompt_tokens + attempt.output_tokens)
+
+            self.health[attempt.backend].record_request(True, first_token_latency, stream=stream)
+            self._update_backend_health(attempt.backend)
+            return
 
-        elif self.current_backend == LLMBackend.QWEN:
-            async for chunk in self._call_openai_compatible(
-                messages, temperature, max_tokens, stream, backend_config, "Qwen"
-            ):
-                yield chunk
+    def _record_failure(self, backend: LLMBackend, error: BaseException):
+        self.health[backend].record_request(False, error=str(error) or type(error).__name__)
+        self._update_backend_health(backend)
 
-        elif self.current_backend == LLMBackend.OLLAMA:
-            async for chunk in self._call_ollama(
-                messages, temperature, max_tokens, stream, backend_config
-            ):
-                yield chunk
+    async def _first_chunk(self, attempt: _Attempt) -> Optional[str]:
+        """等待第一个输出块，失败时记录并抛出"""
+        try:
+            return await attempt.first
+        except asyncio.CancelledError:
+            await attempt.cancel()
+            self.health[attempt.backend].breaker.release()
+            raise
+        except Exception as e:
+            attempt.release()
+            self._record_failure(attempt.backend, e)
+            raise
+
+    def hedge_delay(self, backend: LLMBackend, stream: bool = True) -> float:
+        """对冲延迟（秒）：同类请求样本足够时取其延迟的 LLM_HEDGE_PERCENTILE 分位数
+        （流式为首个token延迟，非流式为完整生成耗时），否则取 LLM_HEDGE_DELAY_MS
+        （非流式为 LLM_HEDGE_COMPLETION_DELAY_MS），且不小于 LLM_HEDGE_MIN_DELAY_MS"""
+        health = self.health[backend]
+        delay = None
+        if health.request_samples(stream) >= config.LLM_ROUTING_MIN_SAMPLES:
+            delay = health.latency(config.LLM_HEDGE_PERCENTILE, stream=stream)
+        if delay is None:
+            delay = (config.LLM_HEDGE_DELAY_MS if stream else config.LLM_HEDGE_COMPLETION_DELAY_MS) / 1000
+        return max(delay, config.LLM_HEDGE_MIN_DELAY_MS / 1000)
+
+    async def _first_chunk_hedged(
+        self,
+        primary: _Attempt,
+        tried: List[LLMBackend],
+        prompt_chars: int,
+        request_tokens: float,
+        messages, temperature, max_tokens, stream
+    ):
+        """主请求超过对冲延迟仍无输出时发起对冲请求，返回 (胜出的调用, 第一个输出块)
+
+        胜出方之外的调用被取消；全部失败时抛出最后一个错误。
+        对冲请求不排队：没有能立即放行的后端时不发起对冲。
+        """
+        delay = self.hedge_delay(primary.backend, stream)
+        self.hedge_stats.record_request(prompt_chars, delay)
+
+        attempts = {primary.first: primary}
+        hedge_pending = True
+        hedged = False
+        winner = None
+        last_error = None
+        try:
+            while attempts:
+                timeout = None
+                if hedge_pending:
+                    timeout = max(0.0, primary.start + delay - time.perf_counter())
+                done, _ = await asyncio.wait(attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # 超过对冲延迟仍无输出，向另一个可用后端发送相同请求
+                    hedge_pending = False
+                    backend, permit = self._try_admit(self.rank_backends(tried, stream), request_tokens)
+                    if backend is None:
+                        self.hedge_stats.skipped += 1
+                        continue
+                    tried.append(backend)
+                    logger.info(f"{primary.backend.value} 首个输出超过 {delay * 1000:.0f}ms，对冲请求 {backend.value}")
+                    hedge = _Attempt(
+                        backend,
+                        self._call_backend(backend, messages, temperature, max_tokens, stream),
+                        self.limiters[backend],
+                        permit,
+                        hedge=True
+                    )
+                    attempts[hedge.first] = hedge
+                    hedged = True
+                    self.hedge_stats.record_hedge(prompt_chars)
+                    continue
+
+                for task in done:
+                    attempt = attempts.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        winner = attempt
+                        first = task.result()
+                        break
+                    attempt.release()
+                    self._record_failure(attempt.backend, error)
+                    last_error = error
+                    if attempt is primary and hedge_pending:
+                        # 主请求在对冲前失败，交给外层切换后端
+                        raise error
+                if winner is not None:
+                    break
+        finally:
+            # 胜出方之外（或外部取消时全部）的调用都被取消
+            for attempt in list(attempts.values()):
+                if attempt is winner:
+                    continue
+                if winner is not None:
+                    self.health[attempt.backend].record_censored(time.perf_counter() - attempt.start, stream)
+                    self.hedge_stats.cancelled += 1
+                await attempt.cancel()
+                self.health[attempt.backend].breaker.release()
+
+        if winner is None:
+            raise last_error
+        if winner.hedge:
+            self.hedge_stats.hedge_wins += 1
+        elif hedged:
+            self.hedge_stats.primary_wins += 1
+        return winner, first
+
+    def _call_backend(self, backend: LLMBackend, messages, temperature, max_tokens, stream):
+        backend_config = self.configs[backend]
+        if backend == LLMBackend.DEEPSEEK:
+            return self._call_openai_compatible(
+                messages, temperature, max_tokens, stream, backend_config, "DeepSeek", backend
+            )
+        if backend == LLMBackend.QWEN:
+            return self._call_openai_compatible(
+                messages, temperature, max_tokens, stream, backend_config, "Qwen", backend
+            )
+        return self._call_ollama(messages, temperature, max_tokens, stream, backend_config)
 
     async def _call_openai_compatible(
-        self, messages, temperature, max_tokens, stream, config, backend_name: str
+        self, messages, temperature, max_tokens, stream, config, backend_name: str, backend: LLMBackend
     ):
         """调用OpenAI兼容的API (DeepSeek, Qwen, OpenAI)"""
         payload = {
@@ -203,50 +695,36 @@ class UnifiedLLMService:
 
         try:
             timeout = aiohttp.ClientTimeout(total=60)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(
-                    f"{config['base_url']}/chat/completions",
-                    json=payload,
-                    headers=config["headers"]()
-                ) as response:
-
-                    if response.status != 200:
-                        error_text = await response.text()
-                        logger.error(f"{backend_name} API错误 ({response.status}): {error_text}")
-                        raise Exception(f"{backend_name} API返回错误: {response.status}")
-
-                    if stream:
-                        async for line in response.content:
-                            if line:
-                                chunk = line.decode('utf-8').strip()
-                                if chunk.startswith("data: "):
-                                    if chunk == "data: [DONE]":
-                                        break
-                                    try:
-                                        data = json.loads(chunk[6:])
-                                        if "choices" in data and data["choices"]:
-                                            delta = data["choices"][0].get("delta", {})
-                                            if "content" in delta:
-                                                yield delta["content"]
-                                    except json.JSONDecodeError:
-                                        continue
+            session = self._get_session(backend)
+            async with session.post(
+                f"{config['base_url']}/chat/completions",
+                data=self.json.dumps(payload).encode("utf-8"),
+                headers=config["headers"](),
+                timeout=timeout
+            ) as response:
+
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.error(f"{backend_name} API错误 ({response.status}): {error_text}")
+                    raise Exception(f"{backend_name} API返回错误: {response.status}")
+
+                if stream:
+                    # 按原始字节块增量解析，同一次读取中的增量合并输出
+                    async for content in iter_stream_content(
+                        response.content.iter_any(), SSEDataDecoder(), self.json.loads, _openai_delta
+                    ):
+                        yield content
+                else:
+                    data = self.json.loads(await response.read())
+                    if "choices" in data and data["choices"]:
+                        yield data["choices"][0]["message"]["content"]
                     else:
-                        data = await response.json()
-                        if "choices" in data and data["choices"]:
-                            yield data["choices"][0]["message"]["content"]
-                        else:
-                            logger.error(f"{backend_name}返回格式错误: {data}")
-                            raise Exception(f"{backend_name}返回格式错误")
+                        logger.error(f"{backend_name}返回格式错误: {data}")
+                        raise Exception(f"{backend_name}返回格式错误")
 
         except Exception as e:
             logger.error(f"{backend_name}调用失败: {e}")
-            # 尝试自动切换到备用后端
-            if self.auto_switch_on_failure():
-                logger.info(f"切换到备用后端: {self.current_backend.value}")
-                async for chunk in self.generate(messages, temperature, max_tokens, stream):
-                    yield chunk
-            else:
-                raise Exception(f"{backend_name}调用失败且无可用备用后端: {e}")
+            raise
 
     async def _call_ollama(self, messages, temperature, max_tokens, stream, config):
         """调用Ollama本地模型"""
@@ -262,59 +740,56 @@ class UnifiedLLMService:
 
         try:
             timeout = aiohttp.ClientTimeout(total=180)  # Ollama需要更长时间
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(
-                    f"{config['base_url']}/api/chat",
-                    json=payload
-                ) as response:
-
-                    if response.status != 200:
-                        error_text = await response.text()
-                        logger.error(f"Ollama API错误 ({response.status}): {error_text}")
-                        raise Exception(f"Ollama API返回错误: {response.status}")
-
-                    if stream:
-                        async for line in response.content:
-                            if line:
-                                chunk = line.decode('utf-8').strip()
-                                try:
-                                    data = json.loads(chunk)
-                                    if data.get("done", False):
-                                        break
-                                    if "message" in data and "content" in data["message"]:
-                                        yield data["message"]["content"]
-                                except json.JSONDecodeError:
-                                    continue
+            session = self._get_session(LLMBackend.OLLAMA)
+            async with session.post(
+                f"{config['base_url']}/api/chat",
+                data=self.json.dumps(payload).encode("utf-8"),
+                headers=config["headers"](),
+                timeout=timeout
+            ) as response:
+
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.error(f"Ollama API错误 ({response.status}): {error_text}")
+                    raise Exception(f"Ollama API返回错误: {response.status}")
+
+                if stream:
+                    async for content in iter_stream_content(
+                        response.content.iter_any(), NDJSONDecoder(), self.json.loads, _ollama_delta
+                    ):
+                        yield content
+                else:
+                    data = self.json.loads(await response.read())
+                    if "message" in data and "content" in data["message"]:
+                        yield data["message"]["content"]
                     else:
-                        data = await response.json()
-                        if "message" in data and "content" in data["message"]:
-                            yield data["message"]["content"]
-                        else:
-                            logger.error(f"Ollama返回格式错误: {data}")
-                            raise Exception("Ollama返回格式错误")
+                        logger.error(f"Ollama返回格式错误: {data}")
+                        raise Exception("Ollama返回格式错误")
 
         except Exception as e:
             logger.error(f"Ollama调用失败: {e}")
-            # 尝试自动切换到云端API
-            if self.auto_switch_on_failure():
-                logger.info(f"切换到备用后端: {self.current_backend.value}")
-                async for chunk in self.generate(messages, temperature, max_tokens, stream):
-                    yield chunk
-            else:
-                raise Exception(f"Ollama调用失败且无可用备用后端: {e}")
+            raise
 
     def get_backend_info(self) -> Dict[str, Any]:
-        """获取当前后端信息"""
+        """获取当前后端信息与各后端实时统计"""
+        routed = self.preferred_backend()
         return {
             "current_backend": self.current_backend.value,
             "current_model": self.configs[self.current_backend]["model"],
+            "routing": self.routing,
+            "routing_explorations": self.explorations,
+            "routed_backend": routed.value,
+            "routed_model": self.configs[routed]["model"],
             "available_backends": [
                 {
                     "name": backend.value,
                     "model": self.configs[backend]["model"],
                     "healthy": self.backend_health.get(backend, False),
-                    "api_key_configured": bool(self.configs[backend].get("api_key"))
+                    "api_key_configured": bool(self.configs[backend].get("api_key")),
+                    "stats": self.health[backend].get_stats(),
+                    "limits": self.limiters[backend].get_stats()
                 }
                 for backend in LLMBackend
-            ]
+            ],
+            "hedging": dict(self.hedge_stats.get_stats(), enabled=config.LLM_HEDGE_ENABLED)
         }
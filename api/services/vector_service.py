@@ -1,11 +1,20 @@
 # api/services/vector_service.py
-from typing import List, Dict, Any, Optional
-import torch
+from typing import List, Dict, Any, Optional, Tuple
+import asyncio
+import json
 import numpy as np
-import chromadb
-from transformers import AutoTokenizer, AutoModel
 from config import config
-import os
+from api.services.embedding_engine import get_embedding_engine
+from api.services.embedding_batcher import EmbeddingBatcher
+from api.services.embedding_cache import EmbeddingCache
+from api.services.vector_store import open_vector_store
+from api.services.ivfpq_index import IVFPQIndex
+from api.services.inverted_index import InvertedIndex
+from api.services.bm25_index import BM25Retriever
+from api.services.reranker import get_reranker
+from api.services.fusion import fuse_rankings
+from api.utils.executor import BoundedExecutor
+from api.utils.text import normalize_text
 
 class VectorService:
     """向量检索服务（单例模式）"""
@@ -24,58 +33,84 @@ class VectorService:
             return
 
         try:
-            # 确定是否使用本地模型
-            use_local = os.path.exists(config.EMBEDDING_MODEL_PATH)
-            
             # 加载嵌入模型
-            print("正在加载嵌入模型...")
-            self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-            print(f"使用设备: {self.device}")
-            
-            if use_local:
-                print(f"从本地加载模型: {config.EMBEDDING_MODEL_PATH}")
-                
-                self.tokenizer = AutoTokenizer.from_pretrained(
-                    config.EMBEDDING_MODEL_PATH,
-                    local_files_only=True
+            self.embedding_engine = get_embedding_engine()
+            self.device = self.embedding_engine.device
+
+            # 查询向量微批处理器
+            self.batcher = None
+            if config.EMBEDDING_BATCHING_ENABLED:
+                self.batcher = EmbeddingBatcher(
+                    self._encode_queries,
+                    max_batch_size=config.EMBEDDING_BATCH_MAX_SIZE,
+                    max_wait_ms=config.EMBEDDING_BATCH_WAIT_MS,
+                    max_queue_size=config.EMBEDDING_BATCH_QUEUE_SIZE
                 )
-                
-                self.embedding_model = AutoModel.from_pretrained(
-                    config.EMBEDDING_MODEL_PATH,
-                    local_files_only=True
-                ).to(self.device)
-            else:
-                print(f"从HuggingFace在线加载模型: {config.EMBEDDING_MODEL}")
-                
-                self.tokenizer = AutoTokenizer.from_pretrained(
-                    config.EMBEDDING_MODEL
+                print(
+                    f"查询微批处理已启用: 最大批量 {config.EMBEDDING_BATCH_MAX_SIZE}, "
+                    f"等待窗口 {config.EMBEDDING_BATCH_WAIT_MS}ms"
                 )
-                
-                self.embedding_model = AutoModel.from_pretrained(
-                    config.EMBEDDING_MODEL
-                ).to(self.device)
-            
-            self.embedding_model.eval()
-            print("嵌入模型加载完成")
-
-            # 初始化向量数据库客户端
-            print("正在连接向量数据库...")
-            self.chroma_client = chromadb.PersistentClient(
-                path=config.VECTOR_STORE_DIR,
-                settings=chromadb.config.Settings(
-                    anonymized_telemetry=False
+
+            # 查询向量缓存
+            self.embedding_cache = None
+            if config.EMBEDDING_CACHE_SIZE > 0:
+                self.embedding_cache = EmbeddingCache(
+                    max_size=config.EMBEDDING_CACHE_SIZE,
+                    ttl=config.EMBEDDING_CACHE_TTL or None,
+                    dtype=config.EMBEDDING_CACHE_DTYPE
                 )
+
+            # 检索执行器，避免阻塞事件循环
+            self.executor = BoundedExecutor(
+                max_workers=config.RETRIEVAL_WORKERS,
+                max_queue_size=config.RETRIEVAL_QUEUE_SIZE,
+                thread_name_prefix="retrieval"
             )
 
-            # 获取或创建集合
+            # 初始化向量存储
+            print("正在连接向量数据库...")
             try:
-                self.collection = self.chroma_client.get_collection(
-                    config.COLLECTION_NAME
-                )
-                print(f"已连接到集合: {config.COLLECTION_NAME}")
-            except Exception:
-                print(f"集合 {config.COLLECTION_NAME} 不存在，请先运行 build_knowledge_base.py")
-                raise ValueError(f"向量数据库集合 '{config.COLLECTION_NAME}' 不存在")
+                self.store = open_vector_store()
+            except ValueError as e:
+                print(f"{e}，请先运行 build_knowledge_base.py")
+                raise
+            print(f"已连接到向量存储: {self.store.name}, {self.store.count()} 个文本块")
+
+            # 近似索引（IVF-PQ）
+            if config.VECTOR_INDEX_TYPE == "ivfpq":
+                self._attach_ann_index()
+
+            # 稀疏倒排索引（混合检索）
+            self.sparse_index = None
+            if config.HYBRID_SEARCH_ENABLED:
+                if not self.embedding_engine.supports_sparse:
+                    print("⚠️  嵌入模型不支持稀疏权重，混合检索未启用")
+                elif not InvertedIndex.exists(config.SPARSE_INDEX_DIR):
+                    print("⚠️  稀疏索引不存在，请重新运行 build_knowledge_base.py，混合检索未启用")
+                else:
+                    self.sparse_index = InvertedIndex.load(config.SPARSE_INDEX_DIR)
+                    print(
+                        f"混合检索已启用: 稀疏索引 {self.sparse_index.num_docs} 个文本块, "
+                        f"融合方法 {config.HYBRID_FUSION}"
+                    )
+
+            # 交叉编码器重排序
+            self.reranker = get_reranker() if config.RERANK_ENABLED else None
+
+            # BM25关键词索引
+            self.bm25_index = None
+            if config.BM25_ENABLED:
+                if not InvertedIndex.exists(config.BM25_INDEX_DIR):
+                    print("⚠️  BM25索引不存在，请重新运行 build_knowledge_base.py，关键词检索未启用")
+                else:
+                    self.bm25_index = BM25Retriever.load(
+                        config.BM25_INDEX_DIR,
+                        max_postings_per_term=config.BM25_MAX_POSTINGS_PER_TERM
+                    )
+                    print(
+                        f"BM25关键词检索已启用: {self.bm25_index.index.num_docs} 个文本块, "
+                        f"分词器 {self.bm25_index.tokenizer}"
+                    )
 
             self._initialized = True
 
@@ -85,98 +120,361 @@ class VectorService:
     
     def encode_text(self, text: str) -> np.ndarray:
         """将单个文本编码为向量"""
-        with torch.no_grad():
-            # Tokenize
-            encoded = self.tokenizer(
-                text,
-                padding=True,
-                truncation=True,
-                max_length=512,
-                return_tensors='pt'
-            ).to(self.device)
-            
-            # Get embeddings
-            outputs = self.embedding_model(**encoded)
-            
-            # Use CLS token embedding (first token)
-            embedding = outputs.last_hidden_state[:, 0]
-            
-            # Normalize embedding
-            embedding = torch.nn.functional.normalize(embedding, p=2, dim=1)
-            
-            return embedding.cpu().numpy()[0]
+        return self.embedding_engine.encode(text)
     
-    def encode_texts(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
-        """批量将文本编码为向量"""
-        all_embeddings = []
-        
-        with torch.no_grad():
-            for i in range(0, len(texts), batch_size):
-                batch_texts = texts[i:i + batch_size]
-                
-                # Tokenize
-                encoded = self.tokenizer(
-                    batch_texts,
-                    padding=True,
-                    truncation=True,
-                    max_length=512,
-                    return_tensors='pt'
-                ).to(self.device)
-                
-                # Get embeddings
-                outputs = self.embedding_model(**encoded)
-                
-                # Use CLS token embedding (first token)
-                embeddings = outputs.last_hidden_state[:, 0]
-                
-                # Normalize embeddings
-                embeddings = torch.nn.functional.normalize(embeddings, p=2, dim=1)
-                
-                all_embeddings.append(embeddings.cpu().numpy())
-        
-        return np.vstack(all_embeddings)
+    def encode_texts(self, texts: List[str], token_budget: Optional[int] = None) -> np.ndarray:
+        """批量将文本编码为向量（按token长度分桶，输出保持原始顺序）"""
+        return self.embedding_engine.encode_batch(texts, token_budget=token_budget)
+
+    def _encode_queries(self, texts: List[str]) -> List[Tuple[np.ndarray, Optional[Dict[str, float]]]]:
+        """批量编码查询，启用混合检索时稠密向量与稀疏权重来自同一次前向计算"""
+        if self.sparse_index is not None:
+            dense, sparse = self.embedding_engine.encode_batch(texts, return_sparse=True)
+            return list(zip(dense, sparse))
+        return [(vector, None) for vector in self.encode_texts(texts)]
+
+    def _encode_query_full(self, query: str) -> Tuple[np.ndarray, Optional[Dict[str, float]]]:
+        """编码查询文本，优先使用向量缓存，启用微批处理时与并发查询合并计算
+
+        模型输入为 normalize_text 规范化后的查询文本（只做分词器本身也会做的NFKC与空白折叠，
+        保留大小写，与文档编码一致），与向量缓存的键相同：命中缓存与重新计算得到相同的向量。
+        """
+        query = normalize_text(query)
+        if self.embedding_cache is not None:
+            cached = self.embedding_cache.get(query)
+            if cached is not None:
+                return cached
+
+        if self.batcher is not None:
+            embedding, sparse = self.batcher.encode(query)
+        else:
+            embedding, sparse = self._encode_queries([query])[0]
+
+        if self.embedding_cache is not None:
+            self.embedding_cache.set(query, embedding, sparse)
+        return embedding, sparse
+
+    async def _aencode_query_full(self, query: str) -> Tuple[np.ndarray, Optional[Dict[str, float]]]:
+        """异步编码查询文本（模型输入与缓存键均为 normalize_text 规范化后的文本）"""
+        query = normalize_text(query)
+        if self.embedding_cache is not None:
+            cached = self.embedding_cache.get(query)
+            if cached is not None:
+                return cached
+
+        if self.batcher is not None:
+            # 微批处理线程完成编码，无需占用检索线程
+            embedding, sparse = await asyncio.wrap_future(self.batcher.submit(query))
+        else:
+            embedding, sparse = (await self.executor.run(self._encode_queries, [query]))[0]
+
+        if self.embedding_cache is not None:
+            self.embedding_cache.set(query, embedding, sparse)
+        return embedding, sparse
+
+    def encode_query(self, query: str) -> np.ndarray:
+        """编码查询文本，返回稠密向量"""
+        return self._encode_query_full(query)[0]
+    
+    async def aencode_query(self, query: str) -> np.ndarray:
+        """异步编码查询文本，返回稠密向量"""
+        return (await self._aencode_query_full(query))[0]
+
+    def _attach_ann_index(self):
+        """加载IVF-PQ索引并挂载到向量存储，不可用时退回精确检索"""
+        if self.store.name != "numpy":
+            print("⚠️  IVF-PQ索引仅支持 numpy 向量存储，使用精确检索")
+            return
+        if not IVFPQIndex.exists(config.IVFPQ_INDEX_DIR):
+            print("⚠️  IVF-PQ索引不存在，请重新运行 build_knowledge_base.py，使用精确检索")
+            return
+        try:
+            self.store.attach_index(
+                IVFPQIndex.load(config.IVFPQ_INDEX_DIR),
+                nprobe=config.IVFPQ_NPROBE,
+                shortlist=config.IVFPQ_SHORTLIST
+            )
+        except ValueError as e:
+            print(f"⚠️  {e}，使用精确检索")
+            return
+        print(
+            f"IVF-PQ近似检索已启用: nprobe {config.IVFPQ_NPROBE}, "
+            f"shortlist {config.IVFPQ_SHORTLIST}"
+        )
+
+    def _query_store(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int,
+        filter_conditions: Optional[Dict],
+        search_params: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """执行向量库查询并附加排名"""
+        results = self.store.query(query_embedding, top_k, filter_conditions, **(search_params or {}))
+        for i, result in enumerate(results):
+            result["rank"] = i + 1
+        return results
+
+    def _keyword_search(self, query: str, n_candidates: int) -> List[Tuple[str, float]]:
+        """BM25关键词检索"""
+        return self.bm25_index.search(query, n_candidates) if self.bm25_index else []
+
+    def _retrieve(
+        self,
+        query_embedding: np.ndarray,
+        query_sparse: Optional[Dict[str, float]],
+        top_k: int,
+        filter_conditions: Optional[Dict],
+        keyword_hits: Optional[List[Tuple[str, float]]] = None,
+        search_params: Optional[Dict[str, Any]] = None,
+        dense_results: Optional[List[Dict[str, Any]]] = None
+    ) -> List[Dict[str, Any]]:
+        """执行检索：稠密检索，启用混合检索/BM25时与稀疏、关键词检索结果融合
+
+        dense_results 为已完成的稠密检索结果（批量检索时传入），为空时在此查询向量库。
+        """
+        n_candidates = top_k * config.HYBRID_CANDIDATE_MULTIPLIER
+
+        # 其他召回路：(名称, 结果, 融合权重)
+        extra_rankings = []
+        if self.sparse_index is not None and query_sparse:
+            extra_rankings.append(("sparse", self.sparse_index.search(query_sparse, n_candidates), config.HYBRID_SPARSE_WEIGHT))
+        if keyword_hits is not None:
+            extra_rankings.append(("bm25", keyword_hits, config.BM25_WEIGHT))
+
+        if not extra_rankings:
+            if dense_results is not None:
+                return dense_results[:top_k]
+            return self._query_store(query_embedding, top_k, filter_conditions, search_params)
+
+        if dense_results is None:
+            dense_results = self._query_store(query_embedding, n_candidates, filter_conditions, search_params)
+
+        fused = fuse_rankings(
+            config.HYBRID_FUSION,
+            [[(r["id"], r["score"]) for r in dense_results]] + [hits for _, hits, _ in extra_rankings],
+            weights=[config.HYBRID_DENSE_WEIGHT] + [weight for _, _, weight in extra_rankings],
+            rrf_k=config.HYBRID_RRF_K
+        )
+
+        # 记录每个文本块由哪些召回路命中
+        retrieval: Dict[str, List[str]] = {r["id"]: ["dense"] for r in dense_results}
+        for name, hits, _ in extra_rankings:
+            for doc_id, _ in hits:
+                retrieval.setdefault(doc_id, []).append(name)
+
+        by_id = {r["id"]: r for r in dense_results}
+
+        # 仅由其他召回路命中的文本块：按过滤条件补取内容并计算稠密相似度
+        missing = [doc_id for doc_id, _ in fused[:n_candidates] if doc_id not in by_id]
+        if missing:
+            for result in self.store.fetch(missing, query_embedding, filter_conditions):
+                by_id[result["id"]] = result
+
+        formatted_results = []
+        for doc_id, fusion_score in fused:
+            result = by_id.get(doc_id)
+            if result is None:
+                continue
+            result["fusion_score"] = fusion_score
+            result["retrieval"] = retrieval.get(doc_id, [])
+            result["rank"] = len(formatted_results) + 1
+            formatted_results.append(result)
+            if len(formatted_results) >= top_k:
+                break
+
+        return formatted_results
     
     def search(
         self, 
         query: str, 
         top_k: int = 5,
-        filter_conditions: Optional[Dict] = None
+        filter_conditions: Optional[Dict] = None,
+        search_params: Optional[Dict[str, Any]] = None
     ) -> List[Dict[str, Any]]:
-        """搜索相关文档"""
+        """搜索相关文档
+
+        search_params 透传给向量存储（如近似索引的 nprobe/shortlist）。
+        """
         
         # 生成查询向量
-        query_embedding = self.encode_text(query).tolist()
+        query_embedding, query_sparse = self._encode_query_full(query)
+
+        # 关键词检索
+        keyword_hits = None
+        if self.bm25_index is not None:
+            keyword_hits = self._keyword_search(query, top_k * config.HYBRID_CANDIDATE_MULTIPLIER)
         
         # 执行搜索
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k,
-            where=filter_conditions,
-            include=["documents", "metadatas", "distances"]
+        return self._retrieve(query_embedding, query_sparse, top_k, filter_conditions, keyword_hits, search_params)
+
+    async def asearch(
+        self,
+        query: str,
+        top_k: int = 5,
+        filter_conditions: Optional[Dict] = None,
+        search_params: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """异步搜索相关文档，嵌入计算与向量库查询均不阻塞事件循环
+
+        检索线程池或查询微批处理排队已满时抛出 ExecutorQueueFullError。
+        """
+        # BM25关键词检索与查询编码并行执行
+        keyword_future = None
+        if self.bm25_index is not None:
+            keyword_future = self.executor.submit(
+                self._keyword_search, query, top_k * config.HYBRID_CANDIDATE_MULTIPLIER
+            )
+
+        try:
+            query_embedding, query_sparse = await self._aencode_query_full(query)
+        except BaseException:
+            if keyword_future is not None:
+                keyword_future.cancel()
+            raise
+
+        keyword_hits = await asyncio.wrap_future(keyword_future) if keyword_future else None
+        return await self.executor.run(
+            self._retrieve, query_embedding, query_sparse, top_k, filter_conditions, keyword_hits, search_params
         )
-        
-        # 格式化结果
-        formatted_results = []
-        if results["documents"]:
-            for i in range(len(results["documents"][0])):
-                formatted_results.append({
-                    "text": results["documents"][0][i],
-                    "metadata": results["metadatas"][0][i],
-                    "score": 1 - results["distances"][0][i],  # 转换为相似度分数
-                    "rank": i + 1
-                })
-        
-        return formatted_results
     
+    def _encode_queries_cached(self, queries: List[str]) -> List[Tuple[np.ndarray, Optional[Dict[str, float]]]]:
+        """批量编码查询：命中缓存的直接返回，其余按规范化文本去重后一次前向计算"""
+        encoded: List[Optional[Tuple[np.ndarray, Optional[Dict[str, float]]]]] = [None] * len(queries)
+        misses: Dict[str, List[int]] = {}
+        for i, query in enumerate(queries):
+            query = normalize_text(query)
+            cached = self.embedding_cache.get(query) if self.embedding_cache is not None else None
+            if cached is not None:
+                encoded[i] = cached
+            else:
+                misses.setdefault(query, []).append(i)
+
+        if misses:
+            for query, result in zip(misses, self._encode_queries(list(misses))):
+                for i in misses[query]:
+                    encoded[i] = result
+                if self.embedding_cache is not None:
+                    self.embedding_cache.set(query, *result)
+
+        return encoded
+
+    def search_batch(self, requests: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """批量检索，结果与输入顺序一致
+
+        requests 每项包含 query、top_k，可选 filter_conditions、search_params。
+        全部查询一次前向计算编码；过滤条件与检索参数相同的查询共用一次多向量查询。
+        """
+        if not requests:
+            return []
+
+        encoded = self._encode_queries_cached([request["query"] for request in requests])
+        multiplier = config.HYBRID_CANDIDATE_MULTIPLIER if (
+            self.sparse_index is not None or self.bm25_index is not None
+        ) else 1
+
+        # 按 (过滤条件, 检索参数) 分组做多向量查询
+        groups: Dict[str, List[int]] = {}
+        for i, request in enumerate(requests):
+            key = json.dumps(
+                [request.get("filter_conditions"), request.get("search_params")],
+                sort_keys=True,
+                ensure_ascii=False
+            )
+            groups.setdefault(key, []).append(i)
+
+        dense_results: List[List[Dict[str, Any]]] = [[] for _ in requests]
+        for members in groups.values():
+            first = requests[members[0]]
+            n_results = max(requests[i]["top_k"] for i in members) * multiplier
+            batch = self.store.query_batch(
+                np.stack([encoded[i][0] for i in members]),
+                n_results,
+                first.get("filter_conditions"),
+                **(first.get("search_params") or {})
+            )
+            for i, results in zip(members, batch):
+                results = results[:requests[i]["top_k"] * multiplier]
+                for rank, result in enumerate(results, 1):
+                    result["rank"] = rank
+                dense_results[i] = results
+
+        batch_results = []
+        for i, request in enumerate(requests):
+            keyword_hits = None
+            if self.bm25_index is not None:
+                keyword_hits = self._keyword_search(request["query"], request["top_k"] * multiplier)
+            batch_results.append(self._retrieve(
+                encoded[i][0],
+                encoded[i][1],
+                request["top_k"],
+                request.get("filter_conditions"),
+                keyword_hits,
+                request.get("search_params"),
+                dense_results=dense_results[i]
+            ))
+        return batch_results
+
+    async def asearch_batch(self, requests: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """异步批量检索，整批在检索线程池中执行
+
+        检索线程池排队已满时抛出 ExecutorQueueFullError。
+        """
+        return await self.executor.run(self.search_batch, requests)
+
+    async def arerank(
+        self,
+        query: str,
+        results: List[Dict[str, Any]],
+        top_k: int,
+        budget_ms: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """在检索线程池中对检索结果重排序，未启用重排序时直接截取前 top_k 个"""
+        if self.reranker is None or not results:
+            return results[:top_k]
+        return await self.executor.run(self.reranker.rerank, query, results, top_k, budget_ms)
+
+    async def warmup(self, query: str = "预热查询") -> int:
+        """执行一次端到端的检索预热，返回命中条数
+
+        与 asearch/arerank 走同样的模型与向量库，但不读写查询向量缓存与重排序得分缓存，
+        预热查询不会占用面向用户的缓存条目。
+        """
+        query_embedding, query_sparse = (await self.executor.run(self._encode_queries, [normalize_text(query)]))[0]
+        keyword_hits = None
+        if self.bm25_index is not None:
+            keyword_hits = await self.executor.run(self._keyword_search, query, config.HYBRID_CANDIDATE_MULTIPLIER)
+        results = await self.executor.run(self._retrieve, query_embedding, query_sparse, 1, None, keyword_hits, None)
+        if self.reranker is not None and results:
+            await self.executor.run(self.reranker.score, query, [result["text"] for result in results])
+        return len(results)
+
+    def close(self):
+        """释放后台线程"""
+        if self.batcher is not None:
+            self.batcher.close()
+        self.executor.shutdown(wait=False)
+
     def get_stats(self) -> Dict[str, Any]:
         """获取统计信息"""
         try:
-            count = self.collection.count()
+            count = self.store.count()
             return {
                 "total_chunks": count,
                 "status": "healthy",
                 "collection_name": config.COLLECTION_NAME,
-                "device": str(self.device)
+                "vector_store": self.store.get_info(),
+                "device": str(self.device),
+                "embedding_backend": self.embedding_engine.name,
+                "batching": self.batcher.get_stats() if self.batcher else None,
+                "embedding_cache": self.embedding_cache.get_stats() if self.embedding_cache else None,
+                "retrieval_executor": self.executor.get_stats(),
+                "reranker": self.reranker.get_stats() if self.reranker else None,
+                "hybrid": {
+                    "fusion": config.HYBRID_FUSION,
+                    "sparse_index": self.sparse_index.meta if self.sparse_index else None,
+                    "bm25_index": self.bm25_index.index.meta if self.bm25_index else None
+                } if self.sparse_index or self.bm25_index else None
             }
         except Exception as e:
             return {
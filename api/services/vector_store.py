@@ -0,0 +1,665 @@
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+from abc import ABC, abstractmethod
+from datetime import datetime
+import os
+import json
+import shutil
+import logging
+import numpy as np
+
+from config import config
+from api.utils.lru_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+VECTOR_STORE_TYPES = ("chroma", "numpy")
+
+def _score_from_distance(distance: np.ndarray) -> np.ndarray:
+    """距离转换为相似度分数（与原 Chroma 结果的 1 - distance 保持一致）"""
+    return 1 - distance
+
+class VectorStore(ABC):
+    """向量存储接口
+
+    query/fetch 返回的结果均为 {"id", "text", "metadata", "score"} 字典，
+    score 为 1 - 距离，不同实现之间可直接比较。
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def add(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]]
+    ):
+        """写入一批文本块"""
+
+    def persist(self):
+        """将写入的数据落盘（部分实现会缓冲写入）"""
+
+    @abstractmethod
+    def query(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int,
+        where: Optional[Dict] = None,
+        nprobe: Optional[int] = None,
+        shortlist: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """返回与查询向量最相似的 top_k 个文本块
+
+        nprobe/shortlist 仅在挂载了近似索引（IVF-PQ）时生效，None 表示使用索引默认值。
+        """
+
+    def query_batch(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int,
+        where: Optional[Dict] = None,
+        nprobe: Optional[int] = None,
+        shortlist: Optional[int] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """多个查询向量共用同一过滤条件的批量查询，结果与输入顺序一致"""
+        return [self.query(query, top_k, where, nprobe, shortlist) for query in query_embeddings]
+
+    @abstractmethod
+    def fetch(
+        self,
+        ids: List[str],
+        query_embedding: np.ndarray,
+        where: Optional[Dict] = None
+    ) -> List[Dict[str, Any]]:
+        """按ID获取文本块（满足过滤条件的），并计算与查询向量的相似度"""
+
+    @abstractmethod
+    def iter_documents(self, page_size: int = 1000) -> Iterator[Tuple[List[str], List[str]]]:
+        """分页遍历全部 (ID列表, 文本列表)"""
+
+    @abstractmethod
+    def count(self) -> int:
+        """文本块总数"""
+
+    @abstractmethod
+    def reset(self):
+        """清空存储"""
+
+    def get_info(self) -> Dict[str, Any]:
+        return {"type": self.name, "count": self.count()}
+
+class ChromaVectorStore(VectorStore):
+    """Chroma 向量存储"""
+
+    name = "chroma"
+
+    def __init__(self, path: str, collection_name: str, create: bool = False):
+        import chromadb
+
+        self.collection_name = collection_name
+        self.client = chromadb.PersistentClient(
+            path=path,
+            settings=chromadb.config.Settings(
+                anonymized_telemetry=False,
+                allow_reset=True
+            )
+        )
+
+        try:
+            self.collection = self.client.get_collection(collection_name)
+        except Exception:
+            if not create:
+                raise ValueError(f"向量数据库集合 '{collection_name}' 不存在")
+            self.collection = self._create_collection()
+
+    def _create_collection(self):
+        return self.client.create_collection(
+            name=self.collection_name,
+            metadata={"description": "公司知识库", "created_at": datetime.now().isoformat()}
+        )
+
+    def add(self, ids, embeddings, documents, metadatas):
+        self.collection.add(
+            ids=ids,
+            embeddings=[list(map(float, e)) for e in embeddings],
+            documents=documents,
+            metadatas=metadatas
+        )
+
+    def query(self, query_embedding, top_k, where=None, nprobe=None, shortlist=None):
+        return self.query_batch([query_embedding], top_k, where)[0]
+
+    def query_batch(self, query_embeddings, top_k, where=None, nprobe=None, shortlist=None):
+        """一次 collection.query 完成多个查询向量的检索"""
+        results = self.collection.query(
+            query_embeddings=np.asarray(query_embeddings, dtype=np.float32).tolist(),
+            n_results=top_k,
+            where=where or None,
+            include=["documents", "metadatas", "distances"]
+        )
+
+        batch_results = []
+        for q in range(len(query_embeddings)):
+            formatted_results = []
+            if results["documents"]:
+                for i in range(len(results["documents"][q])):
+                    formatted_results.append({
+                        "id": results["ids"][q][i],
+                        "text": results["documents"][q][i],
+                        "metadata": results["metadatas"][q][i],
+                        "score": float(_score_from_distance(results["distances"][q][i]))
+                    })
+            batch_results.append(formatted_results)
+        return batch_results
+
+    def _distance(self, query_embedding: np.ndarray, embeddings: np.ndarray) -> np.ndarray:
+        """按集合的距离度量计算距离，与 Chroma 返回的 distances 保持一致"""
+        space = (self.collection.metadata or {}).get("hnsw:space", "l2")
+        dots = embeddings @ query_embedding
+        if space == "cosine":
+            norms = np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query_embedding)
+            return 1 - dots / np.maximum(norms, 1e-12)
+        if space == "ip":
+            return 1 - dots
+        return np.sum((embeddings - query_embedding) ** 2, axis=1)
+
+    def fetch(self, ids, query_embedding, where=None):
+        fetched = self.collection.get(
+            ids=ids,
+            where=where or None,
+            include=["documents", "metadatas", "embeddings"]
+        )
+        if not fetched["ids"]:
+            return []
+
+        scores = _score_from_distance(self._distance(
+            np.asarray(query_embedding, dtype=np.float32),
+            np.asarray(fetched["embeddings"], dtype=np.float32)
+        ))
+        return [
+            {
+                "id": doc_id,
+                "text": fetched["documents"][i],
+                "metadata": fetched["metadatas"][i],
+                "score": float(scores[i])
+            }
+            for i, doc_id in enumerate(fetched["ids"])
+        ]
+
+    def iter_documents(self, page_size=1000):
+        offset = 0
+        while True:
+            page = self.collection.get(limit=page_size, offset=offset, include=["documents"])
+            if not page["ids"]:
+                break
+            yield page["ids"], page["documents"]
+            offset += len(page["ids"])
+
+    def count(self):
+        return self.collection.count()
+
+    def reset(self):
+        try:
+            self.client.delete_collection(self.collection_name)
+        except Exception:
+            pass
+        self.collection = self._create_collection()
+
+    def get_info(self):
+        return {"type": self.name, "collection_name": self.collection_name, "count": self.count()}
+
+def _write_blob(path: str, items: List[str]) -> np.ndarray:
+    """将字符串列表写为 UTF-8 拼接文件，返回偏移数组"""
+    offsets = np.zeros(len(items) + 1, dtype=np.int64)
+    with open(path, "wb") as f:
+        for i, item in enumerate(items):
+            data = item.encode("utf-8")
+            f.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+    return offsets
+
+class NumpyVectorStore(VectorStore):
+    """内存映射的 NumPy 向量存储
+
+    归一化向量以 float32/float16 矩阵保存为 .npy 并以内存映射方式打开，
+    查询时分块矩阵乘法做精确 top-k（float16 占用减半，但查询时需逐块转换为 float32）。
+    文本与元数据按行拼接存储，只解码命中的行。
+    过滤字段在构建时编码为整数列，查询时按过滤条件生成布尔掩码并缓存。
+    """
+
+    name = "numpy"
+
+    EMBEDDINGS_FILE = "embeddings.npy"
+    TEXTS_FILE = "texts.bin"
+    TEXT_OFFSETS_FILE = "text_offsets.npy"
+    METADATAS_FILE = "metadatas.bin"
+    METADATA_OFFSETS_FILE = "metadata_offsets.npy"
+    IDS_FILE = "ids.json"
+    META_FILE = "meta.json"
+
+    # 过滤后行数超过总行数的 1/DENSE_FILTER_RATIO 时改为全量扫描再取子集
+    DENSE_FILTER_RATIO = 8
+
+    def __init__(
+        self,
+        directory: str,
+        dtype: str = "float32",
+        filter_fields: Tuple[str, ...] = ("source", "file_type"),
+        block_size: int = 16384,
+        create: bool = False
+    ):
+        if dtype not in ("float16", "float32"):
+            raise ValueError(f"不支持的向量存储精度: {dtype}，可选值: float16, float32")
+
+        self.directory = directory
+        self.dtype = dtype
+        self.filter_fields = tuple(filter_fields)
+        self.block_size = max(1024, block_size)
+        self._pending: List[Tuple[List[str], np.ndarray, List[str], List[Dict[str, Any]]]] = []
+        self._mask_cache = LRUCache(max_size=256)
+        self.ann_index = None
+        self.default_nprobe = 16
+        self.default_shortlist = 200
+
+        self._recover(directory)
+        if not self.exists(directory):
+            if not create:
+                raise ValueError(f"NumPy 向量存储 '{directory}' 不存在")
+            self._set_empty()
+        else:
+            self._load()
+
+    @classmethod
+    def exists(cls, directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, cls.META_FILE))
+
+    @staticmethod
+    def _old_directory(directory: str) -> str:
+        return directory.rstrip(os.sep) + ".old"
+
+    @classmethod
+    def _recover(cls, directory: str):
+        """上次替换在移走旧存储后中断时，恢复旧存储"""
+        old_dir = cls._old_directory(directory)
+        if not cls.exists(directory) and cls.exists(old_dir):
+            shutil.rmtree(directory, ignore_errors=True)
+            os.replace(old_dir, directory)
+
+    def _set_empty(self):
+        self.meta: Dict[str, Any] = {
+            "count": 0,
+            "dim": 0,
+            "dtype": self.dtype,
+            "space": "l2",
+            "filter_fields": {field: [] for field in self.filter_fields}
+        }
+        self.ids: List[str] = []
+        self.id_to_row: Dict[str, int] = {}
+        self.embeddings = np.zeros((0, 0), dtype=self.dtype)
+        self.text_offsets = np.zeros(1, dtype=np.int64)
+        self.metadata_offsets = np.zeros(1, dtype=np.int64)
+        self.texts = np.zeros(0, dtype=np.uint8)
+        self.metadatas = np.zeros(0, dtype=np.uint8)
+        self.filter_codes: Dict[str, np.ndarray] = {}
+        self.filter_values: Dict[str, List[Any]] = {field: [] for field in self.filter_fields}
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load_blob(self, name: str) -> np.ndarray:
+        path = self._path(name)
+        if os.path.getsize(path) == 0:
+            return np.zeros(0, dtype=np.uint8)
+        return np.memmap(path, dtype=np.uint8, mode="r")
+
+    def _load(self):
+        with open(self._path(self.META_FILE), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(self._path(self.IDS_FILE), "r", encoding="utf-8") as f:
+            self.ids = json.load(f)
+        self.id_to_row = {doc_id: row for row, doc_id in enumerate(self.ids)}
+
+        self.dtype = self.meta["dtype"]
+        self.filter_fields = tuple(self.meta["filter_fields"])
+        self.embeddings = np.load(self._path(self.EMBEDDINGS_FILE), mmap_mode="r")
+        self.text_offsets = np.load(self._path(self.TEXT_OFFSETS_FILE), mmap_mode="r")
+        self.metadata_offsets = np.load(self._path(self.METADATA_OFFSETS_FILE), mmap_mode="r")
+        self.texts = self._load_blob(self.TEXTS_FILE)
+        self.metadatas = self._load_blob(self.METADATAS_FILE)
+        self.filter_values = {field: values for field, values in self.meta["filter_fields"].items()}
+        self.filter_codes = {
+            field: np.load(self._path(f"filter_{field}.npy"), mmap_mode="r")
+            for field in self.filter_fields
+        }
+        self._mask_cache.clear()
+        # 数据变化后行号失效，需重新挂载近似索引
+        self.ann_index = None
+
+    # ---------- 写入 ----------
+
+    def add(self, ids, embeddings, documents, metadatas):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self._pending.append((list(ids), vectors / np.maximum(norms, 1e-12), list(documents), list(metadatas)))
+
+    def _text(self, row: int) -> str:
+        return bytes(self.texts[self.text_offsets[row]:self.text_offsets[row + 1]]).decode("utf-8")
+
+    def _metadata(self, row: int) -> Dict[str, Any]:
+        return json.loads(bytes(self.metadatas[self.metadata_offsets[row]:self.metadata_offsets[row + 1]]))
+
+    def persist(self):
+        """合并已有数据与缓冲的新数据并重写存储（同ID以新数据为准）"""
+        if not self._pending:
+            return
+
+        new_ids = [doc_id for ids, _, _, _ in self._pending for doc_id in ids]
+        new_vectors = np.concatenate([vectors for _, vectors, _, _ in self._pending])
+        new_documents = [doc for _, _, documents, _ in self._pending for doc in documents]
+        new_metadatas = [meta for _, _, _, metadatas in self._pending for meta in metadatas]
+
+        # 去重：同一ID保留最后一次写入
+        latest = {doc_id: i for i, doc_id in enumerate(new_ids)}
+        keep_new = sorted(latest.values())
+        keep_old = [row for row, doc_id in enumerate(self.ids) if doc_id not in latest]
+
+        ids = [self.ids[row] for row in keep_old] + [new_ids[i] for i in keep_new]
+        documents = [self._text(row) for row in keep_old] + [new_documents[i] for i in keep_new]
+        metadatas = [self._metadata(row) for row in keep_old] + [new_metadatas[i] for i in keep_new]
+        old_vectors = np.asarray(self.embeddings[keep_old], dtype=np.float32) if keep_old else None
+        vectors = new_vectors[keep_new]
+        if old_vectors is not None:
+            vectors = np.concatenate([old_vectors, vectors])
+
+        self._write(ids, vectors, documents, metadatas)
+        self._pending = []
+        self._load()
+
+    def _write(self, ids: List[str], vectors: np.ndarray, documents: List[str], metadatas: List[Dict[str, Any]]):
+        """写入临时目录后整体替换，避免读取到写了一半的存储"""
+        tmp_dir = self.directory.rstrip(os.sep) + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        np.save(os.path.join(tmp_dir, self.EMBEDDINGS_FILE), vectors.astype(self.dtype))
+        np.save(
+            os.path.join(tmp_dir, self.TEXT_OFFSETS_FILE),
+            _write_blob(os.path.join(tmp_dir, self.TEXTS_FILE), documents)
+        )
+        np.save(
+            os.path.join(tmp_dir, self.METADATA_OFFSETS_FILE),
+            _write_blob(
+                os.path.join(tmp_dir, self.METADATAS_FILE),
+                [json.dumps(meta, ensure_ascii=False) for meta in metadatas]
+            )
+        )
+
+        filter_values = {}
+        for field in self.filter_fields:
+            values = [meta.get(field) for meta in metadatas]
+            vocab = sorted({value for value in values if value is not None}, key=str)
+            codes = {value: code for code, value in enumerate(vocab)}
+            np.save(
+                os.path.join(tmp_dir, f"filter_{field}.npy"),
+                np.array([codes.get(value, -1) for value in values], dtype=np.int32)
+            )
+            filter_values[field] = vocab
+
+        with open(os.path.join(tmp_dir, self.IDS_FILE), "w", encoding="utf-8") as f:
+            json.dump(ids, f, ensure_ascii=False)
+        with open(os.path.join(tmp_dir, self.META_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "count": len(ids),
+                "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+                "dtype": self.dtype,
+                "space": "l2",
+                "filter_fields": filter_values,
+                "built_at": datetime.now().isoformat()
+            }, f, ensure_ascii=False, indent=2)
+
+        # 旧存储先移到一旁再换入新存储，任一时刻磁盘上至少保留一份完整存储
+        old_dir = self._old_directory(self.directory)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(self.directory):
+            os.replace(self.directory, old_dir)
+        os.replace(tmp_dir, self.directory)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    def reset(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self._pending = []
+        self._set_empty()
+        self._mask_cache.clear()
+        self.ann_index = None
+
+    # ---------- 过滤 ----------
+
+    def _field_mask(self, field: str, condition: Any) -> np.ndarray:
+        """单个字段条件的掩码，支持 $eq/$ne/$in/$nin/$contains 及直接等值"""
+        if field not in self.filter_codes:
+            raise ValueError(
+                f"字段 '{field}' 未建立过滤索引，可过滤字段: {', '.join(self.filter_fields)}"
+            )
+
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        if len(condition) != 1:
+            raise ValueError(f"不支持的过滤条件: {condition}")
+        op, operand = next(iter(condition.items()))
+
+        values = self.filter_values[field]
+        if op == "$eq":
+            matched = [code for code, value in enumerate(values) if value == operand]
+        elif op == "$in":
+            matched = [code for code, value in enumerate(values) if value in operand]
+        elif op == "$contains":
+            matched = [code for code, value in enumerate(values) if str(operand) in str(value)]
+        elif op in ("$ne", "$nin"):
+            operand = [operand] if op == "$ne" else operand
+            return ~self._field_mask(field, {"$in": operand})
+        else:
+            raise ValueError(f"不支持的过滤操作符: {op}")
+
+        return np.isin(self.filter_codes[field], np.asarray(matched, dtype=np.int32))
+
+    def _build_mask(self, where: Dict) -> np.ndarray:
+        masks = []
+        for key, condition in where.items():
+            if key == "$and":
+                masks.extend(self._build_mask(sub) for sub in condition)
+            elif key == "$or":
+                masks.append(np.logical_or.reduce([self._build_mask(sub) for sub in condition]))
+            else:
+                masks.append(self._field_mask(key, condition))
+        return np.logical_and.reduce(masks) if masks else np.ones(len(self.ids), dtype=bool)
+
+    def _mask(self, where: Optional[Dict]) -> Optional[np.ndarray]:
+        """过滤条件对应的行掩码（按条件缓存）"""
+        if not where:
+            return None
+        key = json.dumps(where, sort_keys=True, ensure_ascii=False)
+        mask = self._mask_cache.get(key)
+        if mask is None:
+            mask = self._build_mask(where)
+            self._mask_cache.set(key, mask)
+        return mask
+
+    # ---------- 查询 ----------
+
+    def _scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """分块计算内积，float16 矩阵逐块转换为 float32 参与计算"""
+        matrix = self.embeddings
+        total = len(rows) if rows is not None else matrix.shape[0]
+        scores = np.empty(total, dtype=np.float32)
+        for start in range(0, total, self.block_size):
+            end = min(start + self.block_size, total)
+            block = matrix[rows[start:end]] if rows is not None else matrix[start:end]
+            scores[start:end] = np.asarray(block, dtype=np.float32) @ query
+        return scores
+
+    def _normalize_query(self, query_embedding: np.ndarray) -> np.ndarray:
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        return query / max(float(np.linalg.norm(query)), 1e-12)
+
+    def _result(self, row: int, dot: float) -> Dict[str, Any]:
+        # 向量已归一化：平方L2距离 = 2 - 2·cos
+        return {
+            "id": self.ids[row],
+            "text": self._text(row),
+            "metadata": self._metadata(row),
+            "score": float(_score_from_distance(2 - 2 * dot))
+        }
+
+    def attach_index(self, index, nprobe: int = 16, shortlist: int = 200):
+        """挂载近似索引（索引中的行号须与当前存储一致）"""
+        if index.num_vectors != len(self.ids):
+            raise ValueError(
+                f"近似索引包含 {index.num_vectors} 个向量，与向量存储的 {len(self.ids)} 个不一致，请重新构建"
+            )
+        if index.meta.get("store_built_at") != self.meta.get("built_at"):
+            raise ValueError("近似索引与向量存储的构建时间不一致，请重新构建")
+        self.ann_index = index
+        self.default_nprobe = nprobe
+        self.default_shortlist = shortlist
+
+    def query(self, query_embedding, top_k, where=None, nprobe=None, shortlist=None):
+        if not self.ids or top_k <= 0:
+            return []
+
+        query = self._normalize_query(query_embedding)
+        mask = self._mask(where)
+
+        if self.ann_index is not None:
+            rows, scores = self.ann_index.search(
+                query,
+                self.embeddings,
+                top_k,
+                nprobe=nprobe or self.default_nprobe,
+                shortlist=shortlist or self.default_shortlist,
+                mask=mask
+            )
+            return [self._result(int(row), float(score)) for row, score in zip(rows, scores)]
+
+        if mask is None:
+            rows = None
+            scores = self._scores(query)
+        else:
+            rows = np.flatnonzero(mask)
+            if len(rows) == 0:
+                return []
+            # 选择性不高时顺序扫描全部行比随机读取子集更快
+            if len(rows) * self.DENSE_FILTER_RATIO >= len(mask):
+                scores = self._scores(query)[rows]
+            else:
+                scores = self._scores(query, rows)
+
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        return [
+            self._result(int(rows[i]) if rows is not None else int(i), float(scores[i]))
+            for i in top
+        ]
+
+    def query_batch(self, query_embeddings, top_k, where=None, nprobe=None, shortlist=None):
+        """多个查询共享一次矩阵扫描：逐块计算 (块 × 查询数) 的得分矩阵并滚动合并 top-k"""
+        if not self.ids or top_k <= 0 or len(query_embeddings) == 0:
+            return [[] for _ in range(len(query_embeddings))]
+        if self.ann_index is not None:
+            return [self.query(query, top_k, where, nprobe, shortlist) for query in query_embeddings]
+
+        queries = np.stack([self._normalize_query(query) for query in query_embeddings])
+        mask = self._mask(where)
+
+        rows = None
+        if mask is not None:
+            rows = np.flatnonzero(mask)
+            if len(rows) == 0:
+                return [[] for _ in range(len(queries))]
+            if len(rows) * self.DENSE_FILTER_RATIO >= len(mask):
+                rows = None
+            else:
+                mask = None
+
+        total = len(rows) if rows is not None else self.embeddings.shape[0]
+        k = min(top_k, total)
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+
+        for start in range(0, total, self.block_size):
+            end = min(start + self.block_size, total)
+            block_rows = rows[start:end] if rows is not None else np.arange(start, end)
+            block = self.embeddings[block_rows] if rows is not None else self.embeddings[start:end]
+            scores = queries @ np.asarray(block, dtype=np.float32).T
+            if mask is not None:
+                scores[:, ~mask[start:end]] = -np.inf
+
+            merged_scores = np.concatenate([best_scores, scores], axis=1)
+            merged_rows = np.concatenate([best_rows, np.broadcast_to(block_rows, scores.shape)], axis=1)
+            if merged_scores.shape[1] > k:
+                keep = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+                merged_scores = np.take_along_axis(merged_scores, keep, axis=1)
+                merged_rows = np.take_along_axis(merged_rows, keep, axis=1)
+            best_scores, best_rows = merged_scores, merged_rows
+
+        batch_results = []
+        for q in range(len(queries)):
+            order = np.argsort(-best_scores[q], kind="stable")
+            batch_results.append([
+                self._result(int(best_rows[q, i]), float(best_scores[q, i]))
+                for i in order
+                if np.isfinite(best_scores[q, i])
+            ])
+        return batch_results
+
+    def fetch(self, ids, query_embedding, where=None):
+        candidate_rows = [self.id_to_row[doc_id] for doc_id in ids if doc_id in self.id_to_row]
+        mask = self._mask(where)
+        if mask is not None:
+            candidate_rows = [row for row in candidate_rows if mask[row]]
+        if not candidate_rows:
+            return []
+
+        rows = np.asarray(candidate_rows, dtype=np.int64)
+        dots = np.asarray(self.embeddings[rows], dtype=np.float32) @ self._normalize_query(query_embedding)
+        return [self._result(int(row), float(dot)) for row, dot in zip(rows, dots)]
+
+    def iter_documents(self, page_size=1000):
+        for start in range(0, len(self.ids), page_size):
+            end = min(start + page_size, len(self.ids))
+            yield self.ids[start:end], [self._text(row) for row in range(start, end)]
+
+    def count(self):
+        return len(self.ids) + sum(len(ids) for ids, _, _, _ in self._pending)
+
+    def get_info(self):
+        return {
+            "type": self.name,
+            "directory": self.directory,
+            "count": self.count(),
+            "dim": self.meta.get("dim", 0),
+            "dtype": self.dtype,
+            "filter_fields": list(self.filter_fields),
+            "ann_index": {
+                **{key: self.ann_index.meta.get(key) for key in ("type", "nlist", "m", "built_at")},
+                "nprobe": self.default_nprobe,
+                "shortlist": self.default_shortlist
+            } if self.ann_index is not None else None
+        }
+
+def open_vector_store(store_type: Optional[str] = None, create: bool = False) -> VectorStore:
+    """按配置打开向量存储"""
+    store_type = (store_type or config.VECTOR_DB_TYPE).lower()
+    if store_type == "chroma":
+        return ChromaVectorStore(config.VECTOR_STORE_DIR, config.COLLECTION_NAME, create=create)
+    if store_type == "numpy":
+        return NumpyVectorStore(
+            config.NUMPY_STORE_DIR,
+            dtype=config.NUMPY_STORE_DTYPE,
+            filter_fields=config.NUMPY_FILTER_FIELDS,
+            block_size=config.NUMPY_SCAN_BLOCK_SIZE,
+            create=create
+        )
+    raise ValueError(f"未知的向量数据库类型: {store_type}，可选值: {', '.join(VECTOR_STORE_TYPES)}")
@@ -2,6 +2,19 @@
 """API Utilities Package"""
 
 from .logger import setup_logger
+from .executor import BoundedExecutor, ExecutorQueueFullError
+from .lru_cache import LRUCache
+from .text import normalize_query, normalize_text
+from .json_codec import JSONCodec, get_json_codec
 
-__all__ = ["setup_logger"]
+__all__ = [
+    "setup_logger",
+    "BoundedExecutor",
+    "ExecutorQueueFullError",
+    "LRUCache",
+    "normalize_query",
+    "normalize_text",
+    "JSONCodec",
+    "get_json_codec"
+]
 
@@ -0,0 +1,70 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Any, Dict
+
+class ExecutorQueueFullError(RuntimeError):
+    """执行器排队已满"""
+    pass
+
+class BoundedExecutor:
+    """有界线程池执行器
+
+    在 ThreadPoolExecutor 之上限制同时运行与排队的任务总数，
+    超出上限时立即拒绝，避免阻塞任务在高峰期无限堆积。
+    """
+
+    def __init__(self, max_workers: int, max_queue_size: int, thread_name_prefix: str = "bounded"):
+        self.max_workers = max(1, max_workers)
+        self.max_queue_size = max(0, max_queue_size)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix=thread_name_prefix
+        )
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue_size)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._rejected = 0
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """提交任务，队列已满时抛出 ExecutorQueueFullError"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise ExecutorQueueFullError(
+                f"执行器繁忙: {self.max_workers} 个工作线程与 {self.max_queue_size} 个排队位置均已占满"
+            )
+
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._pending += 1
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, _future: Future):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """在执行器中运行任务并等待结果，不阻塞事件循环"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def shutdown(self, wait: bool = True):
+        """关闭执行器"""
+        self._executor.shutdown(wait=wait)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取执行器统计信息"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue_size": self.max_queue_size,
+                "pending": self._pending,
+                "rejected": self._rejected
+            }
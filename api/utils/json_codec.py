@@ -0,0 +1,51 @@
+import json
+import logging
+from functools import lru_cache
+from typing import Any, Callable, Union
+
+logger = logging.getLogger(__name__)
+
+JSON_CODECS = ("auto", "orjson", "json")
+
+def resolve_json_codec(name: str) -> str:
+    """确定实际使用的JSON编解码器，orjson 未安装时退回标准库 json"""
+    name = name.lower()
+    if name not in JSON_CODECS:
+        raise ValueError(f"未知的JSON编解码器: {name}，可选值: {', '.join(JSON_CODECS)}")
+    if name == "json":
+        return "json"
+    try:
+        import orjson  # noqa: F401
+        return "orjson"
+    except ImportError:
+        if name == "orjson":
+            logger.warning("orjson 未安装，使用标准库 json")
+        return "json"
+
+class JSONCodec:
+    """JSON编解码器
+
+    loads 接受 bytes/str；dumps 输出紧凑的 str，dumpb 输出其 UTF-8 字节（orjson 直接生成，
+    省去一次解码再编码）。非ASCII字符不转义（UTF-8 输出更短），两种实现的输出可以互相解析。
+    orjson 下 numpy 标量与数组按数值序列化。
+    """
+
+    def __init__(self, name: str = "auto"):
+        self.name = resolve_json_codec(name)
+        self.loads: Callable[[Union[bytes, str]], Any]
+        self.dumps: Callable[[Any], str]
+        self.dumpb: Callable[[Any], bytes]
+        if self.name == "orjson":
+            import orjson
+            self.loads = orjson.loads
+            self.dumpb = lambda obj: orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+            self.dumps = lambda obj: self.dumpb(obj).decode("utf-8")
+        else:
+            self.loads = json.loads
+            self.dumps = lambda obj: json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+            self.dumpb = lambda obj: self.dumps(obj).encode("utf-8")
+
+@lru_cache(maxsize=None)
+def get_json_codec(name: str = "auto") -> JSONCodec:
+    """按名称获取（共享的）编解码器实例"""
+    return JSONCodec(name)
@@ -0,0 +1,37 @@
+import re
+import unicodedata
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    """规范化模型输入文本：统一全角/半角字符（NFKC）并折叠空白
+
+    嵌入与重排序模型的分词器本身会做同样的规范化，因此不改变模型看到的内容，
+    可同时用作向量/得分缓存的键与模型输入。不统一大小写（文档按原始大小写编码）。
+    """
+    text = unicodedata.normalize("NFKC", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+def normalize_query(text: str) -> str:
+    """规范化查询文本，用作回答缓存键
+
+    在 normalize_text 的基础上统一大小写。
+    """
+    return normalize_text(text).casefold()
+
+_CJK_CHAR_RE = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+_WORD_RE = re.compile(r"[A-Za-z0-9]+|[^\sA-Za-z0-9]")
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的LLM token数
+
+    中文字符与全角标点约各占 1 个 token，英文/数字串约每 4 个字符 1 个 token，
+    其他符号各计 1 个。用于上下文预算控制，无需加载分词器。
+    """
+    cjk = len(_CJK_CHAR_RE.findall(text))
+    rest = _CJK_CHAR_RE.sub(" ", text)
+    tokens = cjk
+    for match in _WORD_RE.finditer(rest):
+        word = match.group()
+        tokens += (len(word) + 3) // 4 if word[0].isalnum() else 1
+    return tokens
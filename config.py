@@ -16,16 +16,98 @@ class Config:
     RAW_DOCS_DIR = os.path.join(DATA_DIR, "raw_documents")
     PROCESSED_DIR = os.path.join(DATA_DIR, "processed_chunks")
     VECTOR_STORE_DIR = os.path.join(DATA_DIR, "vector_store")
+    KB_FINGERPRINT_FILE = os.path.join(PROCESSED_DIR, "kb_fingerprint.json")
 
     # 模型配置
     EMBEDDING_MODEL = "BAAI/bge-m3"
     EMBEDDING_MODEL_PATH = os.path.join(BASE_DIR, "models", "bge-m3")
     SAVE_MODEL_AFTER_DOWNLOAD = True
 
+    # 嵌入计算后端: torch / onnx / onnx-int8（ONNX产物导出后缓存在 models/ 下）
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+    ONNX_MODEL_DIR = os.path.join(BASE_DIR, "models", "bge-m3-onnx")
+    ONNX_PARITY_MIN_COSINE = float(os.getenv("ONNX_PARITY_MIN_COSINE", "0.98"))
+    EMBEDDING_NUM_THREADS = int(os.getenv("EMBEDDING_NUM_THREADS", "0"))  # 0表示使用默认值
+    EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "auto").lower()  # auto/cpu/cuda
+    EMBEDDING_PRECISION = os.getenv("EMBEDDING_PRECISION", "fp32").lower()  # fp32/fp16/bf16，仅torch后端
+
+    # 批量编码配置：按token长度分桶，每批 (条数 × 最长token数) 不超过预算
+    EMBEDDING_TOKEN_BUDGET = int(os.getenv("EMBEDDING_TOKEN_BUDGET", "8192"))
+    EMBEDDING_ENCODE_MAX_BATCH = int(os.getenv("EMBEDDING_ENCODE_MAX_BATCH", "128"))
+
+    # 查询向量微批处理配置
+    EMBEDDING_BATCHING_ENABLED = os.getenv("EMBEDDING_BATCHING_ENABLED", "true").lower() == "true"
+    EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "32"))
+    EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+    EMBEDDING_BATCH_QUEUE_SIZE = int(os.getenv("EMBEDDING_BATCH_QUEUE_SIZE", "128"))  # 0表示不限制
+
+    # 查询向量缓存配置（0表示禁用缓存/不过期）
+    EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+    EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", "0"))
+    EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float16")  # float16/float32
+
+    # 检索执行器配置（嵌入计算与向量库查询在独立线程池中执行）
+    RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "4"))
+    RETRIEVAL_QUEUE_SIZE = int(os.getenv("RETRIEVAL_QUEUE_SIZE", "64"))
+
     # 向量数据库配置
-    VECTOR_DB_TYPE = "chroma"  # chroma/qdrant
+    VECTOR_DB_TYPE = os.getenv("VECTOR_DB_TYPE", "chroma").lower()  # chroma/numpy
     COLLECTION_NAME = "conscription"
 
+    # NumPy 向量存储配置（内存映射矩阵 + 精确 top-k，VECTOR_DB_TYPE=numpy 时生效）
+    NUMPY_STORE_DIR = os.path.join(VECTOR_STORE_DIR, "numpy_store")
+    NUMPY_STORE_DTYPE = os.getenv("NUMPY_STORE_DTYPE", "float32")  # float32/float16
+    NUMPY_FILTER_FIELDS = tuple(
+        field.strip() for field in os.getenv("NUMPY_FILTER_FIELDS", "source,file_type").split(",") if field.strip()
+    )
+    NUMPY_SCAN_BLOCK_SIZE = int(os.getenv("NUMPY_SCAN_BLOCK_SIZE", "16384"))
+
+    # 近似索引配置（IVF-PQ，仅 numpy 存储支持；flat 为精确检索）
+    VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat").lower()  # flat/ivfpq
+    IVFPQ_INDEX_DIR = os.path.join(VECTOR_STORE_DIR, "ivfpq_index")
+    IVFPQ_NLIST = int(os.getenv("IVFPQ_NLIST", "0"))  # 0表示按 4·√N 自动确定
+    IVFPQ_M = int(os.getenv("IVFPQ_M", "64"))  # 子空间数，即每个向量的编码字节数
+    IVFPQ_TRAIN_SAMPLE = int(os.getenv("IVFPQ_TRAIN_SAMPLE", "100000"))
+    IVFPQ_KMEANS_ITERS = int(os.getenv("IVFPQ_KMEANS_ITERS", "20"))
+    IVFPQ_NPROBE = int(os.getenv("IVFPQ_NPROBE", "16"))
+    IVFPQ_SHORTLIST = int(os.getenv("IVFPQ_SHORTLIST", "200"))
+
+    # 混合检索配置（BGE-M3 稀疏词汇权重 + 稠密向量，同一次前向计算）
+    SPARSE_INDEX_DIR = os.path.join(VECTOR_STORE_DIR, "sparse_index")
+    BUILD_SPARSE_INDEX = os.getenv("BUILD_SPARSE_INDEX", "true").lower() == "true"
+    HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "false").lower() == "true"
+    HYBRID_FUSION = os.getenv("HYBRID_FUSION", "rrf").lower()  # rrf/weighted
+    HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+    HYBRID_DENSE_WEIGHT = float(os.getenv("HYBRID_DENSE_WEIGHT", "1.0"))
+    HYBRID_SPARSE_WEIGHT = float(os.getenv("HYBRID_SPARSE_WEIGHT", "1.0"))
+    HYBRID_CANDIDATE_MULTIPLIER = int(os.getenv("HYBRID_CANDIDATE_MULTIPLIER", "4"))
+
+    # BM25关键词检索配置（中文分词，与向量检索并行查询后按融合方法合并）
+    BM25_INDEX_DIR = os.path.join(VECTOR_STORE_DIR, "bm25_index")
+    BUILD_BM25_INDEX = os.getenv("BUILD_BM25_INDEX", "true").lower() == "true"
+    BM25_ENABLED = os.getenv("BM25_ENABLED", "false").lower() == "true"
+    BM25_TOKENIZER = os.getenv("BM25_TOKENIZER", "jieba").lower()  # jieba/bigram
+    BM25_K1 = float(os.getenv("BM25_K1", "1.5"))
+    BM25_B = float(os.getenv("BM25_B", "0.75"))
+    BM25_WEIGHT = float(os.getenv("BM25_WEIGHT", "1.0"))
+    BM25_MAX_POSTINGS_PER_TERM = int(os.getenv("BM25_MAX_POSTINGS_PER_TERM", "5000"))  # 0表示不剪枝
+
+    # 重排序配置（交叉编码器，CPU批量打分；先召回 RERANK_CANDIDATES 个候选再保留 top_k）
+    RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+    RERANK_MODEL = os.getenv("RERANK_MODEL", "BAAI/bge-reranker-base")
+    RERANK_MODEL_PATH = os.path.join(BASE_DIR, "models", "bge-reranker")
+    RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+    RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+    RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "512"))
+    RERANK_TOKEN_BUDGET = int(os.getenv("RERANK_TOKEN_BUDGET", "8192"))
+    RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "0"))  # 0表示不限制
+    RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "10000"))
+    RERANK_CACHE_TTL = int(os.getenv("RERANK_CACHE_TTL", "3600"))
+
+    # 上下文打包配置（按估算token数控制提示词长度，0表示不限制）
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+    CONTEXT_MIN_TRUNCATED_TOKENS = int(os.getenv("CONTEXT_MIN_TRUNCATED_TOKENS", "64"))
+
     # 文本分割配置
     CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "500"))
     CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "50"))
@@ -38,24 +120,100 @@ class Config:
     DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "")
     DEEPSEEK_API_BASE = os.getenv("DEEPSEEK_API_BASE", "https://api.deepseek.com/v1")
     DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
+    DEEPSEEK_MAX_CONCURRENCY = int(os.getenv("DEEPSEEK_MAX_CONCURRENCY", "32"))
+    DEEPSEEK_TOKENS_PER_MINUTE = int(os.getenv("DEEPSEEK_TOKENS_PER_MINUTE", "0"))
 
     # Qwen API配置
     QWEN_API_KEY = os.getenv("QWEN_API_KEY", "")
     QWEN_API_BASE = os.getenv("QWEN_API_BASE", "https://dashscope.aliyuncs.com/compatible-mode/v1")
     QWEN_MODEL = os.getenv("QWEN_MODEL", "qwen-turbo")
+    QWEN_MAX_CONCURRENCY = int(os.getenv("QWEN_MAX_CONCURRENCY", "32"))
+    QWEN_TOKENS_PER_MINUTE = int(os.getenv("QWEN_TOKENS_PER_MINUTE", "0"))
 
     # Ollama配置
     OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
     OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "qwen3:4b")
+    OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "2"))
+    OLLAMA_TOKENS_PER_MINUTE = int(os.getenv("OLLAMA_TOKENS_PER_MINUTE", "0"))
+
+    # LLM请求排队配置（各后端独立排队，先进先出）
+    LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "64"))
+    LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+
+    # LLM连接池配置（每个后端一个长连接会话）
+    LLM_POOL_LIMIT = int(os.getenv("LLM_POOL_LIMIT", "100"))
+    LLM_POOL_LIMIT_PER_HOST = int(os.getenv("LLM_POOL_LIMIT_PER_HOST", "32"))
+    LLM_KEEPALIVE_TIMEOUT = float(os.getenv("LLM_KEEPALIVE_TIMEOUT", "60"))
+    LLM_DNS_CACHE_TTL = int(os.getenv("LLM_DNS_CACHE_TTL", "300"))
+
+    # LLM路由与健康检查配置
+    # fixed（默认）: 优先使用 LLM_BACKEND 指定（auto 时自动检测）的后端，不可用时按 DeepSeek、Qwen、Ollama 顺序切换
+    # fastest: 选择请求延迟最低的可用后端
+    LLM_ROUTING = os.getenv("LLM_ROUTING", "fixed").lower() or "fixed"
+    LLM_ROUTING_MIN_SAMPLES = int(os.getenv("LLM_ROUTING_MIN_SAMPLES", "5"))
+    # fastest 路由下把请求分给非首选后端的比例，使各后端持续积累请求延迟样本
+    LLM_ROUTING_EXPLORE_RATE = float(os.getenv("LLM_ROUTING_EXPLORE_RATE", "0.05"))
+    LLM_PROBE_INTERVAL = float(os.getenv("LLM_PROBE_INTERVAL", "15"))
+    LLM_PROBE_TIMEOUT = float(os.getenv("LLM_PROBE_TIMEOUT", "5"))
+    LLM_HEALTH_WINDOW = int(os.getenv("LLM_HEALTH_WINDOW", "100"))
+    LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+    LLM_BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+    LLM_BREAKER_MIN_SAMPLES = int(os.getenv("LLM_BREAKER_MIN_SAMPLES", "10"))
+    LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+    # LLM对冲请求配置：主后端超过对冲延迟仍无首个输出时向另一个可用后端发送相同请求
+    LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+    LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "90"))
+    LLM_HEDGE_DELAY_MS = float(os.getenv("LLM_HEDGE_DELAY_MS", "2000"))
+    LLM_HEDGE_COMPLETION_DELAY_MS = float(os.getenv("LLM_HEDGE_COMPLETION_DELAY_MS", "15000"))
+    LLM_HEDGE_MIN_DELAY_MS = float(os.getenv("LLM_HEDGE_MIN_DELAY_MS", "200"))
 
     # API服务配置
     API_HOST = os.getenv("API_HOST", "0.0.0.0")
     API_PORT = int(os.getenv("API_PORT", "8000"))
     DEBUG = os.getenv("DEBUG", "False").lower() in ("true", "1", "yes")
+    # 检索预热失败后在后台重试的间隔（秒）
+    WARMUP_RETRY_INTERVAL = float(os.getenv("WARMUP_RETRY_INTERVAL", "10"))
 
     # 缓存配置
     REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
     CACHE_TTL = int(os.getenv("CACHE_TTL", "259200"))  # 72小时
+    REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "64"))
+    REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "0.5"))  # 连接池耗尽时的等待时间
+    REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.5"))
+    REDIS_PROBE_INTERVAL = float(os.getenv("REDIS_PROBE_INTERVAL", "5"))
+    CACHE_L1_SIZE = int(os.getenv("CACHE_L1_SIZE", "1000"))  # 0表示不启用进程内缓存
+    CACHE_L1_TTL = int(os.getenv("CACHE_L1_TTL", "300"))
+    CACHE_COMPRESS_MIN_BYTES = int(os.getenv("CACHE_COMPRESS_MIN_BYTES", "512"))  # -1表示不压缩
+    CACHE_COMPRESS_LEVEL = int(os.getenv("CACHE_COMPRESS_LEVEL", "6"))
+    CACHE_INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "cache:invalidate")
+    CACHE_SWEEP_INTERVAL = int(os.getenv("CACHE_SWEEP_INTERVAL", "3600"))  # 旧命名空间清理间隔（秒）
+    CACHE_SWEEP_SCAN_COUNT = int(os.getenv("CACHE_SWEEP_SCAN_COUNT", "500"))
+
+    # 并发请求合并配置（相同问题共享一次检索与生成）
+    COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "True").lower() in ("true", "1", "yes")
+    COALESCE_LOCK_TTL = float(os.getenv("COALESCE_LOCK_TTL", "180"))  # 跨进程锁有效期，应大于一次生成的最长耗时
+    COALESCE_POLL_INTERVAL = float(os.getenv("COALESCE_POLL_INTERVAL", "0.2"))
+    COALESCE_WAIT_TIMEOUT = float(os.getenv("COALESCE_WAIT_TIMEOUT", "60"))
+
+    # 流式接口缓存回放: burst（一次性输出）/ paced（按块定时输出，模拟生成效果）
+    STREAM_REPLAY_MODE = os.getenv("STREAM_REPLAY_MODE", "burst").lower()
+    STREAM_REPLAY_CHUNK_CHARS = int(os.getenv("STREAM_REPLAY_CHUNK_CHARS", "8"))
+    STREAM_REPLAY_INTERVAL_MS = float(os.getenv("STREAM_REPLAY_INTERVAL_MS", "20"))
+
+    # 流式输出合并：首个token立即发送，之后窗口内到达的token合并为一个SSE事件
+    STREAM_COALESCE_WINDOW_MS = float(os.getenv("STREAM_COALESCE_WINDOW_MS", "20"))
+    STREAM_COALESCE_MAX_CHARS = int(os.getenv("STREAM_COALESCE_MAX_CHARS", "256"))
+    # JSON编解码器: auto（已安装 orjson 时使用）/ orjson / json
+    JSON_CODEC = os.getenv("JSON_CODEC", "auto").lower()
+
+    # 语义回答缓存配置（默认关闭：相似但不同的问题可能得到同一个回答，启用前需按业务问题评估阈值）
+    SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "False").lower() in ("true", "1", "yes")
+    SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "2000"))
+    # 阈值越低命中越多，但误命中（如只差否定词、数字或实体名的问题）也越多
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+    SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", "259200"))  # 0表示不过期
+    SEMANTIC_CACHE_DTYPE = os.getenv("SEMANTIC_CACHE_DTYPE", "float32")  # float16/float32
 
     @classmethod
     def validate(cls):
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+嵌入后端基准测试
+对比 torch / onnx / onnx-int8 的加载耗时、内存占用（RSS）、查询延迟、批量吞吐与向量一致性
+"""
+
+import os
+import sys
+import time
+import argparse
+import multiprocessing as mp
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 加载环境变量
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+QUERIES = [
+    "入伍年龄要求是什么？",
+    "大学生参军有哪些优惠政策",
+    "征兵体检的视力标准",
+    "义务兵家庭优待金如何发放",
+    "退役士兵安置方式有哪些",
+    "高校毕业生入伍学费补偿标准",
+    "征兵报名的时间和流程",
+    "女兵征集条件",
+]
+
+def _percentile(values, q):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+def _run_backend(backend_name: str, rounds: int, batch_size: int, result_queue):
+    """在独立子进程中运行单个后端，保证内存统计互不干扰"""
+    import psutil
+    import numpy as np
+    from api.services.embedding_engine import EmbeddingEngine
+
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+
+    start = time.perf_counter()
+    engine = EmbeddingEngine(backend=backend_name, device="cpu")
+    load_time = time.perf_counter() - start
+
+    # 预热
+    engine.encode_batch(QUERIES[:2])
+
+    latencies = []
+    for i in range(rounds):
+        query = QUERIES[i % len(QUERIES)]
+        start = time.perf_counter()
+        engine.encode(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    # 模拟文本块：长度不一的拼接文本
+    chunks = [("".join(QUERIES) * (1 + i % 6))[:500] for i in range(batch_size)]
+    start = time.perf_counter()
+    engine.encode_batch(chunks)
+    batch_time = time.perf_counter() - start
+
+    result_queue.put({
+        "backend": backend_name,
+        "load_time": load_time,
+        "rss_mb": (process.memory_info().rss - rss_before) / 1024 / 1024,
+        "p50_ms": _percentile(latencies, 50),
+        "p95_ms": _percentile(latencies, 95),
+        "batch_throughput": batch_size / batch_time,
+        "embeddings": np.asarray(engine.encode_batch(QUERIES))
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description="嵌入后端基准测试")
+    parser.add_argument('--backends', '-b', nargs='+', default=["torch", "onnx", "onnx-int8"],
+                       help='要测试的后端: torch onnx onnx-int8')
+    parser.add_argument('--rounds', '-n', type=int, default=50, help='单条查询测试轮数')
+    parser.add_argument('--batch-size', type=int, default=32, help='批量吞吐测试的文本块数量')
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    results = []
+
+    for backend_name in args.backends:
+        print(f"🔍 测试后端: {backend_name}")
+        queue = ctx.Queue()
+        process = ctx.Process(target=_run_backend, args=(backend_name, args.rounds, args.batch_size, queue))
+        process.start()
+        try:
+            results.append(queue.get(timeout=3600))
+        except Exception as e:
+            print(f"❌ {backend_name} 测试失败: {e}")
+        process.join()
+
+    if not results:
+        return
+
+    reference = next((r for r in results if r["backend"] == "torch"), None)
+
+    print("\n📊 测试结果")
+    print("=" * 90)
+    print(f"{'后端':<12}{'加载(s)':>10}{'RSS(MB)':>10}{'P50(ms)':>10}{'P95(ms)':>10}{'吞吐(条/s)':>14}{'最小余弦':>12}")
+    for r in results:
+        parity = "-"
+        if reference is not None:
+            cosines = (reference["embeddings"] * r["embeddings"]).sum(axis=1)
+            parity = f"{cosines.min():.5f}"
+        print(
+            f"{r['backend']:<12}{r['load_time']:>10.2f}{r['rss_mb']:>10.0f}"
+            f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['batch_throughput']:>14.1f}{parity:>12}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+流式转发基准测试
+用合成的 OpenAI 兼容 SSE 响应对比逐行解析+逐token编码（旧实现）与按字节块增量解析+合并输出，
+报告每CPU秒处理的token数（tokens/s/core）与输出的SSE事件数
+"""
+
+import os
+import sys
+import time
+import json
+import asyncio
+import argparse
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.services.stream_relay import SSEDataDecoder, iter_stream_content, coalesce_chunks
+from api.utils.json_codec import get_json_codec, resolve_json_codec
+
+TOKENS = ["知识", "库", "问答", "系统", "基于", "检索", "增强", "生成", "，", "the", " answer", " is", "。"]
+
+def _upstream(num_tokens: int) -> bytes:
+    """合成上游SSE响应体"""
+    lines = []
+    for i in range(num_tokens):
+        data = {
+            "id": "chatcmpl-benchmark",
+            "object": "chat.completion.chunk",
+            "created": 1700000000,
+            "model": "deepseek-chat",
+            "choices": [{"index": 0, "delta": {"content": TOKENS[i % len(TOKENS)]}, "finish_reason": None}]
+        }
+        lines.append(f"data: {json.dumps(data)}\n\n")
+    lines.append("data: [DONE]\n\n")
+    return "".join(lines).encode("utf-8")
+
+def _reads(body: bytes, read_bytes: int):
+    """按固定大小切分为网络读取块（切分点与行边界无关）"""
+    return [body[i:i + read_bytes] for i in range(0, len(body), read_bytes)]
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+def _openai_delta(data):
+    choices = data.get("choices")
+    if choices:
+        return choices[0].get("delta", {}).get("content")
+    return None
+
+async def run_legacy(body: bytes) -> int:
+    """旧实现：逐行解码、json.loads，每个token编码一个SSE事件（行已预先切好，不含读取开销）"""
+    events = 0
+    for line in body.split(b"\n"):
+        if line:
+            chunk = line.decode("utf-8").strip()
+            if chunk.startswith("data: "):
+                if chunk == "data: [DONE]":
+                    break
+                try:
+                    data = json.loads(chunk[6:])
+                    if "choices" in data and data["choices"]:
+                        delta = data["choices"][0].get("delta", {})
+                        if "content" in delta:
+                            f"data: {json.dumps({'content': delta['content']})}\n\n".encode("utf-8")
+                            events += 1
+                except json.JSONDecodeError:
+                    continue
+    return events
+
+async def run_relay(reads, codec_name: str, window: float, max_chars: int) -> int:
+    """新实现：按字节块增量解析，同一次读取的增量合并，再按时间窗口合并为SSE事件"""
+    codec = get_json_codec(codec_name)
+    contents = iter_stream_content(_aiter(reads), SSEDataDecoder(), codec.loads, _openai_delta)
+    events = 0
+    async for chunk in coalesce_chunks(contents, window=window, max_chars=max_chars):
+        f"data: {codec.dumps({'content': chunk})}\n\n".encode("utf-8")
+        events += 1
+    return events
+
+def _measure(label: str, make_coro, num_tokens: int, repeat: int):
+    best = None
+    events = 0
+    for _ in range(repeat):
+        start = time.process_time()
+        events = asyncio.run(make_coro())
+        elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    rate = num_tokens / best if best else float("inf")
+    print(f"{label:<36}{rate:>16,.0f}{events:>12}{best * 1000:>14.1f}")
+    return rate
+
+def main():
+    parser = argparse.ArgumentParser(description="流式转发基准测试")
+    parser.add_argument('--tokens', '-n', type=int, default=200_000, help='合成响应的token数')
+    parser.add_argument('--read-bytes', type=int, default=1024, help='每次网络读取的字节数')
+    parser.add_argument('--window-ms', type=float, default=0, help='输出合并窗口（毫秒），0表示只按读取块合并')
+    parser.add_argument('--max-chars', type=int, default=256, help='单个事件最多合并的字符数')
+    parser.add_argument('--repeat', type=int, default=3, help='重复次数（取CPU时间最短的一次）')
+    args = parser.parse_args()
+
+    body = _upstream(args.tokens)
+    reads = _reads(body, args.read_bytes)
+    window = args.window_ms / 1000.0
+
+    print(f"🔍 {args.tokens} 个token，{len(body) / 1024 / 1024:.1f} MB，{len(reads)} 次读取（每次 {args.read_bytes} 字节）")
+    print("=" * 78)
+    print(f"{'实现':<36}{'tokens/s/core':>16}{'SSE事件':>12}{'CPU(ms)':>14}")
+
+    baseline = _measure("legacy (逐行 + json)", lambda: run_legacy(body), args.tokens, args.repeat)
+    codecs = ["json"] + (["orjson"] if resolve_json_codec("orjson") == "orjson" else [])
+    for codec_name in codecs:
+        rate = _measure(
+            f"relay ({codec_name}, 窗口 {args.window_ms:g}ms)",
+            lambda: run_relay(reads, codec_name, window, args.max_chars),
+            args.tokens,
+            args.repeat
+        )
+        print(f"{'':<36}{rate / baseline:>15.1f}x")
+    if len(codecs) == 1:
+        print("ℹ️  orjson 未安装，跳过 orjson 测试: pip install orjson")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+向量存储基准测试
+使用随机归一化向量对比 numpy（内存映射精确检索）与 chroma 在不同规模下的
+写入耗时、磁盘占用、查询延迟（无过滤/带过滤）与 recall@k
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing as mp
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 加载环境变量
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+import numpy as np
+
+NUM_SOURCES = 200
+FILE_TYPES = [".pdf", ".docx", ".txt", ".md"]
+
+def _percentile(values, q):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+def _dir_size_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / 1024 / 1024
+
+def _synthetic_vectors(num_chunks: int, dim: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((num_chunks, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def _metadata(i: int):
+    return {
+        "source": f"/data/raw_documents/doc_{i % NUM_SOURCES}.pdf",
+        "file_type": FILE_TYPES[i % len(FILE_TYPES)],
+        "chunk_index": i
+    }
+
+def _run_store(store_type: str, num_chunks: int, dim: int, dtype: str, queries: int, top_k: int, result_queue):
+    """在独立子进程中构建并测试单个存储"""
+    workdir = tempfile.mkdtemp(prefix=f"bench_{store_type}_")
+    try:
+        import psutil
+        from api.services.vector_store import ChromaVectorStore, NumpyVectorStore
+
+        vectors = _synthetic_vectors(num_chunks, dim, seed=0)
+        query_vectors = _synthetic_vectors(queries, dim, seed=1)
+        # 查询向量偏向某个文本块，使近邻有区分度
+        query_vectors = query_vectors * 0.5 + vectors[:queries] * 0.5
+
+        if store_type == "chroma":
+            store = ChromaVectorStore(workdir, "benchmark", create=True)
+        else:
+            store = NumpyVectorStore(os.path.join(workdir, "store"), dtype=dtype, create=True)
+
+        start = time.perf_counter()
+        batch_size = 5000
+        for i in range(0, num_chunks, batch_size):
+            end = min(i + batch_size, num_chunks)
+            store.add(
+                ids=[f"chunk_{j}" for j in range(i, end)],
+                embeddings=vectors[i:end],
+                documents=[f"文本块 {j}" for j in range(i, end)],
+                metadatas=[_metadata(j) for j in range(i, end)]
+            )
+        store.persist()
+        build_time = time.perf_counter() - start
+        del store
+
+        # 重新打开，测量冷启动加载与内存
+        process = psutil.Process()
+        rss_before = process.memory_info().rss
+        start = time.perf_counter()
+        if store_type == "chroma":
+            store = ChromaVectorStore(workdir, "benchmark")
+        else:
+            store = NumpyVectorStore(os.path.join(workdir, "store"))
+        load_time = time.perf_counter() - start
+
+        # 精确结果（float32暴力检索）
+        exact = np.argpartition(-(query_vectors @ vectors.T), top_k - 1, axis=1)[:, :top_k]
+
+        store.query(query_vectors[0], top_k)  # 预热
+        latencies, recalls = [], []
+        for qi, query in enumerate(query_vectors):
+            start = time.perf_counter()
+            results = store.query(query, top_k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            expected = {f"chunk_{j}" for j in exact[qi]}
+            recalls.append(len(expected & {r["id"] for r in results}) / top_k)
+
+        where = {"file_type": {"$eq": ".pdf"}}
+        filtered = []
+        for query in query_vectors:
+            start = time.perf_counter()
+            store.query(query, top_k, where)
+            filtered.append((time.perf_counter() - start) * 1000)
+
+        result_queue.put({
+            "store": f"{store_type}" + (f"-{dtype}" if store_type == "numpy" else ""),
+            "num_chunks": num_chunks,
+            "build_time": build_time,
+            "load_time": load_time,
+            "disk_mb": _dir_size_mb(workdir),
+            "rss_mb": (process.memory_info().rss - rss_before) / 1024 / 1024,
+            "p50_ms": _percentile(latencies, 50),
+            "p95_ms": _percentile(latencies, 95),
+            "filtered_p50_ms": _percentile(filtered, 50),
+            "recall": float(np.mean(recalls))
+        })
+    except Exception as e:
+        result_queue.put({"error": f"{type(e).__name__}: {e}"})
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="向量存储基准测试")
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10_000, 100_000, 1_000_000],
+                       help='文本块数量')
+    parser.add_argument('--stores', nargs='+', default=["numpy-float16", "numpy-float32", "chroma"],
+                       help='要测试的存储: numpy-float16 numpy-float32 chroma')
+    parser.add_argument('--dim', type=int, default=1024, help='向量维度（BGE-M3为1024）')
+    parser.add_argument('--queries', '-n', type=int, default=100, help='查询次数')
+    parser.add_argument('--top-k', '-k', type=int, default=10, help='返回结果数量')
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    results = []
+
+    for num_chunks in args.sizes:
+        for store_name in args.stores:
+            store_type, _, dtype = store_name.partition("-")
+            print(f"🔍 测试 {store_name} @ {num_chunks} 个文本块")
+            queue = ctx.Queue()
+            process = ctx.Process(
+                target=_run_store,
+                args=(store_type, num_chunks, args.dim, dtype or "float32", args.queries, args.top_k, queue)
+            )
+            process.start()
+            try:
+                result = queue.get(timeout=6 * 3600)
+                if "error" in result:
+                    print(f"❌ {store_name} 测试失败: {result['error']}")
+                else:
+                    results.append(result)
+            except Exception as e:
+                print(f"❌ {store_name} 测试失败: {e}")
+            process.join()
+
+    if not results:
+        return
+
+    print("\n📊 测试结果")
+    print("=" * 118)
+    print(
+        f"{'存储':<16}{'文本块':>10}{'写入(s)':>10}{'加载(s)':>10}{'磁盘(MB)':>10}{'RSS(MB)':>10}"
+        f"{'P50(ms)':>10}{'P95(ms)':>10}{'过滤P50(ms)':>14}{f'recall@{args.top_k}':>12}"
+    )
+    for r in results:
+        print(
+            f"{r['store']:<16}{r['num_chunks']:>10}{r['build_time']:>10.1f}{r['load_time']:>10.2f}"
+            f"{r['disk_mb']:>10.0f}{r['rss_mb']:>10.0f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}"
+            f"{r['filtered_p50_ms']:>14.2f}{r['recall']:>12.3f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,6 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 
-import torch
-from transformers import AutoTokenizer, AutoModel
 import numpy as np
 
 from dotenv import load_dotenv
@@ -13,17 +11,21 @@ load_dotenv()
 
 
 from config import config
+from api.services.embedding_engine import EmbeddingEngine
+from api.services.vector_store import open_vector_store
+from api.services.inverted_index import InvertedIndex
+from api.services.bm25_index import build_bm25_index
+from api.services.ivfpq_index import IVFPQIndex
+from api.services.kb_fingerprint import compute_fingerprint, write_fingerprint
 import hashlib
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 
 # 文本处理模块
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
 
-import chromadb
-from chromadb.config import Settings
 
 class KnowledgeBaseBuilder:
     """知识库构建器"""
@@ -52,109 +54,41 @@ class KnowledgeBaseBuilder:
         """Load embedding model from local or online"""
         print("正在加载BGE嵌入模型...")
 
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        print(f"使用设备: {self.device}")
-
-        if self.use_local:
-            # Load from local path
-            print(f"从本地加载模型: {self.config.EMBEDDING_MODEL_PATH}")
-            
-            if not os.path.exists(self.config.EMBEDDING_MODEL_PATH):
-                raise FileNotFoundError(
-                    f"本地模型路径不存在: {self.config.EMBEDDING_MODEL_PATH}\n"
-                    f"请先下载模型或使用在线模式"
-                )
-            
-            self.tokenizer = AutoTokenizer.from_pretrained(
-                self.config.EMBEDDING_MODEL_PATH,
-                local_files_only=True
-            )
-            
-            self.embedding_model = AutoModel.from_pretrained(
-                self.config.EMBEDDING_MODEL_PATH,
-                local_files_only=True
-            ).to(self.device)
-            
-        else:
-            # Load from HuggingFace online
-            print(f"从HuggingFace在线加载模型: {self.config.EMBEDDING_MODEL}")
-            
-            self.tokenizer = AutoTokenizer.from_pretrained(
-                self.config.EMBEDDING_MODEL
-            )
-            
-            self.embedding_model = AutoModel.from_pretrained(
-                self.config.EMBEDDING_MODEL
-            ).to(self.device)
-            
-            # Optionally save for future use
-            if hasattr(self.config, 'SAVE_MODEL_AFTER_DOWNLOAD') and self.config.SAVE_MODEL_AFTER_DOWNLOAD:
-                print(f"保存模型到本地: {self.config.EMBEDDING_MODEL_PATH}")
-                os.makedirs(self.config.EMBEDDING_MODEL_PATH, exist_ok=True)
-                self.tokenizer.save_pretrained(self.config.EMBEDDING_MODEL_PATH)
-                self.embedding_model.save_pretrained(self.config.EMBEDDING_MODEL_PATH)
+        self.embedding_engine = EmbeddingEngine(
+            use_local=self.use_local,
+            save_after_download=getattr(self.config, 'SAVE_MODEL_AFTER_DOWNLOAD', False),
+            sparse=self.config.BUILD_SPARSE_INDEX
+        )
+        self.device = self.embedding_engine.device
         
-        self.embedding_model.eval()
         print("模型加载完成！")
     
-    def encode_texts(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
-        """Encode texts to embeddings using BGE model"""
-        all_embeddings = []
-        
-        with torch.no_grad():
-            for i in range(0, len(texts), batch_size):
-                batch_texts = texts[i:i + batch_size]
-                
-                # Tokenize
-                encoded = self.tokenizer(
-                    batch_texts,
-                    padding=True,
-                    truncation=True,
-                    max_length=512,
-                    return_tensors='pt'
-                ).to(self.device)
-                
-                # Get embeddings
-                outputs = self.embedding_model(**encoded)
-                
-                # Use CLS token embedding (first token)
-                embeddings = outputs.last_hidden_state[:, 0]
-                
-                # Normalize embeddings
-                embeddings = torch.nn.functional.normalize(embeddings, p=2, dim=1)
-                
-                all_embeddings.append(embeddings.cpu().numpy())
-                
-                if (i // batch_size + 1) % 10 == 0:
-                    print(f"已处理 {min(i + batch_size, len(texts))}/{len(texts)} 个文本")
-        
-        return np.vstack(all_embeddings)
+    def encode_texts(self, texts: List[str], token_budget: int = None, return_sparse: bool = False):
+        """Encode texts to embeddings using BGE model (length-bucketed, original order kept)
+
+        With return_sparse=True, returns (embeddings, sparse lexical weights) from one forward pass.
+        """
+        progress = {"reported": 0}
+
+        def report(done: int, total: int):
+            # 每处理约10%输出一次进度
+            if done == total or done - progress["reported"] >= max(1, total // 10):
+                progress["reported"] = done
+                print(f"已处理 {done}/{total} 个文本")
+
+        return self.embedding_engine.encode_batch(
+            texts,
+            token_budget=token_budget,
+            progress_callback=report,
+            return_sparse=return_sparse
+        )
         
     def init_vector_store(self):
         """初始化向量数据库"""
         print("初始化向量数据库...")
-        
-        if self.config.VECTOR_DB_TYPE == "chroma":
-            self.chroma_client = chromadb.PersistentClient(
-                path=self.config.VECTOR_STORE_DIR,
-                settings=Settings(
-                    anonymized_telemetry=False,
-                    allow_reset=True
-                )
-            )
-            
-            # 创建或获取集合
-            try:
-                self.collection = self.chroma_client.get_collection(
-                    self.config.COLLECTION_NAME
-                )
-                print(f"使用现有集合: {self.config.COLLECTION_NAME}")
-            except:
-                self.collection = self.chroma_client.create_collection(
-                    name=self.config.COLLECTION_NAME,
-                    metadata={"description": "公司知识库", "created_at": datetime.now().isoformat()}
-                )
-                print(f"创建新集合: {self.config.COLLECTION_NAME}")
+
+        self.vector_store = open_vector_store(create=True)
+        print(f"使用向量存储: {self.vector_store.name}（已有 {self.vector_store.count()} 个文本块）")
     
     def load_documents(self, directory: str) -> List[Dict[str, Any]]:
         """加载所有文档"""
@@ -258,41 +192,123 @@ class KnowledgeBaseBuilder:
         
     #     return embeddings.tolist()
     
-    def generate_embeddings(self, chunks: List[Dict]) -> List[List[float]]:
-        """生成文本嵌入向量"""
+    def generate_embeddings(self, chunks: List[Dict]) -> Tuple[List[List[float]], Optional[List[Dict[str, float]]]]:
+        """生成文本嵌入向量，启用稀疏索引时同时返回稀疏权重"""
         print("正在生成嵌入向量...")
         
         texts = [chunk["text"] for chunk in chunks]
-        embeddings = self.encode_texts(texts, batch_size=32)
-        
-        return embeddings.tolist()
+
+        if self.config.BUILD_SPARSE_INDEX and self.embedding_engine.supports_sparse:
+            embeddings, sparse_weights = self.encode_texts(texts, return_sparse=True)
+            return embeddings.tolist(), sparse_weights
+
+        embeddings = self.encode_texts(texts)
+        return embeddings.tolist(), None
     
     def store_to_vector_db(self, chunks: List[Dict], embeddings: List[List[float]]):
         """存储到向量数据库"""
         print("正在存储到向量数据库...")
         
-        if self.config.VECTOR_DB_TYPE == "chroma":
-            # 准备数据
-            ids = [chunk["id"] for chunk in chunks]
-            documents = [chunk["text"] for chunk in chunks]
-            metadatas = [chunk["metadata"] for chunk in chunks]
+        # 准备数据
+        ids = [chunk["id"] for chunk in chunks]
+        documents = [chunk["text"] for chunk in chunks]
+        metadatas = [chunk["metadata"] for chunk in chunks]
+        
+        # 分批存储，避免内存问题
+        batch_size = 100
+        for i in range(0, len(ids), batch_size):
+            end_idx = min(i + batch_size, len(ids))
             
-            # 分批存储，避免内存问题
-            batch_size = 100
-            for i in range(0, len(ids), batch_size):
-                end_idx = min(i + batch_size, len(ids))
-                
-                self.collection.add(
-                    ids=ids[i:end_idx],
-                    embeddings=embeddings[i:end_idx],
-                    documents=documents[i:end_idx],
-                    metadatas=metadatas[i:end_idx]
-                )
-                
-                print(f"已存储 {end_idx}/{len(ids)} 个文本块")
+            self.vector_store.add(
+                ids=ids[i:end_idx],
+                embeddings=embeddings[i:end_idx],
+                documents=documents[i:end_idx],
+                metadatas=metadatas[i:end_idx]
+            )
+            
+            print(f"已存储 {end_idx}/{len(ids)} 个文本块")
+
+        self.vector_store.persist()
         
         print("向量数据库存储完成！")
+
+    def build_ann_index(self):
+        """离线训练IVF-PQ近似索引并输出内存报告"""
+        if self.vector_store.name != "numpy":
+            print("⚠️  IVF-PQ索引仅支持 numpy 向量存储（VECTOR_DB_TYPE=numpy），跳过")
+            return
+
+        print("正在训练IVF-PQ近似索引...")
+        start_time = datetime.now()
+        index = IVFPQIndex.train(
+            self.vector_store.embeddings,
+            nlist=self.config.IVFPQ_NLIST,
+            m=self.config.IVFPQ_M,
+            train_sample=self.config.IVFPQ_TRAIN_SAMPLE,
+            iterations=self.config.IVFPQ_KMEANS_ITERS
+        )
+        index.meta["store_built_at"] = self.vector_store.meta.get("built_at")
+        index.save(self.config.IVFPQ_INDEX_DIR)
+        elapsed = (datetime.now() - start_time).total_seconds()
+
+        memory = index.meta["memory"]
+        print(f"IVF-PQ索引已保存: {index.num_vectors} 个向量, nlist {index.nlist}, m {index.m}, 耗时 {elapsed:.1f}秒")
+        print("内存报告（每百万文本块）:")
+        print(f"   IVF-PQ索引: {memory['index_mb_per_million']:.0f} MB（每向量 {memory['bytes_per_vector']} 字节）")
+        print(f"   平铺 float32: {memory['flat_float32_mb_per_million']:.0f} MB")
+        print(f"   平铺 float16: {memory['flat_float16_mb_per_million']:.0f} MB")
+        print(f"   当前索引常驻: {memory['index_mb']:.1f} MB，完整向量仅在重排时按需从内存映射读取")
+
+    def store_sparse_index(self, chunks: List[Dict], sparse_weights: List[Dict[str, float]], rebuild: bool = False):
+        """构建并保存稀疏倒排索引，增量模式下与已有索引合并"""
+        print("正在构建稀疏倒排索引...")
+
+        doc_ids = [chunk["id"] for chunk in chunks]
+        if not rebuild and InvertedIndex.exists(self.config.SPARSE_INDEX_DIR):
+            existing_ids, existing_weights = InvertedIndex.load(
+                self.config.SPARSE_INDEX_DIR, mmap=False
+            ).to_documents()
+            doc_ids = existing_ids + doc_ids
+            sparse_weights = existing_weights + sparse_weights
+
+        index = InvertedIndex.build(
+            doc_ids,
+            sparse_weights,
+            meta={
+                "type": "bge-m3-sparse",
+                "embedding_model": self.config.EMBEDDING_MODEL,
+                "built_at": datetime.now().isoformat()
+            }
+        )
+        index.save(self.config.SPARSE_INDEX_DIR)
+
+        print(f"稀疏索引已保存: {index.meta['num_docs']} 个文本块, {index.meta['num_terms']} 个词项")
     
+    def store_bm25_index(self, page_size: int = 1000):
+        """基于向量存储中的全部文本块重建BM25索引（IDF依赖全量语料，增量构建时同样全量重建）"""
+        print("正在构建BM25关键词索引...")
+
+        doc_ids: List[str] = []
+        texts: List[str] = []
+        for page_ids, page_texts in self.vector_store.iter_documents(page_size):
+            doc_ids.extend(page_ids)
+            texts.extend(page_texts)
+
+        index = build_bm25_index(
+            doc_ids,
+            texts,
+            tokenizer=self.config.BM25_TOKENIZER,
+            k1=self.config.BM25_K1,
+            b=self.config.BM25_B
+        )
+        index.meta["built_at"] = datetime.now().isoformat()
+        index.save(self.config.BM25_INDEX_DIR)
+
+        print(
+            f"BM25索引已保存: {index.meta['num_docs']} 个文本块, {index.meta['num_terms']} 个词项, "
+            f"分词器 {index.meta['tokenizer']}"
+        )
+
     def save_chunks_info(self, chunks: List[Dict]):
         """保存文本块信息到文件"""
         print("正在保存文本块信息...")
@@ -316,6 +332,7 @@ class KnowledgeBaseBuilder:
             "avg_chunk_size": sum(len(chunk["text"]) for chunk in chunks) / len(chunks),
             "built_at": datetime.now().isoformat(),
             "embedding_model": self.config.EMBEDDING_MODEL,
+            "embedding_backend": self.embedding_engine.name,
             "chunk_size": self.config.CHUNK_SIZE,
             "chunk_overlap": self.config.CHUNK_OVERLAP
         }
@@ -324,19 +341,27 @@ class KnowledgeBaseBuilder:
             json.dump(stats, f, ensure_ascii=False, indent=2)
         
         print(f"统计信息已保存到 {stats_file}")
+
+    def save_fingerprint(self, chunks: List[Dict]):
+        """写入知识库构建指纹，API的回答缓存按指纹划分命名空间，内容变化后旧回答自动失效"""
+        settings = {
+            "embedding_model": self.config.EMBEDDING_MODEL,
+            "chunk_size": self.config.CHUNK_SIZE,
+            "chunk_overlap": self.config.CHUNK_OVERLAP,
+            "total_chunks": self.vector_store.count()
+        }
+        fingerprint = compute_fingerprint(chunks, settings)
+        write_fingerprint(self.config.KB_FINGERPRINT_FILE, fingerprint, settings)
+        print(f"知识库指纹: {fingerprint}")
     
     def build(self, rebuild: bool = False):
         """构建知识库"""
         print("开始构建知识库...")
         start_time = datetime.now()
         
-        if rebuild and self.config.VECTOR_DB_TYPE == "chroma":
+        if rebuild:
             print("重置向量数据库...")
-            try:
-                self.chroma_client.delete_collection(self.config.COLLECTION_NAME)
-            except:
-                pass
-            self.init_vector_store()
+            self.vector_store.reset()
         
         # 确保目录存在
         os.makedirs(self.config.RAW_DOCS_DIR, exist_ok=True)
@@ -351,9 +376,16 @@ class KnowledgeBaseBuilder:
             return
         
         chunks = self.chunk_documents(documents)
-        embeddings = self.generate_embeddings(chunks)
+        embeddings, sparse_weights = self.generate_embeddings(chunks)
         self.store_to_vector_db(chunks, embeddings)
+        if self.config.VECTOR_INDEX_TYPE == "ivfpq":
+            self.build_ann_index()
+        if sparse_weights is not None:
+            self.store_sparse_index(chunks, sparse_weights, rebuild=rebuild)
+        if self.config.BUILD_BM25_INDEX:
+            self.store_bm25_index()
         self.save_chunks_info(chunks)
+        self.save_fingerprint(chunks)
         
         elapsed = (datetime.now() - start_time).total_seconds()
         print(f"知识库构建完成！耗时: {elapsed:.2f}秒")
@@ -8,7 +8,7 @@ import os
 import sys
 import json
 import argparse
-import warnings
+import shutil
 from pathlib import Path
 
 # 添加项目根目录到路径
@@ -22,7 +22,8 @@ except ImportError:
     pass
 
 from config import config
-import chromadb
+from api.services.vector_store import open_vector_store
+from api.services.kb_fingerprint import read_fingerprint
 
 def show_stats():
     """显示知识库统计信息"""
@@ -31,18 +32,51 @@ def show_stats():
     
     # 检查向量数据库
     try:
-        client = chromadb.PersistentClient(path=config.VECTOR_STORE_DIR)
-        collection = client.get_collection(config.COLLECTION_NAME)
-        count = collection.count()
+        store = open_vector_store()
+        count = store.count()
         
         print(f"✅ 向量数据库: 已连接")
-        print(f"   集合名称: {config.COLLECTION_NAME}")
+        print(f"   存储类型: {store.name}")
+        if store.name == "chroma":
+            print(f"   集合名称: {config.COLLECTION_NAME}")
         print(f"   文档块数量: {count}")
         
     except Exception as e:
         print(f"❌ 向量数据库: 未初始化或错误")
         print(f"   错误: {e}")
     
+    # 检查稀疏索引
+    sparse_meta_file = Path(config.SPARSE_INDEX_DIR) / "meta.json"
+    if sparse_meta_file.exists():
+        with open(sparse_meta_file, 'r', encoding='utf-8') as f:
+            sparse_meta = json.load(f)
+        print(f"✅ 稀疏索引: {sparse_meta.get('num_docs', 0)} 个文本块, {sparse_meta.get('num_terms', 0)} 个词项")
+
+    # 检查IVF-PQ近似索引
+    ivfpq_meta_file = Path(config.IVFPQ_INDEX_DIR) / "meta.json"
+    if ivfpq_meta_file.exists():
+        with open(ivfpq_meta_file, 'r', encoding='utf-8') as f:
+            ivfpq_meta = json.load(f)
+        memory = ivfpq_meta.get('memory', {})
+        print(
+            f"✅ IVF-PQ索引: {ivfpq_meta.get('num_vectors', 0)} 个向量, "
+            f"nlist {ivfpq_meta.get('nlist')}, m {ivfpq_meta.get('m')}"
+        )
+        print(
+            f"   每百万文本块内存: {memory.get('index_mb_per_million', 0):.0f} MB "
+            f"（平铺 float32 {memory.get('flat_float32_mb_per_million', 0):.0f} MB）"
+        )
+
+    # 检查BM25索引
+    bm25_meta_file = Path(config.BM25_INDEX_DIR) / "meta.json"
+    if bm25_meta_file.exists():
+        with open(bm25_meta_file, 'r', encoding='utf-8') as f:
+            bm25_meta = json.load(f)
+        print(
+            f"✅ BM25索引: {bm25_meta.get('num_docs', 0)} 个文本块, {bm25_meta.get('num_terms', 0)} 个词项, "
+            f"分词器 {bm25_meta.get('tokenizer')}"
+        )
+    
     # 检查处理后的文件
     stats_file = Path(config.PROCESSED_DIR) / "stats.json"
     if stats_file.exists():
@@ -55,6 +89,7 @@ def show_stats():
         print(f"   平均块大小: {stats.get('avg_chunk_size', 0):.0f} 字符")
         print(f"   构建时间: {stats.get('built_at', 'N/A')}")
         print(f"   嵌入模型: {stats.get('embedding_model', 'N/A')}")
+        print(f"   缓存命名空间: {read_fingerprint(config.KB_FINGERPRINT_FILE) or 'N/A'}")
     
     # 检查原始文档
     raw_docs_dir = Path(config.RAW_DOCS_DIR)
@@ -117,13 +152,30 @@ def clear_knowledge_base():
     
     try:
         # 删除向量数据库
-        client = chromadb.PersistentClient(path=config.VECTOR_STORE_DIR)
         try:
-            client.delete_collection(config.COLLECTION_NAME)
+            open_vector_store().reset()
             print("✅ 向量数据库已清空")
-        except:
+        except ValueError:
             print("⚠️  向量数据库集合不存在")
         
+        # 删除稀疏倒排索引
+        sparse_dir = Path(config.SPARSE_INDEX_DIR)
+        if sparse_dir.exists():
+            shutil.rmtree(sparse_dir)
+            print("✅ 稀疏索引已清空")
+
+        # 删除IVF-PQ近似索引
+        ivfpq_dir = Path(config.IVFPQ_INDEX_DIR)
+        if ivfpq_dir.exists():
+            shutil.rmtree(ivfpq_dir)
+            print("✅ IVF-PQ索引已清空")
+
+        # 删除BM25索引
+        bm25_dir = Path(config.BM25_INDEX_DIR)
+        if bm25_dir.exists():
+            shutil.rmtree(bm25_dir)
+            print("✅ BM25索引已清空")
+        
         # 清空处理后的文件
         processed_dir = Path(config.PROCESSED_DIR)
         if processed_dir.exists():
@@ -143,93 +195,31 @@ def search_test(query: str, top_k: int = 5):
     print("=" * 50)
     
     try:
-        import torch
-        import numpy as np
-        from transformers import AutoTokenizer, AutoModel
-        
-        # 确定是否使用本地模型
-        use_local = os.path.exists(config.EMBEDDING_MODEL_PATH)
+        from api.services.embedding_engine import EmbeddingEngine
         
         # 加载模型
         print("加载嵌入模型...")
-        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        print(f"使用设备: {device}")
-        
-        if use_local:
-            print(f"从本地加载: {config.EMBEDDING_MODEL_PATH}")
-            
-            # Suppress the incorrect Mistral regex warning
-            with warnings.catch_warnings():
-                warnings.filterwarnings('ignore', message='.*fix_mistral_regex.*')
-                
-                tokenizer = AutoTokenizer.from_pretrained(
-                    config.EMBEDDING_MODEL_PATH,
-                    local_files_only=True
-                )
-            
-            model = AutoModel.from_pretrained(
-                config.EMBEDDING_MODEL_PATH,
-                local_files_only=True
-            ).to(device)
-        else:
-            print(f"从在线加载: {config.EMBEDDING_MODEL}")
-            
-            tokenizer = AutoTokenizer.from_pretrained(
-                config.EMBEDDING_MODEL
-            )
-            
-            model = AutoModel.from_pretrained(
-                config.EMBEDDING_MODEL
-            ).to(device)
-        
-        model.eval()
+        engine = EmbeddingEngine()
         print("模型加载完成")
         
         # 连接数据库
         print("连接向量数据库...")
-        client = chromadb.PersistentClient(path=config.VECTOR_STORE_DIR)
-        collection = client.get_collection(config.COLLECTION_NAME)
+        store = open_vector_store()
         
         # 生成查询向量
         print("生成查询向量...")
-        with torch.no_grad():
-            encoded = tokenizer(
-                query,
-                padding=True,
-                truncation=True,
-                max_length=512,
-                return_tensors='pt'
-            ).to(device)
-            
-            outputs = model(**encoded)
-            
-            # Use CLS token embedding
-            embedding = outputs.last_hidden_state[:, 0]
-            
-            # Normalize
-            embedding = torch.nn.functional.normalize(embedding, p=2, dim=1)
-            
-            query_embedding = embedding.cpu().numpy()[0].tolist()
+        query_embedding = engine.encode(query)
         
         # 搜索
         print("执行搜索...")
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k,
-            include=["documents", "metadatas", "distances"]
-        )
+        results = store.query(query_embedding, top_k)
         
-        print(f"\n找到 {len(results['documents'][0])} 个结果:\n")
+        print(f"\n找到 {len(results)} 个结果:\n")
         
-        for i, (doc, metadata, distance) in enumerate(zip(
-            results['documents'][0],
-            results['metadatas'][0],
-            results['distances'][0]
-        ), 1):
-            score = 1 - distance
-            print(f"{i}. 相似度: {score:.4f}")
-            print(f"   来源: {Path(metadata.get('source', '')).name}")
-            print(f"   内容: {doc[:100]}...")
+        for i, result in enumerate(results, 1):
+            print(f"{i}. 相似度: {result['score']:.4f}")
+            print(f"   来源: {Path(result['metadata'].get('source', '')).name}")
+            print(f"   内容: {result['text'][:100]}...")
             print()
         
     except Exception as e:
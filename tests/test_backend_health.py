@@ -0,0 +1,261 @@
+import asyncio
+import types
+
+import pytest
+
+from api.services import backend_health
+from api.services.backend_health import BackendHealth, CircuitBreaker
+from config import config
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(backend_health, "time", types.SimpleNamespace(monotonic=clock.monotonic, time=clock.time))
+    return clock
+
+def make_health(cooldown=30):
+    return BackendHealth("test", breaker=CircuitBreaker(failure_threshold=3, cooldown=cooldown))
+
+def open_breaker(health):
+    for _ in range(3):
+        health.record_request(False, error="HTTP 500")
+    assert health.breaker.state == CircuitBreaker.OPEN
+
+def test_open_cooldown_half_open_closed_via_probe(clock):
+    health = make_health()
+    open_breaker(health)
+
+    # 冷却期间探测成功不关闭熔断器
+    assert not health.breaker.try_trial()
+    health.record_probe(True, 0.05)
+    assert health.breaker.state == CircuitBreaker.OPEN
+    assert not health.breaker.can_attempt()
+
+    clock.now += 31
+    assert health.breaker.state == CircuitBreaker.HALF_OPEN
+
+    # 探测持有试探名额，期间请求不能再试探
+    assert health.breaker.try_trial()
+    assert not health.breaker.acquire()
+    health.record_probe(True, 0.05, trial=True)
+    assert health.breaker.state == CircuitBreaker.CLOSED
+    assert health.breaker.consecutive_failures == 0
+
+def test_half_open_probe_failure_reopens(clock):
+    health = make_health()
+    open_breaker(health)
+    clock.now += 31
+    assert health.breaker.try_trial()
+    health.record_probe(False, error="timeout", trial=True)
+    assert health.breaker.state == CircuitBreaker.OPEN
+
+    # 重新打开后再次计算冷却时间
+    clock.now += 10
+    assert health.breaker.state == CircuitBreaker.OPEN
+    clock.now += 21
+    assert health.breaker.state == CircuitBreaker.HALF_OPEN
+
+def test_half_open_request_trial(clock):
+    health = make_health()
+    open_breaker(health)
+    clock.now += 31
+    assert health.breaker.acquire()
+    assert not health.breaker.try_trial()
+    health.record_request(True, 0.2)
+    assert health.breaker.state == CircuitBreaker.CLOSED
+
+def test_probe_success_without_trial_does_not_close_half_open(clock):
+    health = make_health()
+    open_breaker(health)
+    clock.now += 31
+    health.record_probe(True, 0.05)
+    assert health.breaker.state == CircuitBreaker.HALF_OPEN
+
+def test_probes_do_not_dilute_request_error_rate(clock):
+    health = BackendHealth(
+        "test",
+        breaker=CircuitBreaker(failure_threshold=100, error_rate_threshold=0.5, min_samples=4)
+    )
+    for _ in range(20):
+        health.record_probe(True, 0.05)
+    health.record_request(True, 0.2)
+    health.record_request(False, error="HTTP 429")
+    health.record_request(True, 0.2)
+    health.record_probe(True, 0.05)
+    health.record_request(False, error="HTTP 429")
+    assert health.error_rate == 0.5
+    assert health.breaker.state == CircuitBreaker.OPEN
+
+def test_stream_and_completion_latencies_are_separate():
+    health = BackendHealth("test")
+    for _ in range(10):
+        health.record_request(True, 0.3, stream=True)
+        health.record_request(True, 8.0, stream=False)
+    health.record_censored(12.0, stream=False)
+    assert health.request_samples(stream=True) == 10
+    assert health.request_samples(stream=False) == 11
+    assert health.latency(90, stream=True) == pytest.approx(0.3)
+    assert health.latency(50, stream=False) == pytest.approx(8.0)
+    assert health.latency(100, stream=False) == pytest.approx(12.0)
+
+@pytest.fixture
+def llm_service(monkeypatch):
+    from api.services import unified_llm_service
+    from api.services.unified_llm_service import LLMBackend, UnifiedLLMService
+
+    monkeypatch.setattr(UnifiedLLMService, "_instance", None)
+    service = UnifiedLLMService()
+    service.routing = "fixed"
+    service.current_backend = LLMBackend.DEEPSEEK
+    service.configs[LLMBackend.DEEPSEEK]["api_key"] = "test"
+    service.configs[LLMBackend.QWEN]["api_key"] = None
+    service.configs[LLMBackend.OLLAMA]["base_url"] = ""
+    service._backends_checked = True
+
+    async def fake_call(*args, **kwargs):
+        for chunk in ["第一", "第二", "第三"]:
+            yield chunk
+            await asyncio.sleep(0.01)
+
+    monkeypatch.setattr(service, "_call_backend", fake_call)
+    yield service, service.health[LLMBackend.DEEPSEEK]
+    monkeypatch.setattr(UnifiedLLMService, "_instance", None)
+
+def test_stream_closed_mid_way_releases_half_open_trial(clock, llm_service):
+    service, health = llm_service
+    open_breaker(health)
+    clock.now += 31
+
+    async def consume_first_chunk_then_disconnect():
+        stream = service.generate([{"role": "user", "content": "你好"}], stream=True, hedge=False)
+        assert await stream.__anext__() == "第一"
+        assert not health.breaker.can_attempt()
+        await stream.aclose()
+
+    asyncio.run(consume_first_chunk_then_disconnect())
+
+    # 结果未知：既不关闭也不重新打开，归还试探名额后请求或探测可以再次试探
+    assert health.breaker.state == CircuitBreaker.HALF_OPEN
+    assert health.breaker.can_attempt()
+    assert health.breaker.try_trial()
+    assert health.requests == 3
+    assert health.request_samples(stream=True) == 1
+
+def test_stream_task_cancelled_mid_way_releases_half_open_trial(clock, llm_service):
+    service, health = llm_service
+    open_breaker(health)
+    clock.now += 31
+
+    async def cancel_while_streaming():
+        received = []
+
+        async def consume():
+            async for chunk in service.generate([{"role": "user", "content": "你好"}], stream=True, hedge=False):
+                received.append(chunk)
+
+        task = asyncio.create_task(consume())
+        while not received:
+            await asyncio.sleep(0.001)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_while_streaming())
+
+    assert health.breaker.state == CircuitBreaker.HALF_OPEN
+    assert health.breaker.try_trial()
+    assert service.limiters[service.current_backend].get_stats()["in_flight"] == 0
+
+@pytest.fixture
+def routing_service(monkeypatch):
+    from api.services.unified_llm_service import LLMBackend, UnifiedLLMService
+
+    monkeypatch.setattr(UnifiedLLMService, "_instance", None)
+    service = UnifiedLLMService()
+    service.current_backend = LLMBackend.DEEPSEEK
+    service.configs[LLMBackend.DEEPSEEK]["api_key"] = "test"
+    service.configs[LLMBackend.QWEN]["api_key"] = "test"
+    service.configs[LLMBackend.OLLAMA]["base_url"] = "http://ollama:11434"
+    # 本地 Ollama 的 /api/tags 探测远快于云端 /models
+    service.health[LLMBackend.OLLAMA].record_probe(True, 0.001)
+    service.health[LLMBackend.DEEPSEEK].record_probe(True, 0.3)
+    service.health[LLMBackend.QWEN].record_probe(True, 0.2)
+    yield service, LLMBackend
+    monkeypatch.setattr(UnifiedLLMService, "_instance", None)
+
+def test_fixed_routing_keeps_preference_order(routing_service):
+    service, LLMBackend = routing_service
+    service.routing = "fixed"
+    assert service.rank_backends() == [LLMBackend.DEEPSEEK, LLMBackend.QWEN, LLMBackend.OLLAMA]
+
+    service.current_backend = LLMBackend.OLLAMA
+    assert service.rank_backends() == [LLMBackend.OLLAMA, LLMBackend.DEEPSEEK, LLMBackend.QWEN]
+
+def test_fastest_routing_ranks_by_own_request_latency(routing_service, monkeypatch):
+    service, LLMBackend = routing_service
+    service.routing = "fastest"
+    monkeypatch.setattr(config, "LLM_ROUTING_MIN_SAMPLES", 5)
+
+    # 没有请求样本时按探测延迟
+    assert service.rank_backends()[0] == LLMBackend.OLLAMA
+
+    # 有样本的后端按自身请求延迟排在样本不足的后端之前，不必等所有后端都有样本
+    for _ in range(5):
+        service.health[LLMBackend.DEEPSEEK].record_request(True, 0.8)
+    assert service.rank_backends() == [LLMBackend.DEEPSEEK, LLMBackend.OLLAMA, LLMBackend.QWEN]
+
+    for _ in range(5):
+        service.health[LLMBackend.QWEN].record_request(True, 0.4)
+    assert service.rank_backends() == [LLMBackend.QWEN, LLMBackend.DEEPSEEK, LLMBackend.OLLAMA]
+
+    # 非流式请求的样本单独计算
+    assert service.rank_backends(stream=False)[0] == LLMBackend.OLLAMA
+
+def test_fastest_routing_explores_other_backends(routing_service, monkeypatch):
+    service, LLMBackend = routing_service
+    service.routing = "fastest"
+    monkeypatch.setattr(config, "LLM_ROUTING_EXPLORE_RATE", 1.0)
+
+    assert service.rank_backends()[0] == LLMBackend.OLLAMA
+    explored = {service.rank_backends(explore=True)[0] for _ in range(50)}
+    assert explored == {LLMBackend.DEEPSEEK, LLMBackend.QWEN}
+    assert service.explorations == 50
+
+    monkeypatch.setattr(config, "LLM_ROUTING_EXPLORE_RATE", 0.0)
+    assert service.rank_backends(explore=True)[0] == LLMBackend.OLLAMA
+
+def test_generate_reports_backend_that_served_after_failover(routing_service, monkeypatch):
+    service, LLMBackend = routing_service
+    service.routing = "fixed"
+    service._backends_checked = True
+
+    async def fake_call(backend, *args, **kwargs):
+        if backend == LLMBackend.DEEPSEEK:
+            raise RuntimeError("upstream 500")
+        yield backend.value
+
+    monkeypatch.setattr(service, "_call_backend", fake_call)
+
+    async def run():
+        served = []
+        chunks = [
+            chunk async for chunk in service.generate(
+                [{"role": "user", "content": "你好"}], stream=True, hedge=False, on_backend=served.append
+            )
+        ]
+        return chunks, served
+
+    chunks, served = asyncio.run(run())
+    # 首选后端失败后由备用后端回答，回调报告实际提供回答的后端
+    assert chunks == [LLMBackend.QWEN.value]
+    assert served == [LLMBackend.QWEN]
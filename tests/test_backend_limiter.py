@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+import pytest
+
+from api.services.backend_limiter import BackendBusyError, BackendLimiter
+
+def test_waiters_are_admitted_in_fifo_order():
+    async def run():
+        limiter = BackendLimiter("test", max_concurrency=1, max_queue=2)
+        first = await limiter.acquire()
+        order = []
+
+        async def wait(name):
+            permit = await limiter.acquire()
+            order.append(name)
+            return permit
+
+        tasks = [asyncio.create_task(wait("a")), asyncio.create_task(wait("b"))]
+        await asyncio.sleep(0)
+        assert limiter.get_stats()["queue_depth"] == 2
+        assert order == []
+
+        limiter.release(first)
+        second = await tasks[0]
+        assert order == ["a"]
+        limiter.release(second)
+        limiter.release(await tasks[1])
+
+        assert order == ["a", "b"]
+        stats = limiter.get_stats()
+        assert stats["in_flight"] == 0
+        assert stats["admitted"] == 3
+        assert stats["queued"] == 2
+
+    asyncio.run(run())
+
+def test_full_queue_rejects_with_retry_after():
+    async def run():
+        limiter = BackendLimiter("test", max_concurrency=1, max_queue=1)
+        permit = await limiter.acquire()
+        limiter.release(permit, duration=4.0)
+        permit = await limiter.acquire()
+
+        queued = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.saturated()
+
+        with pytest.raises(BackendBusyError) as excinfo:
+            await limiter.acquire()
+        # 平均占用4秒，1个排队 + 本次请求，共享1个并发名额
+        assert excinfo.value.retry_after == 8
+        assert limiter.get_stats()["rejected"] == 1
+
+        limiter.release(permit)
+        limiter.release(await queued)
+
+    asyncio.run(run())
+
+def test_queue_timeout_raises_busy_and_leaves_queue():
+    async def run():
+        limiter = BackendLimiter("test", max_concurrency=1, max_queue=1, queue_timeout=0.05)
+        permit = await limiter.acquire()
+
+        with pytest.raises(BackendBusyError) as excinfo:
+            await limiter.acquire()
+        assert excinfo.value.retry_after >= 1
+        stats = limiter.get_stats()
+        assert stats["timeouts"] == 1
+        assert stats["queue_depth"] == 0
+
+        limiter.release(permit)
+        assert limiter.try_acquire() is not None
+
+    asyncio.run(run())
+
+def test_token_rate_wait_dispatches_when_bucket_refills():
+    async def run():
+        # 每秒补充1000个token
+        limiter = BackendLimiter("test", tokens_per_minute=60000, max_queue=1)
+        limiter.release(limiter.try_acquire(60000))
+        assert limiter.try_acquire(50) is None
+
+        started = time.monotonic()
+        permit = await limiter.acquire(50)
+        waited = time.monotonic() - started
+
+        assert 0.03 <= waited < 1.0
+        assert permit.waited > 0
+        limiter.release(permit)
+
+    asyncio.run(run())
+
+def test_release_refunds_unused_tokens():
+    limiter = BackendLimiter("test", tokens_per_minute=60000)
+    permit = limiter.try_acquire(60000)
+    limiter.release(permit, used_tokens=10000)
+
+    assert limiter.try_acquire(40000) is not None
@@ -0,0 +1,24 @@
+import json
+
+from api.services.cache_service import encode_value, decode_value
+
+ANSWER = {
+    "answer": "知识库问答系统" * 100,
+    "sources": [{"id": "doc_1", "score": 0.5, "rank": 1}],
+    "question": "什么是知识库？"
+}
+
+def test_small_value_round_trip_uncompressed():
+    data = encode_value({"answer": "短回答"}, compress_min_bytes=512)
+    assert data[:1] == b"\x01"
+    assert "短回答".encode("utf-8") in data
+    assert decode_value(data) == {"answer": "短回答"}
+
+def test_large_value_round_trip_compressed():
+    data = encode_value(ANSWER, compress_min_bytes=512)
+    assert data[:1] == b"\x02"
+    assert len(data) < len(json.dumps(ANSWER, ensure_ascii=False).encode("utf-8"))
+    assert decode_value(data) == ANSWER
+
+def test_decode_legacy_plain_json():
+    assert decode_value(json.dumps(ANSWER).encode("utf-8")) == ANSWER
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from api.services import cache_service
+from api.services.cache_service import CacheService
+
+def make_service(namespace="new"):
+    service = CacheService()
+    service.client = fakeredis.aioredis.FakeRedis()
+    service.available = True
+    service.namespace = namespace
+    return service
+
+async def seed(client):
+    for key in ("kb:old:answer:1", "kb:old:answer:1:lock", "kb:lagging:answer:2", "kb:new:answer:3", "answer:legacy", "other:app:key"):
+        await client.set(key, b"1")
+
+async def keys(client):
+    return sorted(key.decode() for key in await client.keys("*") if not key.startswith(b"cache:"))
+
+def test_sweep_deletes_only_retired_inactive_namespaces():
+    async def run():
+        service = make_service()
+        await seed(service.client)
+        await service.client.sadd(CacheService.RETIRED_NAMESPACES_KEY, "old", "lagging")
+        # 仍有工作进程在使用 lagging（如滚动发布中尚未切换的进程）
+        await service.client.set(CacheService.ACTIVE_NAMESPACE_PREFIX + "lagging", "other")
+
+        deleted = await service.sweep_stale_namespaces()
+
+        assert deleted == 3
+        assert await keys(service.client) == ["kb:lagging:answer:2", "kb:new:answer:3", "other:app:key"]
+        assert await service.client.smembers(CacheService.RETIRED_NAMESPACES_KEY) == {b"lagging"}
+        assert not await service.client.exists(CacheService.SWEEP_LOCK_KEY)
+
+        # 活跃标记过期后再清理
+        await service.client.delete(CacheService.ACTIVE_NAMESPACE_PREFIX + "lagging")
+        assert await service.sweep_stale_namespaces() == 1
+        assert await keys(service.client) == ["kb:new:answer:3", "other:app:key"]
+        await service.pool.aclose()
+
+    asyncio.run(run())
+
+def test_sweep_skips_when_another_worker_holds_lock():
+    async def run():
+        service = make_service()
+        await seed(service.client)
+        await service.client.sadd(CacheService.RETIRED_NAMESPACES_KEY, "old")
+        await service.client.set(CacheService.SWEEP_LOCK_KEY, "other-worker")
+
+        assert await service.sweep_stale_namespaces() == 0
+        assert await service.client.get(CacheService.SWEEP_LOCK_KEY) == b"other-worker"
+        assert "kb:old:answer:1" in await keys(service.client)
+        await service.pool.aclose()
+
+    asyncio.run(run())
+
+def test_sweep_releases_lock_when_cancelled(monkeypatch):
+    async def run():
+        service = make_service()
+        await seed(service.client)
+        await service.client.sadd(CacheService.RETIRED_NAMESPACES_KEY, "old")
+        started = asyncio.Event()
+
+        async def slow_unlink(pattern):
+            started.set()
+            await asyncio.sleep(10)
+
+        monkeypatch.setattr(service, "_unlink_matching", slow_unlink)
+        task = asyncio.create_task(service.sweep_stale_namespaces())
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert not await service.client.exists(CacheService.SWEEP_LOCK_KEY)
+        await service.pool.aclose()
+
+    asyncio.run(run())
+
+def test_namespace_switch_retires_previous_namespace(monkeypatch):
+    async def run():
+        fingerprints = iter(["first", "second"])
+        mtimes = iter([1.0, 2.0])
+        monkeypatch.setattr(cache_service, "read_fingerprint", lambda path: next(fingerprints))
+        monkeypatch.setattr(cache_service.os.path, "getmtime", lambda path: next(mtimes))
+
+        service = CacheService()
+        service.client = fakeredis.aioredis.FakeRedis()
+        assert service.namespace == "first"
+        await service._sync_namespaces()
+        assert await service.client.smembers(CacheService.RETIRED_NAMESPACES_KEY) == set()
+        assert await service.client.exists(CacheService.ACTIVE_NAMESPACE_PREFIX + "first")
+
+        assert service._refresh_namespace()
+        await service._sync_namespaces()
+        assert service.namespace == "second"
+        assert await service.client.smembers(CacheService.RETIRED_NAMESPACES_KEY) == {b"first"}
+        assert await service.client.exists(CacheService.ACTIVE_NAMESPACE_PREFIX + "second")
+        await service.pool.aclose()
+
+    asyncio.run(run())
+
+def test_clear_cache_only_touches_cache_keys():
+    async def run():
+        service = make_service()
+        await seed(service.client)
+        await service.client.set("kb:new:search:4", b"1")
+
+        assert await service.clear_cache("answer:*") == 5
+        assert await keys(service.client) == ["kb:new:search:4", "other:app:key"]
+
+        assert await service.clear_cache() == 1
+        assert await keys(service.client) == ["other:app:key"]
+        await service.pool.aclose()
+
+    asyncio.run(run())
@@ -0,0 +1,30 @@
+from api.services.context_packer import pack_context
+
+def chunk(chunk_id, text, chunk_index, source="a.md"):
+    return {"id": chunk_id, "text": text, "metadata": {"source": source, "chunk_index": chunk_index}}
+
+def test_adjacent_chunks_merge_into_one_passage():
+    results = [chunk("c1", "第二段内容", 1), chunk("c0", "第一段内容", 0)]
+    packed = pack_context(results, token_budget=0, count_tokens=len)
+
+    assert packed.passages == 1
+    assert packed.context == "[来源1] 第一段内容第二段内容"
+    assert [source["id"] for source in packed.sources] == ["c0", "c1"]
+
+def test_truncated_passage_drops_sources_cut_out():
+    results = [chunk("c0", "a" * 20, 0), chunk("c1", "b" * 20, 1), chunk("c2", "c" * 20, 2)]
+    label = len("[来源1] ")
+    # 预算只够第一块加上第二块的一部分，第三块完全被截掉
+    packed = pack_context(results, token_budget=label + 30, count_tokens=len, min_truncated_tokens=1)
+
+    assert packed.truncated
+    assert packed.context == "[来源1] " + "a" * 20 + "b" * 10
+    assert [source["id"] for source in packed.sources] == ["c0", "c1"]
+
+def test_passage_below_min_truncated_tokens_is_skipped():
+    results = [chunk("c0", "a" * 20, 0), chunk("d0", "b" * 20, 0, source="b.md")]
+    label = len("[来源1] ")
+    packed = pack_context(results, token_budget=label + 25, count_tokens=len, min_truncated_tokens=10)
+
+    assert packed.truncated
+    assert [source["id"] for source in packed.sources] == ["c0"]
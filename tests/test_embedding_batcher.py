@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+from api.services.embedding_batcher import EmbeddingBatcher
+from api.utils.executor import ExecutorQueueFullError
+
+def test_batcher_merges_concurrent_queries():
+    batches = []
+
+    def encode(texts):
+        batches.append(list(texts))
+        return [text.upper() for text in texts]
+
+    batcher = EmbeddingBatcher(encode, max_batch_size=8, max_wait_ms=50)
+    try:
+        futures = [batcher.submit(text) for text in ["a", "b", "a"]]
+        assert [future.result(timeout=5) for future in futures] == ["A", "B", "A"]
+        assert batches == [["a", "b"]]
+    finally:
+        batcher.close()
+
+def test_batcher_rejects_when_queue_full():
+    started = threading.Event()
+    release = threading.Event()
+
+    def encode(texts):
+        started.set()
+        release.wait(5)
+        return list(texts)
+
+    batcher = EmbeddingBatcher(encode, max_batch_size=1, max_wait_ms=0, max_queue_size=2)
+    try:
+        first = batcher.submit("running")
+        assert started.wait(5)
+        queued = [batcher.submit("q1"), batcher.submit("q2")]
+
+        with pytest.raises(ExecutorQueueFullError):
+            batcher.submit("q3")
+        assert batcher.get_stats()["rejected"] == 1
+
+        release.set()
+        assert first.result(timeout=5) == "running"
+        assert [future.result(timeout=5) for future in queued] == ["q1", "q2"]
+    finally:
+        release.set()
+        batcher.close()
+
+def test_batcher_close_drains_queue():
+    batcher = EmbeddingBatcher(lambda texts: list(texts), max_batch_size=4, max_wait_ms=20, max_queue_size=4)
+    futures = [batcher.submit(str(i)) for i in range(4)]
+    batcher.close()
+
+    assert [future.result(timeout=1) for future in futures] == ["0", "1", "2", "3"]
+
+def test_batcher_rejects_submit_after_close():
+    batcher = EmbeddingBatcher(lambda texts: list(texts))
+    batcher.close()
+
+    with pytest.raises(RuntimeError):
+        batcher.submit("late")
+
+def test_batcher_close_fails_requests_left_in_queue():
+    started = threading.Event()
+    release = threading.Event()
+
+    def encode(texts):
+        started.set()
+        release.wait(5)
+        return list(texts)
+
+    batcher = EmbeddingBatcher(encode, max_batch_size=1, max_wait_ms=0)
+    try:
+        running = batcher.submit("running")
+        assert started.wait(5)
+        pending = batcher.submit("pending")
+
+        # 后台线程仍卡在编码中，关闭超时后排队的请求立即失败而不是永久等待
+        batcher.close(timeout=0.05)
+        with pytest.raises(RuntimeError):
+            pending.result(timeout=1)
+    finally:
+        release.set()
+    assert running.result(timeout=5) == "running"
@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+from api.services.request_coalescer import FlightCancelledError, RequestCoalescer
+
+class FakeCache:
+    available = False
+
+    def answer_key(self, question):
+        return f"answer:{question}"
+
+async def collect(flight):
+    return [event async for event in flight.subscribe()]
+
+async def no_replay(flight, cached):
+    raise AssertionError("Redis不可用时不应回放缓存")
+
+def test_concurrent_requests_share_one_flight():
+    async def run():
+        coalescer = RequestCoalescer(FakeCache())
+        release = asyncio.Event()
+        calls = []
+
+        async def produce(flight):
+            calls.append(1)
+            await flight.publish("a")
+            await release.wait()
+            await flight.publish("b")
+
+        leader, is_leader = coalescer.join("问题", "stream", produce, no_replay)
+        follower, is_follower_leader = coalescer.join("问题", "stream", produce, no_replay)
+        other, _ = coalescer.join("问题", "chat", produce, no_replay)
+        assert is_leader and not is_follower_leader
+        assert follower is leader and other is not leader
+
+        first = asyncio.create_task(collect(leader))
+        await asyncio.sleep(0)
+        # 中途加入的订阅者也能拿到完整输出
+        second = asyncio.create_task(collect(follower))
+        await asyncio.sleep(0)
+        assert leader.subscribers == 2
+        release.set()
+
+        assert await first == ["a", "b"]
+        assert await second == ["a", "b"]
+        await asyncio.gather(leader.task, other.task)
+        assert len(calls) == 2
+        assert leader.subscribers == 0
+        stats = coalescer.get_stats()
+        assert stats["leaders"] == 2 and stats["followers"] == 1 and stats["in_flight"] == 0
+
+    asyncio.run(run())
+
+def test_leader_failure_reaches_all_subscribers():
+    async def run():
+        coalescer = RequestCoalescer(FakeCache())
+
+        async def produce(flight):
+            await flight.publish("partial")
+            raise ValueError("LLM调用失败")
+
+        flight, _ = coalescer.join("问题", "stream", produce, no_replay)
+        follower, _ = coalescer.join("问题", "stream", produce, no_replay)
+        for subscriber in (flight, follower):
+            events = []
+            with pytest.raises(ValueError):
+                async for event in subscriber.subscribe():
+                    events.append(event)
+            assert events == ["partial"]
+        assert coalescer.get_stats()["errors"] == 1
+
+    asyncio.run(run())
+
+def test_cancelled_leader_finishes_flight():
+    async def run():
+        coalescer = RequestCoalescer(FakeCache())
+        started = asyncio.Event()
+
+        async def produce(flight):
+            await flight.publish("partial")
+            started.set()
+            await asyncio.sleep(60)
+
+        flight, _ = coalescer.join("问题", "stream", produce, no_replay)
+        subscriber = asyncio.create_task(collect(flight))
+        await started.wait()
+        flight.task.cancel()
+
+        with pytest.raises(FlightCancelledError):
+            await asyncio.wait_for(subscriber, timeout=1)
+        assert flight.done
+        assert flight.subscribers == 0
+        assert coalescer.get_stats()["in_flight"] == 0
+
+        # 取消后的新请求发起新的生成
+        async def produce_again(new_flight):
+            await new_flight.publish("fresh")
+
+        retry, is_leader = coalescer.join("问题", "stream", produce_again, no_replay)
+        assert is_leader and retry is not flight
+        assert await collect(retry) == ["fresh"]
+
+    asyncio.run(run())
+
+def test_cancelled_private_flight_finishes():
+    async def run():
+        coalescer = RequestCoalescer(FakeCache())
+
+        async def produce(flight):
+            await asyncio.sleep(60)
+
+        flight = coalescer.run_alone(produce)
+        subscriber = asyncio.create_task(collect(flight))
+        await asyncio.sleep(0)
+        flight.task.cancel()
+        with pytest.raises(FlightCancelledError):
+            await asyncio.wait_for(subscriber, timeout=1)
+
+    asyncio.run(run())
+
+def test_requests_with_different_options_do_not_share():
+    async def run():
+        coalescer = RequestCoalescer(FakeCache())
+
+        async def produce(flight):
+            await flight.publish("answer")
+
+        base, _ = coalescer.join("问题", "chat", produce, no_replay, {"top_k": 5, "temperature": 0.1})
+        same, is_leader = coalescer.join("问题", "chat", produce, no_replay, {"temperature": 0.1, "top_k": 5})
+        other, other_leader = coalescer.join("问题", "chat", produce, no_replay, {"top_k": 10, "temperature": 0.1})
+        assert same is base and not is_leader
+        assert other is not base and other_leader
+        await asyncio.gather(base.task, other.task)
+
+    asyncio.run(run())
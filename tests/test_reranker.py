@@ -0,0 +1,89 @@
+import threading
+
+from api.services.reranker import CrossEncoderReranker
+from api.utils.lru_cache import LRUCache
+
+class FakeTokenizer:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, queries, texts, **kwargs):
+        self.queries.extend(queries)
+        return {"input_ids": [[0] * len(text) for text in texts]}
+
+def make_reranker(batch_size=1):
+    reranker = CrossEncoderReranker.__new__(CrossEncoderReranker)
+    reranker.model_source = "fake"
+    reranker.batch_size = batch_size
+    reranker.max_length = 512
+    reranker.token_budget = 8192
+    reranker.tokenizer = FakeTokenizer()
+    reranker._cache = LRUCache(max_size=100)
+    reranker._stats_lock = threading.Lock()
+    reranker._requests = 0
+    reranker._scored = 0
+    reranker._budget_exhausted = 0
+    reranker._total_time = 0.0
+    reranker.batches = []
+
+    def score_batch(features):
+        reranker.batches.append(len(features["input_ids"]))
+        return [float(len(ids)) for ids in features["input_ids"]]
+
+    reranker._score_batch = score_batch
+    return reranker
+
+def make_results(*texts):
+    return [{"id": f"doc{i}", "text": text} for i, text in enumerate(texts)]
+
+def test_rerank_without_budget_scores_everything():
+    reranker = make_reranker()
+    reranked = reranker.rerank("q", make_results("a", "ccc", "bb"), top_k=3)
+
+    assert [result["text"] for result in reranked] == ["ccc", "bb", "a"]
+    assert reranker.batches == [1, 1, 1]
+    assert reranker.get_stats()["budget_exhausted"] == 0
+
+def test_rerank_with_exhausted_budget_scores_one_batch():
+    reranker = make_reranker()
+    reranked = reranker.rerank("q", make_results("a", "ccc", "bb"), top_k=3, budget_ms=0)
+
+    # 预算为0时只计算第一批（最长的文本块），其余保持原有顺序排在后面
+    assert reranker.batches == [1]
+    assert [result["text"] for result in reranked] == ["ccc", "a", "bb"]
+    assert [result["rerank_score"] for result in reranked] == [3.0, None, None]
+    assert reranker.get_stats()["budget_exhausted"] == 1
+
+def test_rerank_scores_only_uncached_pairs():
+    reranker = make_reranker(batch_size=16)
+    reranker.rerank("q", make_results("a", "bb"), top_k=2)
+    reranker.batches.clear()
+
+    reranked = reranker.rerank("q", make_results("a", "bb", "dddd"), top_k=3)
+
+    assert reranker.batches == [1]
+    assert [result["text"] for result in reranked] == ["dddd", "bb", "a"]
+
+def test_rerank_scores_normalized_query_matching_cache_key():
+    reranker = make_reranker()
+    reranker.rerank("  Ｈｅｌｌｏ   World ", make_results("a"), top_k=1)
+    reranker.batches.clear()
+
+    # 全角与空白规范化后相同的查询命中缓存，打分输入与缓存键一致
+    reranker.rerank("Hello World", make_results("a"), top_k=1)
+    assert reranker.tokenizer.queries == ["Hello World"]
+    assert reranker.batches == []
+
+    # 大小写不同的查询是不同的模型输入，不共用得分
+    reranker.rerank("hello world", make_results("a"), top_k=1)
+    assert reranker.tokenizer.queries == ["Hello World", "hello world"]
+
+def test_rerank_rescores_chunk_whose_text_changed():
+    reranker = make_reranker()
+    reranker.rerank("q", make_results("a"), top_k=1)
+    reranker.batches.clear()
+
+    # 知识库重建后同一ID的文本变化，不应沿用旧得分
+    reranked = reranker.rerank("q", make_results("abcd"), top_k=1)
+    assert reranker.batches == [1]
+    assert reranked[0]["rerank_score"] == 4.0
@@ -0,0 +1,76 @@
+import types
+
+import numpy as np
+import pytest
+
+from api.services import semantic_cache
+from api.services.semantic_cache import SemanticCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(semantic_cache, "time", types.SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+def unit(*values):
+    return np.array(values, dtype=np.float32)
+
+def test_lookup_respects_threshold(clock):
+    cache = SemanticCache(max_size=4, threshold=0.9)
+    cache.add("问题A", unit(1, 0), {"answer": "A"})
+
+    # cos = 0.95，高于阈值命中
+    answer, similarity = cache.lookup(unit(0.95, np.sqrt(1 - 0.95 ** 2)))
+    assert answer == {"answer": "A"}
+    assert similarity == pytest.approx(0.95, abs=1e-4)
+
+    # cos = 0.8，低于阈值不命中
+    assert cache.lookup(unit(0.8, 0.6)) is None
+    assert cache.get_stats()["hits"] == 1
+    assert cache.get_stats()["misses"] == 1
+
+def test_same_question_overwrites_entry(clock):
+    cache = SemanticCache(max_size=4, threshold=0.9)
+    cache.add("问题A", unit(1, 0), {"answer": "old"})
+    cache.add(" 问题a ", unit(1, 0), {"answer": "new"})
+
+    assert len(cache) == 1
+    assert cache.lookup(unit(1, 0))[0] == {"answer": "new"}
+
+def test_evicts_least_recently_used(clock):
+    cache = SemanticCache(max_size=2, threshold=0.99)
+    cache.add("A", unit(1, 0, 0), {"answer": "A"})
+    clock.now += 1
+    cache.add("B", unit(0, 1, 0), {"answer": "B"})
+    clock.now += 1
+    # 命中A后，B成为最久未使用的条目
+    assert cache.lookup(unit(1, 0, 0)) is not None
+    clock.now += 1
+    cache.add("C", unit(0, 0, 1), {"answer": "C"})
+
+    assert len(cache) == 2
+    assert cache.get_stats()["evictions"] == 1
+    assert cache.lookup(unit(0, 1, 0)) is None
+    assert cache.lookup(unit(1, 0, 0))[0] == {"answer": "A"}
+    assert cache.lookup(unit(0, 0, 1))[0] == {"answer": "C"}
+
+def test_entries_expire_after_ttl(clock):
+    cache = SemanticCache(max_size=4, threshold=0.9, ttl=60)
+    cache.add("A", unit(1, 0), {"answer": "A"})
+    cache.add("B", unit(0, 1), {"answer": "B"}, ttl=300)
+
+    clock.now += 59
+    assert cache.lookup(unit(1, 0)) is not None
+
+    clock.now += 2
+    assert cache.lookup(unit(1, 0)) is None
+    assert cache.lookup(unit(0, 1))[0] == {"answer": "B"}
+    assert len(cache) == 1
+    assert cache.get_stats()["expirations"] == 1
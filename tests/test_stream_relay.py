@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+import pytest
+
+from api.services.stream_relay import (
+    LineDecoder,
+    NDJSONDecoder,
+    SSEDataDecoder,
+    coalesce_chunks,
+    iter_stream_content
+)
+from api.services.unified_llm_service import _ollama_delta, _openai_delta
+
+def split_every(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+async def aiter(items):
+    for item in items:
+        yield item
+
+async def collect(source):
+    return [item async for item in source]
+
+def test_line_split_across_chunks():
+    decoder = LineDecoder()
+    assert decoder.feed(b"data: {\"a\"") == []
+    assert decoder.feed(b": 1}\ndata: 2") == [b"data: {\"a\": 1}"]
+    assert decoder.feed(b"\n") == [b"data: 2"]
+    assert decoder.flush() == []
+
+def test_crlf_line_endings():
+    decoder = SSEDataDecoder()
+    payloads = []
+    for chunk in split_every(b"data: {\"x\": 1}\r\n\r\ndata: {\"x\": 2}\r\n\r\ndata: [DONE]\r\n\r\n", 5):
+        payloads.extend(decoder.feed(chunk))
+    assert [json.loads(payload) for payload in payloads] == [{"x": 1}, {"x": 2}]
+    assert decoder.done
+
+def test_multibyte_utf8_split_mid_character():
+    body = "data: {\"content\": \"知识库\"}\n\n".encode("utf-8")
+    # 每次读取1字节，每个中文字符（3字节）都被截断在多次读取之间
+    decoder = SSEDataDecoder()
+    payloads = []
+    for chunk in split_every(body, 1):
+        payloads.extend(decoder.feed(chunk))
+    assert [json.loads(payload) for payload in payloads] == [{"content": "知识库"}]
+
+def test_ndjson_flushes_last_line_without_newline():
+    decoder = NDJSONDecoder()
+    assert decoder.feed(b"{\"a\": 1}\n\n{\"a\"") == [b"{\"a\": 1}"]
+    assert decoder.feed(b": 2}") == []
+    assert decoder.flush() == [b"{\"a\": 2}"]
+
+def test_iter_stream_content_merges_chunk_and_skips_bad_payloads():
+    events = [
+        {"choices": [{"delta": {"role": "assistant"}}]},
+        {"choices": [{"delta": {"content": "知"}}]},
+        {"choices": [{"delta": None}]},
+        {"choices": [{"delta": {"content": "识"}}]},
+    ]
+    body = "".join(f"data: {json.dumps(event, ensure_ascii=False)}\n\n" for event in events)
+    body += "data: {broken\n\ndata: [DONE]\n\ndata: {\"choices\": [{\"delta\": {\"content\": \"x\"}}]}\n\n"
+
+    chunks = asyncio.run(collect(iter_stream_content(
+        aiter([body.encode("utf-8")]), SSEDataDecoder(), json.loads, _openai_delta
+    )))
+    assert chunks == ["知识"]
+
+def test_ollama_done_ends_stream():
+    body = (
+        b"{\"message\": {\"content\": \"a\"}}\n"
+        b"{\"message\": null}\n"
+        b"{\"message\": {\"content\": \"b\"}, \"done\": true}\n"
+        b"{\"message\": {\"content\": \"c\"}}\n"
+    )
+    chunks = asyncio.run(collect(iter_stream_content(
+        aiter(split_every(body, 7)), NDJSONDecoder(), json.loads, _ollama_delta
+    )))
+    assert "".join(chunks) == "a"
+
+def test_openai_delta_tolerates_null_fields():
+    assert _openai_delta({"choices": [{"delta": None}]}) is None
+    assert _openai_delta({"choices": []}) is None
+    assert _openai_delta({"choices": [{"delta": {"content": "x"}}]}) == "x"
+
+def test_coalesce_emits_first_chunk_immediately_and_merges_rest():
+    async def run():
+        async def source():
+            yield "a"
+            for part in "bcd":
+                await asyncio.sleep(0)
+                yield part
+
+        return await collect(coalesce_chunks(source(), window=0.05))
+
+    assert asyncio.run(run()) == ["a", "bcd"]
+
+def test_coalesce_propagates_upstream_error():
+    async def run():
+        async def source():
+            yield "a"
+            raise ValueError("upstream")
+
+        with pytest.raises(ValueError):
+            await collect(coalesce_chunks(source(), window=0.01))
+
+    asyncio.run(run())
@@ -0,0 +1,38 @@
+import os
+
+import numpy as np
+
+from api.services.vector_store import NumpyVectorStore
+
+def build_store(directory, texts):
+    store = NumpyVectorStore(directory, create=True)
+    store.reset()
+    store.add(
+        [f"id{i}" for i in range(len(texts))],
+        np.eye(len(texts), 4, dtype=np.float32),
+        texts,
+        [{"source": "a.md"} for _ in texts]
+    )
+    store.persist()
+    return store
+
+def test_persist_replaces_store_and_removes_old_copy(tmp_path):
+    directory = str(tmp_path / "store")
+    build_store(directory, ["旧文本"])
+    store = build_store(directory, ["新文本", "第二条"])
+
+    assert store.count() == 2
+    assert NumpyVectorStore(directory).count() == 2
+    assert not os.path.exists(directory + ".old")
+    assert not os.path.exists(directory + ".tmp")
+
+def test_open_recovers_store_moved_aside_by_interrupted_swap(tmp_path):
+    directory = str(tmp_path / "store")
+    build_store(directory, ["旧文本"])
+
+    # 模拟旧存储已移到一旁、新存储尚未换入时进程退出
+    os.replace(directory, directory + ".old")
+
+    store = NumpyVectorStore(directory)
+    assert store.count() == 1
+    assert not os.path.exists(directory + ".old")